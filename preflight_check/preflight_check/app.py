@@ -1,10 +1,30 @@
-from typing import Annotated
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import AsyncExitStack, asynccontextmanager, closing, nullcontext
+from dataclasses import dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Annotated, TypeVar
 
 import typer
-from azure.identity import DefaultAzureCredential
 
-from preflight_check import cli, log
+from preflight_check import cli, log, profiling
 from preflight_check.core import PreflightCheck, models, services
+from preflight_check.core.services import aio
+
+if TYPE_CHECKING:
+    from azure.core.credentials import TokenCredential
+
+T = TypeVar("T")
+
+
+@dataclass
+class _AsyncServices:
+    """Async services sharing one event loop, async credential and client factory"""
+
+    subscriptions: aio.AsyncSubscriptionService
+    quotas: aio.AsyncQuotaService
+    auth: aio.AsyncAuthService
 
 
 class App:
@@ -13,18 +33,91 @@ class App:
     _azure_client_factory: services.AzureClientFactory
     _subscriptions: services.SubscriptionService
     _quotas: services.QuotaService
+    # Quotas collected by either engine, shared by the blocking and async quota services
+    _quota_cache: services.QuotaCache
     _auth: services.AuthService
-    available_subscriptions: list[models.Subscription]
+    _engine: services.ExecutionEngine
+    _concurrency: int
+    _vmss_count_strategy: services.VmssCountStrategy
+    _inventory_backend: services.InventoryBackend | None
+    _inventory_store: services.InventoryStore | None
+    _connection_pool_size: int
+    _throttling: services.ThrottlingScheduler
+    _telemetry: services.Telemetry
+    # Fetches data that run() will need while the user answers the interactive prompts
+    _prefetcher: services.Prefetcher
+    # Permissions collected by the asyncio engine while VMs were enumerated
+    _permissions: dict[str, list[models.AssignedRole]] | None = None
+    # Event loop of the asyncio engine, and the async services bound to it; both are created on
+    # first use and kept until run() ends
+    _async_runner: asyncio.Runner | None = None
+    _async_services: _AsyncServices | None = None
+    _async_exit_stack: AsyncExitStack | None = None
     deployment_config: models.DeploymentConfig | None = None
 
-    def __init__(self, credential: DefaultAzureCredential, output_path: str) -> None:
+    def __init__(
+        self,
+        credential: "TokenCredential",
+        output_path: str,
+        concurrency: int = services.DEFAULT_CONCURRENCY,
+        vmss_count_strategy: services.VmssCountStrategy = services.VmssCountStrategy.CAPACITY,
+        inventory_engine: services.InventoryEngine = services.InventoryEngine.COMPUTE,
+        role_definition_cache: services.RoleDefinitionCache | None = None,
+        inventory_store: services.InventoryStore | None = None,
+        connection_pool_size: int = services.DEFAULT_CONNECTION_POOL_SIZE,
+        engine: services.ExecutionEngine = services.ExecutionEngine.THREADS,
+        azure_client_factory: services.AzureClientFactory | None = None,
+        traffic: services.TrafficRecorder | services.TrafficReplay | None = None,
+    ) -> None:
         self.output_path = output_path
-        azure_client_factory = services.AzureClientFactory(credential)
-        self._subscriptions = services.SubscriptionService(azure_client_factory)
-        self._quotas = services.QuotaService(azure_client_factory)
-        self._auth = services.AuthService(azure_client_factory)
-        # enumerate all subscriptions available to the authenticated Azure principal
-        self.available_subscriptions = self._subscriptions.get_subscriptions()
+        self._engine = engine
+        self._concurrency = concurrency
+        self._vmss_count_strategy = vmss_count_strategy
+        self._inventory_store = inventory_store
+        self._connection_pool_size = connection_pool_size
+        self._telemetry = services.Telemetry()
+        # A factory can be given to serve the blocking services from elsewhere, as the
+        # benchmarks do with fake clients
+        azure_client_factory = azure_client_factory or services.AzureClientFactory(
+            services.InstrumentedCredential(credential, self._telemetry),  # type: ignore[arg-type]
+            connection_pool_size,
+            telemetry=self._telemetry,
+            traffic=traffic,
+        )
+        self._azure_client_factory = azure_client_factory
+        # Blocking and async clients count against the same Azure Resource Manager limits
+        self._throttling = azure_client_factory.throttling
+        inventory_backend: services.InventoryBackend | None = None
+        if inventory_engine == services.InventoryEngine.RESOURCE_GRAPH:
+            inventory_backend = services.ResourceGraphInventoryBackend(
+                azure_client_factory, vmss_count_strategy
+            )
+        self._inventory_backend = inventory_backend
+        # Resolve the principal first; stored subscriptions are kept per principal
+        with self._telemetry.phase("identity"):
+            self._auth = services.AuthService(
+                azure_client_factory, concurrency, role_definition_cache
+            )
+        # Subscriptions are only listed when every subscription is needed; explicitly named
+        # ones are fetched by ID
+        self._subscriptions = services.SubscriptionService(
+            azure_client_factory,
+            concurrency,
+            vmss_count_strategy,
+            inventory_backend,
+            inventory_store,
+            self._auth.principal_id,
+        )
+        self._quota_cache = services.QuotaCache()
+        self._quotas = services.QuotaService(
+            azure_client_factory, concurrency, inventory_store, self._quota_cache
+        )
+        self._prefetcher = services.Prefetcher()
+
+    @property
+    def available_subscriptions(self) -> list[models.Subscription]:
+        """All subscriptions available to the authenticated Azure principal, listed on first use"""
+        return self._subscriptions.get_subscriptions()
 
     def configure(
         self,
@@ -46,14 +139,49 @@ class App:
             self._prompt_deployment_config()
         # Otherwise, create the deployment config using provided args
         else:
-            scanning_subscription = self._get_scanning_subscription(scanning_subscription_input)
-            monitored_subscriptions, integration_type = self._get_monitored_subscriptions(
-                monitored_subscriptions_input, excluded_subscriptions_input
+            with self._telemetry.phase("subscriptions"):
+                # Fetch the named subscriptions together; missing ones are reported below,
+                # for the option that named them
+                self._subscriptions.get_subscriptions_by_id(
+                    [
+                        sub_id.strip()
+                        for sub_id in [
+                            scanning_subscription_input or "",
+                            *(monitored_subscriptions_input or "").split(","),
+                        ]
+                        if sub_id.strip()
+                    ]
+                )
+                scanning_subscription = self._get_scanning_subscription(scanning_subscription_input)
+                monitored_subscriptions, integration_type = self._get_monitored_subscriptions(
+                    monitored_subscriptions_input, excluded_subscriptions_input
+                )
+            # Only count VMs in the requested regions, instead of filtering them afterwards
+            requested_regions = self._get_available_regions(
+                _parse_regions(regions_input), scanning_subscription
             )
-            for sub in monitored_subscriptions:
-                cli.console.print(f"[dim]Enumerating VMs in {sub.name}...[/dim]")
-                self._subscriptions.get_subscription_vms(sub)
-            selected_regions = self._get_regions(monitored_subscriptions, regions_input)
+            subscription_regions = (
+                self._subscriptions.get_available_regions(
+                    [sub.id for sub in monitored_subscriptions], requested_regions
+                )
+                if requested_regions is not None
+                else None
+            )
+            if self._engine == services.ExecutionEngine.ASYNCIO:
+                with self._telemetry.phase("vm_enumeration_quotas_and_permissions"):
+                    self._run_async(
+                        lambda async_services: self._collect_async(
+                            async_services,
+                            scanning_subscription,
+                            monitored_subscriptions,
+                            integration_type,
+                            requested_regions,
+                            subscription_regions,
+                        )
+                    )
+            else:
+                self._enumerate_vms(monitored_subscriptions, subscription_regions)
+            selected_regions = self._get_regions(monitored_subscriptions, requested_regions)
             self.deployment_config = models.DeploymentConfig(
                 integration_type=integration_type,
                 scanning_subscription=scanning_subscription,
@@ -66,23 +194,84 @@ class App:
         """Run the preflight check"""
         if not self.deployment_config:
             raise RuntimeError("Deployment config not set")
-        usage_quota_limits = self._get_usage_quota_limits()
-        permissions = self._get_permissions()
-        preflight_check = PreflightCheck(self.deployment_config, usage_quota_limits, permissions)
+        self._run(self.deployment_config)
+
+    def close(self) -> None:
+        """
+        Stop any prefetch left running, and close the async services, their event loop and the
+        connections of the shared sessions. Called once the app is done with, whether or not
+        configure() and run() succeeded.
+        """
+        try:
+            self._prefetcher.shutdown()
+            self._close_async_services()
+        finally:
+            self._azure_client_factory.close()
+
+    def _run(self, deployment_config: models.DeploymentConfig) -> None:
+        # Let prefetches started during the prompts finish, so that their results are served
+        # from the service caches instead of being fetched twice
+        with self._telemetry.phase("prefetch"):
+            self._prefetcher.wait()
+        if self._engine == services.ExecutionEngine.ASYNCIO:
+            with self._telemetry.phase("quotas_and_permissions"):
+                usage_quota_limits, permissions = self._run_async(
+                    self._get_quotas_and_permissions_async
+                )
+        else:
+            with self._telemetry.phase("quotas"):
+                usage_quota_limits = self._get_usage_quota_limits()
+            with self._telemetry.phase("permissions"):
+                permissions = self._get_permissions()
+        with self._telemetry.phase("checks"):
+            preflight_check = PreflightCheck(deployment_config, usage_quota_limits, permissions)
+        log.debug(f"Throttling: {self._throttling.stats}")
+        telemetry = self._telemetry.summary()
+        if log.is_debug_enabled():
+            cli.print_telemetry(telemetry)
         cli.print_preflight_check(preflight_check)
-        cli.output_preflight_check_results_file(preflight_check, self.output_path)
+        cli.output_preflight_check_results_file(preflight_check, self.output_path, telemetry)
 
     def _prompt_deployment_config(self) -> None:
-        available_subscriptions = self._subscriptions.get_subscriptions()
+        with self._telemetry.phase("subscriptions"):
+            available_subscriptions = self.available_subscriptions
         scanning_subscription = cli.prompt_scanning_subscription(available_subscriptions)
+        # Permissions are served from the caches of the blocking auth service; the asyncio
+        # engine collects them on its own event loop, so prefetching them would list every
+        # scope twice
+        prefetch_permissions = self._engine == services.ExecutionEngine.THREADS
+        # Fetch the role definitions assigned on the scanning subscription while the user
+        # chooses the monitored subscriptions
+        if prefetch_permissions:
+            self._prefetcher.submit(
+                "permissions of the scanning subscription",
+                lambda: self._auth.get_all_assigned_roles([scanning_subscription], False),
+            )
         (monitored_subscriptions, integration_type) = cli.prompt_monitored_subscriptions(
             available_subscriptions
         )
+        if monitored_subscriptions and prefetch_permissions:
+            # Includes the roles of the root management group for tenant integrations
+            self._prefetcher.submit(
+                "permissions of the monitored subscriptions",
+                lambda: self._auth.get_all_assigned_roles(
+                    monitored_subscriptions, integration_type == models.IntegrationType.TENANT
+                ),
+            )
 
         # Enumerate VMs in all monitored subscriptions
-        for sub in monitored_subscriptions:
-            cli.console.print(f"[dim]Enumerating VMs in {sub.name}...[/dim]")
-            self._subscriptions.get_subscription_vms(sub)
+        self._enumerate_vms(monitored_subscriptions)
+
+        # Fetch the quotas of every region with VMs while the user chooses among them
+        detected_region_names = sorted(
+            {region_name for sub in monitored_subscriptions for region_name in sub.regions}
+        )
+        self._prefetcher.submit(
+            "usage quota limits",
+            lambda: self._quotas.get_quota_limits_for_regions(
+                scanning_subscription.id, detected_region_names
+            ),
+        )
 
         # Show all VM counts together
         cli.print_vm_counts(monitored_subscriptions)
@@ -116,6 +305,52 @@ class App:
             use_nat_gateway=use_nat_gateway,
         )
 
+    def _enumerate_vms(
+        self,
+        subscriptions: list[models.Subscription],
+        subscription_regions: dict[str, list[str]] | None = None,
+    ) -> None:
+        """
+        Count VMs in all of the given subscriptions, or only in the regions given for each of
+        them, reporting each failure separately
+        """
+        cli.console.print(f"[dim]Enumerating VMs in {len(subscriptions)} subscription(s)...[/dim]")
+        with self._telemetry.phase("vm_enumeration"):
+            if self._engine == services.ExecutionEngine.ASYNCIO:
+                failures = self._run_async(
+                    lambda async_services: self._get_subscriptions_vms_async(
+                        async_services, subscriptions, subscription_regions
+                    )
+                )
+            else:
+                failures = {}
+                for regions, group in _group_by_regions(subscriptions, subscription_regions):
+                    failures.update(self._subscriptions.get_subscriptions_vms(group, regions))
+        self._report_vm_enumeration_failures(failures)
+
+    async def _get_subscriptions_vms_async(
+        self,
+        async_services: "_AsyncServices",
+        subscriptions: list[models.Subscription],
+        subscription_regions: dict[str, list[str]] | None,
+    ) -> dict[str, Exception]:
+        """
+        Count VMs in the given subscriptions with the async services, one group of
+        subscriptions with the same regions after the other
+        """
+        failures: dict[str, Exception] = {}
+        for regions, group in _group_by_regions(subscriptions, subscription_regions):
+            failures.update(
+                await async_services.subscriptions.get_subscriptions_vms(group, regions)
+            )
+        return failures
+
+    def _report_vm_enumeration_failures(self, failures: dict[str, Exception]) -> None:
+        if failures:
+            for error in failures.values():
+                cli.console.print(f"[red]{error}[/red]")
+            raise RuntimeError(f"Failed to enumerate VMs in {len(failures)} subscription(s)")
+
     def _get_scanning_subscription(
         self, scanning_subscription_input: str | None
     ) -> models.Subscription:
@@ -154,12 +389,9 @@ class App:
         cli.console.print("Getting usage quota limits...")
         if not self.deployment_config:
             raise RuntimeError("Deployment config not set")
-        return {
-            region: self._quotas.get_quota_limits(
-                self.deployment_config.scanning_subscription.id, region
-            )
-            for region in self.deployment_config.regions
-        }
+        return self._quotas.get_quota_limits_for_regions(
+            self.deployment_config.scanning_subscription.id, self.deployment_config.regions
+        )
 
     def _get_permissions(self) -> dict[str, list[models.AssignedRole]]:
         cli.console.print("Getting permissions...")
@@ -175,19 +407,202 @@ class App:
         )
         return self._auth.get_all_assigned_roles(subscriptions, include_root_management_group)
 
+    def _run_async(self, collect: Callable[["_AsyncServices"], Awaitable[T]]) -> T:
+        """
+        Run a collection coroutine with the async services, on the event loop they are bound to.
+        The loop and the services are created on first use, and reused by later collections.
+        """
+        if self._async_runner is None:
+            self._async_runner = asyncio.Runner()
+        return self._async_runner.run(self._collect_with_async_services(collect))
+
+    async def _collect_with_async_services(
+        self, collect: Callable[["_AsyncServices"], Awaitable[T]]
+    ) -> T:
+        """Run a collection coroutine, opening the async services on the first collection"""
+        if self._async_services is None:
+            exit_stack = AsyncExitStack()
+            self._async_services = await exit_stack.enter_async_context(self._open_async_services())
+            self._async_exit_stack = exit_stack
+        return await collect(self._async_services)
+
+    def _close_async_services(self) -> None:
+        """Close the async services and their event loop, if they were created"""
+        if self._async_runner is None:
+            return
+        try:
+            if self._async_exit_stack is not None:
+                self._async_runner.run(self._async_exit_stack.aclose())
+        finally:
+            self._async_runner.close()
+            self._async_runner = None
+            self._async_services = None
+            self._async_exit_stack = None
+
+    @asynccontextmanager
+    async def _open_async_services(self) -> AsyncIterator["_AsyncServices"]:
+        """
+        Create the async services for the running event loop. The async credential and client
+        session are bound to the loop, so they are closed before it.
+        """
+        # Imported here so that --help and argument validation don't load the Azure SDK
+        from azure.identity.aio import DefaultAzureCredential
+
+        async with (
+            DefaultAzureCredential() as credential,
+            aio.AsyncAzureClientFactory(
+                aio.AsyncInstrumentedCredential(credential, self._telemetry),  # type: ignore[arg-type]
+                self._connection_pool_size,
+                throttling=self._throttling,
+                telemetry=self._telemetry,
+            ) as factory,
+        ):
+            inventory_backend: aio.AsyncInventoryBackend = (
+                aio.ThreadedInventoryBackend(self._inventory_backend)
+                if self._inventory_backend is not None
+                else aio.AsyncComputeInventoryBackend(
+                    factory, self._concurrency, self._vmss_count_strategy
+                )
+            )
+            yield _AsyncServices(
+                subscriptions=aio.AsyncSubscriptionService(
+                    inventory_backend, self._inventory_store
+                ),
+                quotas=aio.AsyncQuotaService(
+                    factory, self._concurrency, self._inventory_store, self._quota_cache
+                ),
+                auth=aio.AsyncAuthService(self._auth, factory, self._concurrency),
+            )
+
+    async def _collect_async(
+        self,
+        async_services: "_AsyncServices",
+        scanning_subscription: models.Subscription,
+        monitored_subscriptions: list[models.Subscription],
+        integration_type: models.IntegrationType,
+        requested_regions: list[str] | None,
+        subscription_regions: dict[str, list[str]] | None,
+    ) -> None:
+        """
+        Enumerate VMs in the monitored subscriptions, and collect the permissions and the
+        quotas of the requested regions at the same time, since neither depends on VM counts.
+        Quotas are cached by the quota services; permissions are kept for run().
+        """
+        cli.console.print(
+            f"[dim]Enumerating VMs in {len(monitored_subscriptions)} subscription(s)...[/dim]"
+        )
+        failures, self._permissions, _ = await asyncio.gather(
+            self._get_subscriptions_vms_async(
+                async_services, monitored_subscriptions, subscription_regions
+            ),
+            async_services.auth.get_all_assigned_roles(
+                [*monitored_subscriptions, scanning_subscription],
+                integration_type == models.IntegrationType.TENANT,
+            ),
+            self._prefetch_quotas(
+                async_services, scanning_subscription.id, requested_regions or []
+            ),
+        )
+        self._report_vm_enumeration_failures(failures)
+
+    async def _prefetch_quotas(
+        self, async_services: "_AsyncServices", subscription_id: str, regions: list[str]
+    ) -> None:
+        """
+        Fetch the quotas of regions that were requested but not validated yet; a failure is
+        left for run() to report, after invalid regions are dropped
+        """
+        try:
+            await async_services.quotas.get_quota_limits_for_regions(subscription_id, regions)
+        except Exception as e:
+            log.debug(f"Failed to prefetch quotas for regions {regions}: {str(e)}")
+
+    async def _get_quotas_and_permissions_async(
+        self, async_services: "_AsyncServices"
+    ) -> tuple[dict[str, dict[str, models.UsageQuotaLimit]], dict[str, list[models.AssignedRole]]]:
+        """Collect the usage quota limits and the permissions at the same time"""
+        if not self.deployment_config:
+            raise RuntimeError("Deployment config not set")
+        cli.console.print("Getting usage quota limits and permissions...")
+        quotas = async_services.quotas.get_quota_limits_for_regions(
+            self.deployment_config.scanning_subscription.id, self.deployment_config.regions
+        )
+        if self._permissions is not None:
+            return await quotas, self._permissions
+        return await asyncio.gather(
+            quotas,
+            async_services.auth.get_all_assigned_roles(
+                [
+                    *self.deployment_config.monitored_subscriptions,
+                    self.deployment_config.scanning_subscription,
+                ],
+                self.deployment_config.integration_type == models.IntegrationType.TENANT,
+            ),
+        )
+
+    def _get_available_regions(
+        self, requested_regions: list[str] | None, scanning_subscription: models.Subscription
+    ) -> list[str] | None:
+        """
+        Drop the requested regions that are not available to the scanning subscription, which
+        they are deployed to, with a warning; each monitored subscription is then counted in
+        those available to it
+        """
+        if requested_regions is None:
+            return None
+        available_regions = self._subscriptions.get_location_names(scanning_subscription.id)
+        for region_name in requested_regions:
+            if region_name not in available_regions:
+                cli.console.print(f"[yellow]Warning: Region {region_name} not found[/yellow]")
+        regions = [
+            region_name for region_name in requested_regions if region_name in available_regions
+        ]
+        if not regions:
+            raise RuntimeError("None of the requested regions were found")
+        return regions
+
     def _get_regions(
-        self, monitored_subscriptions: list[models.Subscription], regions_input: str | None
+        self,
+        monitored_subscriptions: list[models.Subscription],
+        requested_regions: list[str] | None,
     ) -> list[str]:
         valid_regions = {
             region_name for sub in monitored_subscriptions for region_name in sub.regions
         }
-        if not regions_input:
+        if not requested_regions:
             return list(valid_regions)
-        return [
-            region_name.strip()
-            for region_name in regions_input.strip().split(",")
-            if region_name.strip() in valid_regions
-        ]
+        return [region_name for region_name in requested_regions if region_name in valid_regions]
+
+
+def _group_by_regions(
+    subscriptions: list[models.Subscription], subscription_regions: dict[str, list[str]] | None
+) -> list[tuple[list[str] | None, list[models.Subscription]]]:
+    """
+    Group subscriptions by the regions to count VMs in, so that each group is counted at once;
+    all regions are counted if no regions are given. Subscriptions that none of the regions are
+    available to are left out, as they have no VMs to count.
+    """
+    if subscription_regions is None:
+        return [(None, subscriptions)]
+    groups: dict[tuple[str, ...], list[models.Subscription]] = {}
+    for sub in subscriptions:
+        regions = tuple(subscription_regions.get(sub.id, []))
+        if regions:
+            groups.setdefault(regions, []).append(sub)
+        else:
+            log.debug(f"None of the requested regions are available to subscription {sub.id}")
+    return [(list(regions), group) for regions, group in groups.items()]
+
+
+def _parse_regions(regions_input: str | None) -> list[str] | None:
+    """
+    Split the comma-separated --regions input into lowercase region names, as VM counts are
+    keyed by, or return None if no regions were given
+    """
+    if not regions_input:
+        return None
+    region_names = (region_name.strip().lower() for region_name in regions_input.split(","))
+    return list(dict.fromkeys(region_name for region_name in region_names if region_name))
 
 
 def main(
@@ -245,6 +660,148 @@ def main(
             rich_help_panel="Output",
         ),
     ] = "./preflight_report.json",
+    concurrency: Annotated[
+        int,
+        typer.Option(
+            "--concurrency",
+            "-c",
+            min=1,
+            help="Maximum number of concurrent Azure API requests per phase",
+            rich_help_panel="Performance",
+        ),
+    ] = services.DEFAULT_CONCURRENCY,
+    vmss_count_strategy: Annotated[
+        services.VmssCountStrategy,
+        typer.Option(
+            "--vmss-count",
+            help=(
+                "How to count scale set instances: 'capacity' reads each scale set's SKU capacity, "
+                "'exact' lists every instance"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = services.VmssCountStrategy.CAPACITY,
+    inventory_engine: Annotated[
+        services.InventoryEngine,
+        typer.Option(
+            "--inventory",
+            help=(
+                "How to count VMs: 'compute' lists VMs in each subscription, 'resource-graph' runs "
+                "summarized Azure Resource Graph queries per batch of subscriptions"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = services.InventoryEngine.COMPUTE,
+    connection_pool_size: Annotated[
+        int,
+        typer.Option(
+            "--connection-pool-size",
+            min=1,
+            help=(
+                "Maximum number of connections kept open to each Azure host, shared by all "
+                "subscriptions"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = services.DEFAULT_CONNECTION_POOL_SIZE,
+    engine: Annotated[
+        services.ExecutionEngine,
+        typer.Option(
+            "--engine",
+            help=(
+                "How Azure requests are run concurrently: 'threads' uses a pool of worker threads, "
+                "'asyncio' runs VM enumeration, quotas and permissions together on one event loop"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = services.ExecutionEngine.THREADS,
+    profile_path: Annotated[
+        Path | None,
+        typer.Option(
+            "--profile",
+            help=(
+                "Profile the run, writing cProfile statistics of the main thread to PATH.prof and "
+                "stacks sampled from every thread to PATH.collapsed, for flame graph tools"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = None,
+    record_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--record",
+            metavar="DIR",
+            help=(
+                "Record every Azure Resource Manager request and response to DIR, to replay the "
+                "run offline with --replay; caches are not used"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = None,
+    replay_dir: Annotated[
+        Path | None,
+        typer.Option(
+            "--replay",
+            metavar="DIR",
+            help=(
+                "Serve the Azure Resource Manager responses recorded to DIR with --record instead "
+                "of calling Azure; caches are not used"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = None,
+    replay_latency_ms: Annotated[
+        float | None,
+        typer.Option(
+            "--replay-latency",
+            min=0,
+            help=(
+                "Milliseconds every replayed response takes - if not provided, each takes as long "
+                "as when it was recorded"
+            ),
+            rich_help_panel="Performance",
+        ),
+    ] = None,
+    cache_dir: Annotated[
+        Path,
+        typer.Option(
+            "--cache-dir",
+            help="Directory where Azure data that rarely changes is cached between runs",
+            rich_help_panel="Cache",
+        ),
+    ] = services.DEFAULT_CACHE_DIR,
+    cache_ttl: Annotated[
+        int,
+        typer.Option(
+            "--cache-ttl",
+            min=0,
+            help=(
+                "Hours that cached built-in role definitions are used before they are fetched "
+                "again; 0 disables the cache"
+            ),
+            rich_help_panel="Cache",
+        ),
+    ] = int(services.DEFAULT_ROLE_DEFINITION_CACHE_TTL.total_seconds() // 3600),
+    max_age: Annotated[
+        int,
+        typer.Option(
+            "--max-age",
+            min=0,
+            help=(
+                "Minutes that cached subscriptions, VM counts and quota usage are used before they "
+                "are fetched again; 0 disables the cache"
+            ),
+            rich_help_panel="Cache",
+        ),
+    ] = 0,
+    refresh_cache: Annotated[
+        bool,
+        typer.Option(
+            "--refresh-cache",
+            help="Ignore cached data and fetch everything from Azure again, updating the cache",
+            rich_help_panel="Cache",
+        ),
+    ] = False,
     no_emoji: Annotated[
         bool,
         typer.Option(
@@ -278,18 +835,90 @@ def main(
             f"use_nat_gateway: {use_nat_gateway}\n"
             f"output_path: {output_path}\n"
             f"no_emoji: {no_emoji}\n"
+            f"concurrency: {concurrency}\n"
+            f"vmss_count_strategy: {vmss_count_strategy}\n"
+            f"inventory_engine: {inventory_engine}\n"
+            f"connection_pool_size: {connection_pool_size}\n"
+            f"engine: {engine}\n"
+            f"profile_path: {profile_path}\n"
+            f"record_dir: {record_dir}\n"
+            f"replay_dir: {replay_dir}\n"
+            f"replay_latency_ms: {replay_latency_ms}\n"
+            f"cache_dir: {cache_dir}\n"
+            f"cache_ttl: {cache_ttl}\n"
+            f"max_age: {max_age}\n"
+            f"refresh_cache: {refresh_cache}\n"
         )
-        credential = DefaultAzureCredential()
-        cli.console = cli.Console(emoji=not no_emoji)
-        app = App(credential, output_path)
-        app.configure(
-            scanning_subscription,
-            monitored_subscriptions,
-            excluded_subscriptions,
-            regions,
-            use_nat_gateway,
-        )
-        app.run()
+        if record_dir is not None and replay_dir is not None:
+            raise typer.BadParameter("--record and --replay are mutually exclusive")
+        if replay_latency_ms is not None and replay_dir is None:
+            raise typer.BadParameter("--replay-latency requires --replay")
+        if (record_dir or replay_dir) and engine == services.ExecutionEngine.ASYNCIO:
+            raise typer.BadParameter("--record and --replay require the threads engine")
+        profiler = profiling.profile(profile_path) if profile_path is not None else nullcontext()
+        with profiler:
+            traffic: services.TrafficRecorder | services.TrafficReplay | None = None
+            credential: TokenCredential
+            if replay_dir is not None:
+                traffic = services.TrafficReplay(
+                    replay_dir, None if replay_latency_ms is None else replay_latency_ms / 1000
+                )
+                credential = services.ReplayCredential(traffic.identity)
+            else:
+                # Imported here so that --help and argument validation don't load the Azure SDK
+                from azure.identity import DefaultAzureCredential
+
+                credential = DefaultAzureCredential()
+                if record_dir is not None:
+                    traffic = services.TrafficRecorder(record_dir)
+            cli.console = cli.Console(emoji=not no_emoji)
+            # Recorded and replayed runs send every request, so that a replay gets the same
+            # requests that were recorded whatever is cached on either machine
+            role_definition_cache = (
+                services.RoleDefinitionCache(cache_dir, timedelta(hours=cache_ttl), refresh_cache)
+                if cache_ttl > 0 and traffic is None
+                else None
+            )
+            inventory_store = (
+                services.InventoryStore(
+                    cache_dir / services.INVENTORY_STORE_FILENAME,
+                    timedelta(minutes=0 if refresh_cache else max_age),
+                    count_method=f"{inventory_engine}/{vmss_count_strategy}",
+                )
+                if max_age > 0 and traffic is None
+                else None
+            )
+            with (
+                closing(traffic) if traffic is not None else nullcontext(),
+                closing(
+                    App(
+                        credential,
+                        output_path,
+                        concurrency,
+                        vmss_count_strategy,
+                        inventory_engine,
+                        role_definition_cache,
+                        inventory_store,
+                        connection_pool_size,
+                        engine,
+                        traffic=traffic,
+                    )
+                ) as app,
+            ):
+                app.configure(
+                    scanning_subscription,
+                    monitored_subscriptions,
+                    excluded_subscriptions,
+                    regions,
+                    use_nat_gateway,
+                )
+                app.run()
+        if profile_path is not None:
+            cli.console.print(
+                f"\n:stopwatch: [bold]Profile written to "
+                f"{profile_path.with_suffix(profiling.PROFILE_SUFFIX)} and "
+                f"{profile_path.with_suffix(profiling.COLLAPSED_SUFFIX)}[/bold]\n"
+            )
     except typer.Exit:
         raise
     except Exception as e:
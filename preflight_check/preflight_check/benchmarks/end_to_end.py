@@ -0,0 +1,151 @@
+"""
+Benchmark App.configure and App.run end to end against a synthetic tenant.
+
+The real services run against fake Azure clients serving a generated tenant of 10, 1,000 and
+10,000 subscriptions, checking every subscription (a tenant integration), without any network
+access. Each call can be given a latency to stand in for Azure; the results are compared to
+the baseline tracked in benchmarks/baseline.json, which was recorded on a developer machine
+and is only comparable to runs on similar hardware.
+
+Usage:
+    uv run -m preflight_check.benchmarks.end_to_end
+    uv run -m preflight_check.benchmarks.end_to_end --update-baseline
+"""
+
+import json
+import tempfile
+import time
+from contextlib import closing
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Annotated
+
+import typer
+from rich.console import Console
+from rich.table import Table
+
+from preflight_check import cli
+from preflight_check.app import App
+from preflight_check.core import services
+
+from .tenant import FakeAzureClientFactory, generate_tenant
+
+SUBSCRIPTION_COUNTS = [10, 1000, 10000]
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+# Latency of each fake Azure call in the baseline
+DEFAULT_LATENCY_MS = 5.0
+# Subscription excluded from the tenant integration; no subscription has this ID, so every
+# subscription is checked
+_EXCLUDED_SUBSCRIPTION = "none"
+
+console = Console()
+
+
+@dataclass
+class Result:
+    """Timings and API calls of one benchmark run"""
+
+    subscriptions: int
+    vms: int
+    api_calls: int
+    configure_seconds: float
+    run_seconds: float
+
+    @property
+    def total_seconds(self) -> float:
+        return self.configure_seconds + self.run_seconds
+
+
+def measure(subscription_count: int, latency: float) -> Result:
+    """Time App.configure and App.run against a generated tenant of the given size"""
+    tenant = generate_tenant(subscription_count)
+    factory = FakeAzureClientFactory(tenant, latency)
+    # Caches are kept per process; start every run from cold caches
+    services.AuthService._role_definitions = {}
+    services.AuthService._role_permissions = {}
+    services.AuthService._assigned_roles = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        with closing(
+            App(
+                factory.credential,  # type: ignore[arg-type]
+                str(Path(output_dir) / "results.json"),
+                azure_client_factory=factory,  # type: ignore[arg-type]
+            )
+        ) as app:
+            app.configure(tenant.subscription_ids[0], None, _EXCLUDED_SUBSCRIPTION, None, False)
+            configured = time.perf_counter()
+            app.run()
+            finished = time.perf_counter()
+    return Result(
+        subscriptions=subscription_count,
+        vms=tenant.vm_count,
+        api_calls=sum(factory.calls.values()),
+        configure_seconds=round(configured - start, 3),
+        run_seconds=round(finished - configured, 3),
+    )
+
+
+def load_baseline(latency_ms: float) -> dict[int, Result]:
+    """Load the baseline results, if they were recorded with the same latency"""
+    if not BASELINE_PATH.exists():
+        return {}
+    baseline = json.loads(BASELINE_PATH.read_text())
+    if baseline["latency_ms"] != latency_ms:
+        return {}
+    return {result["subscriptions"]: Result(**result) for result in baseline["results"]}
+
+
+def save_baseline(latency_ms: float, results: list[Result]) -> None:
+    baseline = {"latency_ms": latency_ms, "results": [asdict(result) for result in results]}
+    BASELINE_PATH.write_text(json.dumps(baseline, indent=2) + "\n")
+
+
+def main(
+    subscription_counts: Annotated[
+        list[int] | None,
+        typer.Option("--subscriptions", help="Tenant sizes to benchmark, in subscriptions"),
+    ] = None,
+    latency_ms: Annotated[
+        float, typer.Option("--latency-ms", help="Latency of each fake Azure call")
+    ] = DEFAULT_LATENCY_MS,
+    update_baseline: Annotated[
+        bool, typer.Option("--update-baseline", help="Record the results as the new baseline")
+    ] = False,
+) -> None:
+    baseline = load_baseline(latency_ms)
+    # Keep the output of the preflight check itself out of the benchmark's
+    cli.console = Console(quiet=True)
+    results = [
+        measure(subscription_count, latency_ms / 1000)
+        for subscription_count in subscription_counts or SUBSCRIPTION_COUNTS
+    ]
+
+    table = Table(title=f"App.configure and App.run, {latency_ms:g} ms per Azure call")
+    for column in ["Subscriptions", "VMs", "API calls", "Configure", "Run", "Total"]:
+        table.add_column(column, justify="right")
+    table.add_column("Baseline", justify="right")
+    table.add_column("Change", justify="right")
+    for result in results:
+        baseline_result = baseline.get(result.subscriptions)
+        table.add_row(
+            f"{result.subscriptions:,}",
+            f"{result.vms:,}",
+            f"{result.api_calls:,}",
+            f"{result.configure_seconds:.2f}s",
+            f"{result.run_seconds:.2f}s",
+            f"{result.total_seconds:.2f}s",
+            f"{baseline_result.total_seconds:.2f}s" if baseline_result else "-",
+            f"{result.total_seconds / baseline_result.total_seconds - 1:+.0%}"
+            if baseline_result
+            else "-",
+        )
+    console.print(table)
+
+    if update_baseline:
+        save_baseline(latency_ms, results)
+        console.print(f"Baseline saved to {BASELINE_PATH}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
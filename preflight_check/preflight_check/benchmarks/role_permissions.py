@@ -0,0 +1,95 @@
+"""
+Benchmark RolePermissions.grants_action on roles with hundreds of wildcard patterns.
+
+Compares the compiled matcher against the previous implementation, which built and matched a
+new regex for every pattern on every check.
+
+Usage:
+    uv run -m preflight_check.benchmarks.role_permissions
+"""
+
+import random
+import re
+import time
+from collections.abc import Callable
+from functools import partial
+
+from rich.console import Console
+from rich.table import Table
+
+from preflight_check.core.auth_check import ScanningSubscriptionAuthCheck
+from preflight_check.core.models import RolePermissions, Subscription
+
+PATTERN_COUNTS = [10, 100, 300, 1000]
+ROUNDS = 5
+
+console = Console()
+
+
+def generate_role_permissions(pattern_count: int, seed: int = 0) -> RolePermissions:
+    """Generate a role whose actions and not actions are made of wildcard patterns"""
+    rng = random.Random(seed)
+    namespaces = ["Compute", "Network", "Storage", "KeyVault", "App", "Web", "Sql", "Insights"]
+    resource_types = ["virtualMachines", "accounts", "vaults", "sites", "jobs", "servers"]
+    operations = ["read", "write", "delete", "action", "*"]
+
+    def pattern() -> str:
+        namespace = rng.choice(namespaces)
+        resource_type = rng.choice([*resource_types, "*"])
+        child = rng.choice(["", f"/{rng.choice(resource_types)}"])
+        operation = rng.choice(operations)
+        return f"Microsoft.{namespace}{rng.randint(0, 99)}/{resource_type}{child}/{operation}"
+
+    return RolePermissions(
+        actions=[pattern() for _ in range(pattern_count)],
+        not_actions=[pattern() for _ in range(pattern_count // 10)],
+        data_actions=[pattern() for _ in range(pattern_count // 10)],
+        not_data_actions=[pattern() for _ in range(pattern_count // 100)],
+    )
+
+
+def legacy_grants_action(permissions: RolePermissions, action_string: str) -> bool:
+    """The matcher RolePermissions used before patterns were compiled once per role"""
+
+    def matches(patterns: list[str]) -> bool:
+        return any(
+            re.match("^" + pattern.replace("*", ".*") + "$", action_string) for pattern in patterns
+        )
+
+    return (matches(permissions.actions) and not matches(permissions.not_actions)) or (
+        matches(permissions.data_actions) and not matches(permissions.not_data_actions)
+    )
+
+
+def measure(grants_action: Callable[[str], bool], actions: list[str]) -> float:
+    """Return the best throughput, in checks per second, over several rounds"""
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for action in actions:
+            grants_action(action)
+        best = min(best, time.perf_counter() - start)
+    return len(actions) / best
+
+
+def main() -> None:
+    subscription = Subscription(id="benchmark", name="benchmark", regions={})
+    actions = ScanningSubscriptionAuthCheck(subscription, []).required_permissions
+
+    table = Table(title="RolePermissions.grants_action throughput (checks/s)")
+    table.add_column("Patterns per role", justify="right")
+    table.add_column("Legacy", justify="right")
+    table.add_column("Compiled", justify="right")
+    table.add_column("Speedup", justify="right")
+    for pattern_count in PATTERN_COUNTS:
+        permissions = generate_role_permissions(pattern_count)
+        legacy = measure(partial(legacy_grants_action, permissions), actions)
+        compiled = measure(permissions.grants_action, actions)
+        table.add_row(
+            str(pattern_count), f"{legacy:,.0f}", f"{compiled:,.0f}", f"{compiled / legacy:.1f}x"
+        )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Synthetic Azure tenant, served through fake Azure clients.
+
+A generated tenant holds subscriptions with VMs and scale sets spread across regions, grouped
+in management groups below the root management group, the role assignments of the
+authenticated principal at each subscription and management group, and the usage quotas of
+each region. FakeAzureClientFactory serves it with the
+interface of AzureClientFactory, so the real services and App run against it without calling
+Azure.
+"""
+
+import base64
+import json
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+from preflight_check.core.services import Telemetry, ThrottlingScheduler
+from preflight_check.core.services.azure import ARM_ENDPOINT
+
+from .role_permissions import generate_role_permissions
+
+if TYPE_CHECKING:
+    from azure.core.rest import HttpRequest
+
+PRINCIPAL_ID = "11111111-1111-1111-1111-111111111111"
+TENANT_ID = "22222222-2222-2222-2222-222222222222"
+REGIONS = [
+    "eastus",
+    "eastus2",
+    "westus",
+    "westus2",
+    "centralus",
+    "northeurope",
+    "westeurope",
+    "uksouth",
+    "southeastasia",
+    "japaneast",
+]
+# Compute usages checked by the preflight check, followed by other VM families that Azure
+# also returns
+COMPUTE_QUOTA_NAMES = [
+    "cores",
+    "standardDSv3Family",
+    "standardDSv4Family",
+    "standardDSv5Family",
+    *(f"standard{family}Family" for family in ["A", "B", "D", "E", "F", "L", "M", "NC", "ND"]),
+    *(f"standard{family}v{version}Family" for family in ["D", "E", "F"] for version in [2, 4, 5]),
+]
+NETWORK_QUOTA_NAMES = [
+    "PublicIPAddresses",
+    "IPv4StandardSkuPublicIpAddresses",
+    "VirtualNetworks",
+    "NetworkSecurityGroups",
+    "LoadBalancers",
+    "NetworkInterfaces",
+    "RouteTables",
+    "NatGateways",
+]
+# Patterns of each generated custom role
+CUSTOM_ROLE_PATTERN_COUNT = 100
+# Subscriptions of each generated management group
+SUBSCRIPTIONS_PER_MANAGEMENT_GROUP = 100
+
+_ROOT_MANAGEMENT_GROUP = f"/providers/Microsoft.Management/managementGroups/{TENANT_ID}"
+
+
+@dataclass
+class SyntheticTenant:
+    """Subscriptions, resources, role assignments and quotas of a generated tenant"""
+
+    subscription_ids: list[str]
+    """Map from subscription ID to its VMs"""
+    vms: dict[str, list[SimpleNamespace]]
+    """Map from subscription ID to its uniform orchestration scale sets"""
+    scale_sets: dict[str, list[SimpleNamespace]]
+    """Map from role definition ID to role definition"""
+    role_definitions: dict[str, SimpleNamespace]
+    """Map from scope to the role assignments of the principal that apply at that scope"""
+    role_assignments: dict[str, list[SimpleNamespace]]
+    """Map from management group or subscription ID to the ID of its parent management group"""
+    parents: dict[str, str]
+    """Map from region to the compute and network usages of the region"""
+    usages: dict[str, dict[str, list[SimpleNamespace]]]
+
+    @property
+    def vm_count(self) -> int:
+        """Number of VMs, including scale set instances"""
+        capacities: list[int] = [
+            vmss.sku.capacity for scale_sets in self.scale_sets.values() for vmss in scale_sets
+        ]
+        return sum(len(vms) for vms in self.vms.values()) + sum(capacities)
+
+
+def generate_tenant(
+    subscription_count: int,
+    vms_per_subscription: int = 20,
+    scale_sets_per_subscription: int = 2,
+    custom_role_count: int = 5,
+    seed: int = 0,
+) -> SyntheticTenant:
+    """
+    Generate a tenant whose subscriptions each have VMs and scale sets in one to three regions.
+
+    The principal owns the first subscription, which is the scanning subscription; every other
+    subscription has a Contributor and a custom role assignment, and every subscription
+    inherits a custom role assignment from the root management group and another from its
+    management group.
+    """
+    rng = random.Random(seed)
+    subscription_ids = [
+        f"00000000-0000-0000-0000-{index:012d}" for index in range(subscription_count)
+    ]
+
+    role_definitions = {
+        role.id: role
+        for role in [
+            _role_definition("Owner", "BuiltInRole", actions=["*"]),
+            _role_definition(
+                "Contributor",
+                "BuiltInRole",
+                actions=["*"],
+                not_actions=[
+                    "Microsoft.Authorization/*/Delete",
+                    "Microsoft.Authorization/*/Write",
+                    "Microsoft.Authorization/elevateAccess/Action",
+                ],
+            ),
+            *(
+                _role_definition(
+                    f"Custom {index}",
+                    "CustomRole",
+                    **vars(generate_role_permissions(CUSTOM_ROLE_PATTERN_COUNT, seed=index)),
+                )
+                for index in range(custom_role_count)
+            ),
+        ]
+    }
+    owner, contributor, *custom_roles = role_definitions.values()
+    root_assignments = [_role_assignment("root-custom", _ROOT_MANAGEMENT_GROUP, custom_roles[0])]
+    role_assignments = {_ROOT_MANAGEMENT_GROUP: root_assignments}
+    parents: dict[str, str] = {}
+
+    vms: dict[str, list[SimpleNamespace]] = {}
+    scale_sets: dict[str, list[SimpleNamespace]] = {}
+    for index, subscription_id in enumerate(subscription_ids):
+        scope = f"/subscriptions/{subscription_id}"
+        management_group = (
+            f"/providers/Microsoft.Management/managementGroups/"
+            f"mg-{index // SUBSCRIPTIONS_PER_MANAGEMENT_GROUP}"
+        )
+        if management_group not in parents:
+            parents[management_group] = _ROOT_MANAGEMENT_GROUP
+            role_assignments[management_group] = [
+                *root_assignments,
+                _role_assignment("mg-custom", management_group, rng.choice(custom_roles)),
+            ]
+        parents[scope] = management_group
+        regions = rng.sample(REGIONS, rng.randint(1, 3))
+        vms[subscription_id] = [
+            SimpleNamespace(location=rng.choice(regions)) for _ in range(vms_per_subscription)
+        ]
+        scale_sets[subscription_id] = [
+            SimpleNamespace(
+                id=f"{scope}/resourceGroups/rg-{number}/providers/Microsoft.Compute/virtualMachineScaleSets/vmss-{number}",
+                name=f"vmss-{number}",
+                location=rng.choice(regions),
+                orchestration_mode="Uniform",
+                sku=SimpleNamespace(capacity=rng.randint(1, 10)),
+            )
+            for number in range(scale_sets_per_subscription)
+        ]
+        own = (
+            [_role_assignment(f"{subscription_id}-owner", scope, owner)]
+            if index == 0
+            else [
+                _role_assignment(f"{subscription_id}-contributor", scope, contributor),
+                _role_assignment(f"{subscription_id}-custom", scope, rng.choice(custom_roles)),
+            ]
+        )
+        role_assignments[scope] = [*role_assignments[management_group], *own]
+
+    usages = {
+        region: {
+            "compute": [_usage(name, rng) for name in COMPUTE_QUOTA_NAMES],
+            "network": [_usage(name, rng) for name in NETWORK_QUOTA_NAMES],
+        }
+        for region in REGIONS
+    }
+    return SyntheticTenant(
+        subscription_ids=subscription_ids,
+        vms=vms,
+        scale_sets=scale_sets,
+        role_definitions=role_definitions,
+        role_assignments=role_assignments,
+        parents=parents,
+        usages=usages,
+    )
+
+
+class FakeCredential:
+    """Issues access tokens for the principal of the synthetic tenant"""
+
+    def __init__(self) -> None:
+        claims = {"oid": PRINCIPAL_ID, "tid": TENANT_ID}
+        payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+        self._token = f"header.{payload}.signature"
+
+    def get_token(self, *_scopes: str) -> SimpleNamespace:
+        return SimpleNamespace(token=self._token, expires_on=int(time.time()) + 3600)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeAzureClientFactory:
+    """
+    Serves a synthetic tenant through fake clients, in place of AzureClientFactory.
+
+    Every call waits for the given latency, standing in for the network, and is counted by
+    operation. List calls return all of their results in a single page.
+    """
+
+    credential: FakeCredential
+    throttling: ThrottlingScheduler
+    telemetry: Telemetry
+    """Number of calls made to each operation"""
+    calls: Counter[str]
+    _tenant: SyntheticTenant
+    _latency: float
+    _lock: threading.Lock
+
+    def __init__(self, tenant: SyntheticTenant, latency: float = 0.0) -> None:
+        """
+        Args:
+            tenant: Tenant to serve
+            latency: Seconds each call takes
+        """
+        self.credential = FakeCredential()
+        self.throttling = ThrottlingScheduler()
+        self.telemetry = Telemetry()
+        self.calls = Counter()
+        self._tenant = tenant
+        self._latency = latency
+        self._lock = threading.Lock()
+
+    def get_subscription_client(self) -> SimpleNamespace:
+        def list_subscriptions() -> list[SimpleNamespace]:
+            self._call("subscriptions.list")
+            return [_subscription(sub_id) for sub_id in self._tenant.subscription_ids]
+
+        def get_subscription(subscription_id: str) -> SimpleNamespace:
+            self._call("subscriptions.get")
+            return _subscription(subscription_id)
+
+        return SimpleNamespace(
+            subscriptions=SimpleNamespace(list=list_subscriptions, get=get_subscription)
+        )
+
+    def get_compute_client(self, subscription_id: str) -> SimpleNamespace:
+        scale_sets = self._tenant.scale_sets[subscription_id]
+        capacities = {vmss.name: vmss.sku.capacity for vmss in scale_sets}
+
+        def list_scale_sets(location: str | None = None) -> list[SimpleNamespace]:
+            self._call("virtual_machine_scale_sets.list")
+            return [vmss for vmss in scale_sets if location is None or vmss.location == location]
+
+        def list_instances(_resource_group_name: str, name: str) -> list[SimpleNamespace]:
+            self._call("virtual_machine_scale_set_vms.list")
+            return [SimpleNamespace() for _ in range(capacities[name])]
+
+        return SimpleNamespace(
+            virtual_machine_scale_sets=SimpleNamespace(
+                list_all=list_scale_sets, list_by_location=list_scale_sets
+            ),
+            virtual_machine_scale_set_vms=SimpleNamespace(list=list_instances),
+            usage=SimpleNamespace(list=lambda location: self._list_usages("compute", location)),
+        )
+
+    def get_arm_client(self) -> SimpleNamespace:
+        def send_request(request: "HttpRequest") -> SimpleNamespace:
+            if urlparse(request.url).path.endswith("/descendants"):
+                return list_descendants()
+            # /subscriptions/{id}/providers/Microsoft.Compute[/locations/{location}]/virtualMachines
+            parts = urlparse(request.url).path.split("/")
+            location = parts[6] if parts[5] == "locations" else None
+            self._call("virtual_machines.list")
+            page = {
+                "value": [
+                    {"id": f"/subscriptions/{parts[2]}/vm-{index}", "location": vm.location}
+                    for index, vm in enumerate(self._tenant.vms[parts[2]])
+                    if location is None or vm.location == location
+                ]
+            }
+            return SimpleNamespace(status_code=200, json=lambda: page)
+
+        def list_descendants() -> SimpleNamespace:
+            self._call("management_groups.descendants")
+            page = {
+                "value": [
+                    {"id": descendant, "properties": {"parent": {"id": parent}}}
+                    for descendant, parent in self._tenant.parents.items()
+                ]
+            }
+            return SimpleNamespace(status_code=200, json=lambda: page)
+
+        return SimpleNamespace(format_url=ARM_ENDPOINT.__add__, send_request=send_request)
+
+    def get_network_client(self, _subscription_id: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            usages=SimpleNamespace(list=lambda location: self._list_usages("network", location))
+        )
+
+    def get_auth_client(self, _subscription_id: str) -> SimpleNamespace:
+        def list_for_scope(scope: str, filter: str) -> list[SimpleNamespace]:
+            self._call("role_assignments.list_for_scope")
+            if filter == f"principalId eq '{PRINCIPAL_ID}'":
+                # Every assignment of the principal in the tenant
+                assert scope == _ROOT_MANAGEMENT_GROUP
+                return list(
+                    {
+                        role_assignment.id: role_assignment
+                        for role_assignments in self._tenant.role_assignments.values()
+                        for role_assignment in role_assignments
+                    }.values()
+                )
+            assert filter == f"assignedTo('{PRINCIPAL_ID}')"
+            return self._tenant.role_assignments.get(scope, [])
+
+        def get_by_id(role_definition_id: str) -> SimpleNamespace:
+            self._call("role_definitions.get_by_id")
+            return self._tenant.role_definitions[role_definition_id]
+
+        return SimpleNamespace(
+            role_assignments=SimpleNamespace(list_for_scope=list_for_scope),
+            role_definitions=SimpleNamespace(get_by_id=get_by_id),
+        )
+
+    def close(self) -> None:
+        pass
+
+    def _list_usages(self, provider: str, location: str) -> list[SimpleNamespace]:
+        self._call(f"{provider} usages.list")
+        return self._tenant.usages[location][provider]
+
+    def _call(self, operation: str) -> None:
+        with self._lock:
+            self.calls[operation] += 1
+        if self._latency:
+            time.sleep(self._latency)
+
+
+def _subscription(subscription_id: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        subscription_id=subscription_id, display_name=f"sub-{subscription_id[-6:]}"
+    )
+
+
+def _role_definition(
+    name: str,
+    role_type: str,
+    actions: list[str],
+    not_actions: list[str] | None = None,
+    data_actions: list[str] | None = None,
+    not_data_actions: list[str] | None = None,
+) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"/providers/Microsoft.Authorization/roleDefinitions/{name.lower().replace(' ', '-')}",
+        role_name=name,
+        role_type=role_type,
+        permissions=[
+            SimpleNamespace(
+                actions=actions,
+                not_actions=not_actions or [],
+                data_actions=data_actions or [],
+                not_data_actions=not_data_actions or [],
+            )
+        ],
+    )
+
+
+def _role_assignment(name: str, scope: str, role_definition: SimpleNamespace) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"{scope}/providers/Microsoft.Authorization/roleAssignments/{name}",
+        role_definition_id=role_definition.id,
+        scope=scope,
+        principal_id=PRINCIPAL_ID,
+        principal_type="ServicePrincipal",
+        condition=None,
+    )
+
+
+def _usage(name: str, rng: random.Random) -> SimpleNamespace:
+    limit = rng.choice([10, 100, 350, 1000])
+    return SimpleNamespace(
+        name=SimpleNamespace(value=name, localized_value=name),
+        limit=limit,
+        current_value=rng.randint(0, limit // 2),
+    )
@@ -1,5 +1,6 @@
 import json
 from pathlib import Path
+from typing import Any
 
 from rich.box import HEAVY_EDGE
 from rich.console import Console
@@ -347,10 +348,46 @@ def print_deployment_config(deployment_config: DeploymentConfig) -> None:
     console.print(f"[bold]Use NAT Gateway:[/bold] {deployment_config.use_nat_gateway}")
 
 
+def print_telemetry(telemetry: dict[str, Any]) -> None:
+    """Display the duration of each phase and the Azure calls made in it"""
+    table = Table(box=HEAVY_EDGE)
+    table.add_column("Phase", style="cyan")
+    table.add_column("Operation", style="magenta")
+    table.add_column("Calls", justify="right")
+    table.add_column("Errors", justify="right")
+    table.add_column("Pages", justify="right")
+    table.add_column("Bytes", justify="right")
+    table.add_column("Mean ms", justify="right")
+    table.add_column("Max ms", justify="right")
+    table.add_column("Total ms", style="green", justify="right")
+
+    for phase_name, phase in telemetry.items():
+        table.add_row(
+            phase_name, "", "", "", "", "", "", "", str(phase["duration_ms"]), style="bold"
+        )
+        for operation_name, operation in phase["operations"].items():
+            table.add_row(
+                "",
+                operation_name,
+                str(operation["calls"]),
+                str(operation["errors"]),
+                str(operation["pages"]),
+                str(operation["bytes"]),
+                str(operation["mean_ms"]),
+                str(operation["max_ms"]),
+                str(operation["total_ms"]),
+            )
+
+    console.print("\n[bold]Telemetry:[/bold]")
+    console.print(table)
+
+
 def output_preflight_check_results_file(
-    preflight_check: PreflightCheck, path_str: str = "./preflight_report.json"
+    preflight_check: PreflightCheck,
+    path_str: str = "./preflight_report.json",
+    telemetry: dict[str, Any] | None = None,
 ) -> None:
-    """Output the preflight check results to a file"""
+    """Output the preflight check results to a file, with the telemetry of the run if given"""
     path = Path(path_str)
     results = {
         "deployment_config": {
@@ -415,6 +452,8 @@ def output_preflight_check_results_file(
             ],
         },
     }
+    if telemetry is not None:
+        results["telemetry"] = telemetry
 
     with open(path, "w") as f:
         json.dump(results, f, indent=2)
@@ -1,7 +1,66 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable
 
 from preflight_check.core.models import AssignedRole, Subscription
 
+# Identifies a role assignment: role definition ID, scope, principal ID and condition
+RoleAssignmentKey = tuple[str, str, str, str | None]
+
+
+def role_assignment_key(role: AssignedRole) -> RoleAssignmentKey:
+    """Get the key that identifies the assignment of a role"""
+    return (role.id, role.scope, role.principal.id, role.condition)
+
+
+def _is_within_scope(scope: str, parent_scope: str) -> bool:
+    """Whether a scope is a lowercase parent scope or below it"""
+    scope = scope.lower()
+    return scope == parent_scope or scope.startswith(parent_scope + "/")
+
+
+class PermissionMatrix:
+    """
+    Evaluates which assigned role grants each of a set of required permissions
+
+    Duplicate permissions are evaluated once, and each role is checked against all the
+    permissions that no earlier role has granted in a single pass.
+    """
+
+    """Map from required permission to the first assigned role that grants it"""
+    _satisfying_roles: dict[str, AssignedRole | None]
+
+    def __init__(
+        self,
+        required_permissions: Iterable[str],
+        assigned_roles: list[AssignedRole],
+        inherited: "PermissionMatrix | None" = None,
+    ) -> None:
+        """
+        Args:
+            required_permissions: The permissions to evaluate
+            assigned_roles: The roles to evaluate the permissions against
+            inherited: Already evaluated matrix of the same permissions against roles that come
+            before the assigned roles; only the permissions it does not grant are evaluated
+        """
+        self._satisfying_roles = dict.fromkeys(required_permissions)
+        if inherited is not None:
+            for permission in self._satisfying_roles:
+                self._satisfying_roles[permission] = inherited.satisfying_role(permission)
+        remaining = [
+            permission for permission, role in self._satisfying_roles.items() if role is None
+        ]
+        for role in assigned_roles:
+            if not remaining:
+                break
+            granted = role.permissions.granted_actions(remaining)
+            for permission in granted:
+                self._satisfying_roles[permission] = role
+            remaining = [permission for permission in remaining if permission not in granted]
+
+    def satisfying_role(self, required_permission: str) -> AssignedRole | None:
+        """Get the first assigned role that grants a required permission, if any"""
+        return self._satisfying_roles[required_permission]
+
 
 class RequiredPermissionCheck:
     """Represents a permission that must be granted on a subscription"""
@@ -10,12 +69,22 @@ class RequiredPermissionCheck:
     is_granted: bool
     satisfying_role: AssignedRole | None = None
 
-    def __init__(self, required_permission: str, assigned_roles: list[AssignedRole]) -> None:
+    def __init__(
+        self,
+        required_permission: str,
+        assigned_roles: list[AssignedRole],
+        permission_matrix: PermissionMatrix | None = None,
+    ) -> None:
+        """
+        Args:
+            required_permission: The permission to check
+            assigned_roles: The roles to check the permission against
+            permission_matrix: Already evaluated matrix covering the permission and roles
+        """
         self.required_permission = required_permission
-        for role in assigned_roles:
-            if role.grants_action(required_permission):
-                self.satisfying_role = role
-                break
+        if permission_matrix is None:
+            permission_matrix = PermissionMatrix([required_permission], assigned_roles)
+        self.satisfying_role = permission_matrix.satisfying_role(required_permission)
         self.is_granted = self.satisfying_role is not None
 
 
@@ -27,7 +96,12 @@ class AuthCheck(ABC):
     subscription: Subscription
     checked_permissions: list[RequiredPermissionCheck]
 
-    def __init__(self, subscription: Subscription, assigned_roles: list[AssignedRole]) -> None:
+    def __init__(
+        self,
+        subscription: Subscription,
+        assigned_roles: list[AssignedRole],
+        permission_matrices: dict[tuple[RoleAssignmentKey, ...], PermissionMatrix] | None = None,
+    ) -> None:
         """
         Checks whether the set of assigned roles covers the required permissions
 
@@ -35,11 +109,38 @@ class AuthCheck(ABC):
             subscription: The subscription to check
             assigned_roles: The set of roles that have been assigned to the authenticated principal
             for the subscription
+            permission_matrices: Cache of evaluated permission matrices by inherited role
+            assignments, shared between checks of the same type so that the roles inherited from
+            the same management groups are only evaluated once
         """
         self.subscription = subscription
+        required_permissions = self.required_permissions
+        # Roles assigned above the subscription are evaluated once for every subscription that
+        # inherits them; only the remaining permissions are evaluated against its own roles
+        own_scope = f"/subscriptions/{subscription.id}".lower()
+        own_roles: list[AssignedRole] = []
+        inherited_roles: list[AssignedRole] = []
+        for role in assigned_roles:
+            if _is_within_scope(role.scope, own_scope):
+                own_roles.append(role)
+            else:
+                inherited_roles.append(role)
+        assignment_keys = tuple(role_assignment_key(role) for role in inherited_roles)
+        inherited_matrix = (
+            permission_matrices.get(assignment_keys) if permission_matrices is not None else None
+        )
+        if inherited_matrix is None:
+            inherited_matrix = PermissionMatrix(required_permissions, inherited_roles)
+            if permission_matrices is not None:
+                permission_matrices[assignment_keys] = inherited_matrix
+        permission_matrix = (
+            PermissionMatrix(required_permissions, own_roles, inherited_matrix)
+            if own_roles
+            else inherited_matrix
+        )
         self.checked_permissions = [
-            RequiredPermissionCheck(required_permission, assigned_roles)
-            for required_permission in self.required_permissions
+            RequiredPermissionCheck(required_permission, assigned_roles, permission_matrix)
+            for required_permission in required_permissions
         ]
 
     @property
@@ -1,4 +1,5 @@
 import re
+from collections.abc import Iterable
 from dataclasses import dataclass, field
 
 
@@ -10,44 +11,91 @@ class RolePermissions:
     not_actions: list[str] = field(default_factory=list)
     data_actions: list[str] = field(default_factory=list)
     not_data_actions: list[str] = field(default_factory=list)
+    # Compiled matchers for each permission list, built on first use
+    _matchers: "_RoleMatchers | None" = field(default=None, init=False, repr=False, compare=False)
 
     def grants_action(self, action_string: str) -> bool:
         """Checks if the role definition grants a specific action"""
-        return (
-            self._action_matches(action_string) and not self._not_action_matches(action_string)
-        ) or (
-            self._data_action_matches(action_string)
-            and not self._not_data_action_matches(action_string)
-        )
-
-    def _action_matches(self, action_string: str) -> bool:
-        """Checks if the role definition matches a specific action"""
-        return any(self._pattern_matches(pattern, action_string) for pattern in self.actions)
-
-    def _data_action_matches(self, action_string: str) -> bool:
-        """Checks if the role definition matches a specific data action"""
-        return any(self._pattern_matches(pattern, action_string) for pattern in self.data_actions)
-
-    def _not_action_matches(self, action_string: str) -> bool:
-        """Checks if the role definition matches a specific not action"""
-        return any(self._pattern_matches(pattern, action_string) for pattern in self.not_actions)
+        matchers = self._get_matchers()
+        granted = matchers.granted.get(action_string)
+        if granted is None:
+            granted = (
+                matchers.actions.matches(action_string)
+                and not matchers.not_actions.matches(action_string)
+            ) or (
+                matchers.data_actions.matches(action_string)
+                and not matchers.not_data_actions.matches(action_string)
+            )
+            matchers.granted[action_string] = granted
+        return granted
+
+    def granted_actions(self, action_strings: Iterable[str]) -> set[str]:
+        """Returns the subset of the given actions that the role definition grants"""
+        return {action for action in action_strings if self.grants_action(action)}
+
+    def _get_matchers(self) -> "_RoleMatchers":
+        """
+        Get the compiled matchers for the permission lists.
 
-    def _not_data_action_matches(self, action_string: str) -> bool:
-        """Checks if the role definition matches a specific not data action"""
-        return any(
-            self._pattern_matches(pattern, action_string) for pattern in self.not_data_actions
+        The matchers are compiled once and cached on the instance. Permission lists are built
+        up by extending them, so the matchers are compiled again if any list changes size.
+        """
+        sizes = (
+            len(self.actions),
+            len(self.not_actions),
+            len(self.data_actions),
+            len(self.not_data_actions),
+        )
+        if self._matchers is None or self._matchers.sizes != sizes:
+            self._matchers = _RoleMatchers(
+                actions=_WildcardMatcher(self.actions),
+                not_actions=_WildcardMatcher(self.not_actions),
+                data_actions=_WildcardMatcher(self.data_actions),
+                not_data_actions=_WildcardMatcher(self.not_data_actions),
+                sizes=sizes,
+            )
+        return self._matchers
+
+
+class _WildcardMatcher:
+    """
+    Matches action strings against a list of Azure permission patterns, where * matches any
+    sequence of characters and every other character matches itself
+
+    All patterns are compiled into a single alternation regex.
+    """
+
+    _regex: re.Pattern[str] | None
+
+    def __init__(self, patterns: list[str]) -> None:
+        self._regex = (
+            re.compile("|".join(_wildcard_to_regex(pattern) for pattern in patterns))
+            if patterns
+            else None
         )
 
-    def _pattern_matches(self, pattern: str, action_string: str) -> bool:
-        """
-        Convert Azure wildcard pattern to regex and check for match
+    def matches(self, action_string: str) -> bool:
+        return self._regex is not None and self._regex.fullmatch(action_string) is not None
 
-        Azure uses * as wildcard for permissions, which needs to be converted
-        to proper regex patterns
-        """
-        # Convert Azure permission pattern to regex pattern
-        regex_pattern = "^" + pattern.replace("*", ".*") + "$"
-        return bool(re.match(regex_pattern, action_string))
+
+@dataclass
+class _RoleMatchers:
+    """Compiled matchers for each permission list of a role"""
+
+    actions: _WildcardMatcher
+    not_actions: _WildcardMatcher
+    data_actions: _WildcardMatcher
+    not_data_actions: _WildcardMatcher
+    # Sizes of the permission lists the matchers were compiled from
+    sizes: tuple[int, ...]
+    # Whether each action string checked so far is granted; roles are shared by every
+    # subscription they are assigned on, so the same actions are checked many times
+    granted: dict[str, bool] = field(default_factory=dict)
+
+
+def _wildcard_to_regex(pattern: str) -> str:
+    """Convert an Azure wildcard permission pattern to an equivalent regex"""
+    return ".*".join(re.escape(part) for part in pattern.split("*"))
 
 
 @dataclass
@@ -1,4 +1,10 @@
-from .auth_check import AuthCheck, MonitoredSubscriptionAuthCheck, ScanningSubscriptionAuthCheck
+from .auth_check import (
+    AuthCheck,
+    MonitoredSubscriptionAuthCheck,
+    PermissionMatrix,
+    RoleAssignmentKey,
+    ScanningSubscriptionAuthCheck,
+)
 from .models import (
     AssignedRole,
     DeploymentConfig,
@@ -65,8 +71,13 @@ class AuthChecks:
             deployment_config.scanning_subscription,
             assigned_roles[deployment_config.scanning_subscription.id],
         )
+        # Most role assignments of a tenant deployment are inherited from management groups, so
+        # many monitored subscriptions share the same assignments and are evaluated only once
+        permission_matrices: dict[tuple[RoleAssignmentKey, ...], PermissionMatrix] = {}
         self.monitored_subscriptions = [
-            MonitoredSubscriptionAuthCheck(subscription, assigned_roles[subscription.id])
+            MonitoredSubscriptionAuthCheck(
+                subscription, assigned_roles[subscription.id], permission_matrices
+            )
             for subscription in deployment_config.monitored_subscriptions
         ]
 
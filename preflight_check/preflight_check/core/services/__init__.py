@@ -1,11 +1,63 @@
 from .auth import AuthService
-from .azure import AzureClientFactory
-from .quota import QuotaService
+from .azure import DEFAULT_CONNECTION_POOL_SIZE, AzureClientFactory
+from .cache import DEFAULT_CACHE_DIR, DEFAULT_ROLE_DEFINITION_CACHE_TTL, RoleDefinitionCache
+from .concurrency import DEFAULT_CONCURRENCY, ExecutionEngine
+from .identity import (
+    AzureCliIdentityResolver,
+    FallbackIdentityResolver,
+    Identity,
+    IdentityResolver,
+    TokenClaimsIdentityResolver,
+)
+from .inventory import (
+    ComputeInventoryBackend,
+    InMemoryInventoryBackend,
+    InventoryBackend,
+    InventoryEngine,
+    InventoryResult,
+    ResourceGraphInventoryBackend,
+    VmssCountStrategy,
+)
+from .prefetch import Prefetcher
+from .quota import QuotaCache, QuotaService
+from .store import INVENTORY_STORE_FILENAME, InventoryStore
 from .subscriptions import SubscriptionService
+from .telemetry import InstrumentedCredential, Telemetry
+from .throttling import ThrottlingScheduler, ThrottlingStats
+from .traffic import ReplayCredential, TrafficRecorder, TrafficReplay
 
 __all__ = [
     "AzureClientFactory",
     "SubscriptionService",
     "QuotaService",
+    "QuotaCache",
     "AuthService",
+    "InventoryBackend",
+    "InventoryEngine",
+    "InventoryResult",
+    "ComputeInventoryBackend",
+    "ResourceGraphInventoryBackend",
+    "InMemoryInventoryBackend",
+    "VmssCountStrategy",
+    "DEFAULT_CONCURRENCY",
+    "ExecutionEngine",
+    "DEFAULT_CONNECTION_POOL_SIZE",
+    "RoleDefinitionCache",
+    "DEFAULT_CACHE_DIR",
+    "DEFAULT_ROLE_DEFINITION_CACHE_TTL",
+    "InventoryStore",
+    "INVENTORY_STORE_FILENAME",
+    "Identity",
+    "IdentityResolver",
+    "TokenClaimsIdentityResolver",
+    "AzureCliIdentityResolver",
+    "FallbackIdentityResolver",
+    "ThrottlingScheduler",
+    "ThrottlingStats",
+    "Telemetry",
+    "InstrumentedCredential",
+    "Prefetcher",
+    "TrafficRecorder",
+    "TrafficReplay",
+    "ReplayCredential",
 ]
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import io
+import time
+from typing import TYPE_CHECKING, override
+
+from requests import PreparedRequest, Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3 import HTTPResponse
+
+from .traffic import Exchange
+
+if TYPE_CHECKING:
+    from .traffic import TrafficRecorder, TrafficReplay
+
+# Response headers that describe the encoding of the body on the wire; bodies are recorded
+# decoded, so they no longer apply
+_TRANSFER_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class RecordingAdapter(BaseAdapter):
+    """Sends requests through another adapter, recording every request and its response"""
+
+    _adapter: HTTPAdapter
+    _recorder: TrafficRecorder
+
+    def __init__(self, adapter: HTTPAdapter, recorder: TrafficRecorder) -> None:
+        super().__init__()
+        self._adapter = adapter
+        self._recorder = recorder
+
+    @override
+    def send(
+        self,
+        request: PreparedRequest,
+        stream: bool = False,
+        timeout: float | tuple[float | None, float | None] | None = None,
+        verify: bool | str = True,
+        cert: str | tuple[str, str] | None = None,
+        proxies: dict[str, str] | None = None,
+    ) -> Response:
+        authorization = _decode(request.headers.get("Authorization"))
+        if authorization.startswith("Bearer "):
+            self._recorder.record_access_token(authorization.removeprefix("Bearer "))
+        start = time.perf_counter()
+        response = self._adapter.send(request, stream, timeout, verify, cert, proxies)
+        # Read the whole body so that it can be recorded; it stays available to the caller
+        content = response.content
+        self._recorder.record(
+            Exchange(
+                method=request.method or "GET",
+                url=request.url or "",
+                body=_decode(request.body),
+                status_code=response.status_code,
+                headers={
+                    name: value
+                    for name, value in response.headers.items()
+                    if name.lower() not in _TRANSFER_HEADERS
+                },
+                content=_decode(content),
+                seconds=time.perf_counter() - start,
+            )
+        )
+        return response
+
+    def close(self) -> None:
+        self._adapter.close()
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Answers requests with recorded responses, without sending them"""
+
+    _replay: TrafficReplay
+
+    def __init__(self, replay: TrafficReplay) -> None:
+        super().__init__()
+        self._replay = replay
+
+    @override
+    def send(
+        self,
+        request: PreparedRequest,
+        stream: bool = False,
+        timeout: float | tuple[float | None, float | None] | None = None,
+        verify: bool | str = True,
+        cert: str | tuple[str, str] | None = None,
+        proxies: dict[str, str] | None = None,
+    ) -> Response:
+        exchange = self._replay.respond(
+            request.method or "GET", request.url or "", _decode(request.body)
+        )
+        time.sleep(exchange.seconds if self._replay.latency is None else self._replay.latency)
+        raw = HTTPResponse(
+            body=io.BytesIO(exchange.content.encode()),
+            headers=exchange.headers,
+            status=exchange.status_code,
+            preload_content=False,
+            decode_content=False,
+        )
+        return self.build_response(request, raw)
+
+
+def _decode(body: object) -> str:
+    """
+    Decode a header or body as text; streamed bodies, which the management clients never send,
+    are recorded as empty
+    """
+    if isinstance(body, bytes):
+        return body.decode("utf-8", errors="replace")
+    if isinstance(body, str):
+        return body
+    return ""
@@ -0,0 +1,17 @@
+from ..telemetry import AsyncInstrumentedCredential
+from .auth import AsyncAuthService
+from .azure import AsyncAzureClientFactory
+from .inventory import AsyncComputeInventoryBackend, AsyncInventoryBackend, ThreadedInventoryBackend
+from .quota import AsyncQuotaService
+from .subscriptions import AsyncSubscriptionService
+
+__all__ = [
+    "AsyncAzureClientFactory",
+    "AsyncSubscriptionService",
+    "AsyncQuotaService",
+    "AsyncAuthService",
+    "AsyncInventoryBackend",
+    "AsyncComputeInventoryBackend",
+    "ThreadedInventoryBackend",
+    "AsyncInstrumentedCredential",
+]
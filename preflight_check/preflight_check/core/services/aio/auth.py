@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING
+
+from preflight_check import log
+from preflight_check.core import models
+
+from ..auth import (
+    AuthService,
+    get_management_group_descendants_request,
+    group_assigned_roles_by_scope,
+    read_management_group_descendants_page,
+)
+from ..concurrency import DEFAULT_CONCURRENCY, gather_concurrently
+
+if TYPE_CHECKING:
+    from azure.core.rest import AsyncHttpResponse
+    from azure.mgmt.authorization.v2022_04_01.models import RoleDefinition
+
+    from .azure import AsyncAzureClientFactory, AuthorizationManagementClient
+
+
+class AsyncAuthService:
+    """
+    Lists the roles of the authenticated principal on the running event loop.
+
+    The principal, the role caches and the conversion of role assignments to assigned roles are
+    those of an AuthService, so roles collected by either service are shared with the other.
+    """
+
+    _auth: AuthService
+    _azure_client_factory: AsyncAzureClientFactory
+    _concurrency: int
+    """
+    Map from role definition ID to the task fetching it, so that concurrent lookups of the
+    same ID on the event loop share one request
+    """
+    _pending_role_definitions: dict[str, asyncio.Task[RoleDefinition]]
+
+    def __init__(
+        self,
+        auth: AuthService,
+        azure_client_factory: AsyncAzureClientFactory,
+        concurrency: int = DEFAULT_CONCURRENCY,
+    ) -> None:
+        """
+        Args:
+            auth: Service whose principal and role caches are used
+            azure_client_factory: Factory for the async Azure clients used by the service
+            concurrency: Maximum number of scopes whose role assignments are listed at once
+        """
+        self._auth = auth
+        self._azure_client_factory = azure_client_factory
+        self._concurrency = concurrency
+        self._pending_role_definitions = {}
+
+    async def get_all_assigned_roles(
+        self,
+        subscriptions: list[models.Subscription],
+        include_root_management_group: bool = True,
+    ) -> dict[str, list[models.AssignedRole]]:
+        """
+        Lists all roles that the authenticated principal has for a list of subscriptions,
+        as AuthService.get_all_assigned_roles does.
+        """
+        if include_root_management_group:
+            assigned_roles = await self._get_assigned_roles_in_tenant(subscriptions)
+        else:
+            assigned_roles = await self._get_assigned_roles_for_subscriptions(subscriptions)
+        log.debug(f"Assigned roles: {assigned_roles}")
+        return assigned_roles
+
+    async def _get_assigned_roles_for_subscriptions(
+        self, subscriptions: list[models.Subscription]
+    ) -> dict[str, list[models.AssignedRole]]:
+        """
+        Lists the roles that the authenticated principal has for each of a list of
+        subscriptions, one subscription at a time.
+        """
+        results = await gather_concurrently(
+            lambda subscription: self._get_assigned_roles_for_scope(
+                subscription.id,
+                f"/subscriptions/{subscription.id}",
+                f"assignedTo('{self._auth.principal_id}')",
+            ),
+            subscriptions,
+            self._concurrency,
+        )
+        assigned_roles = {}
+        for result in results:
+            if result.error is not None:
+                raise RuntimeError(
+                    f"Failed to get role assignments for subscription {result.item.id}: "
+                    f"{str(result.error)}"
+                ) from result.error
+            assigned_roles[result.item.id] = result.result or []
+        return assigned_roles
+
+    async def _get_assigned_roles_in_tenant(
+        self, subscriptions: list[models.Subscription]
+    ) -> dict[str, list[models.AssignedRole]]:
+        """
+        Lists the roles that the authenticated principal has anywhere in the tenant and groups
+        them by the subscriptions, and the root management group, they apply to.
+        """
+        root_management_group_id = self._auth.get_root_management_group_id()
+        try:
+            assigned_roles, parents = await asyncio.gather(
+                self._get_assigned_roles_for_scope(
+                    subscriptions[0].id,
+                    root_management_group_id,
+                    f"principalId eq '{self._auth.principal_id}'",
+                ),
+                self._list_management_group_parents(root_management_group_id),
+            )
+        except Exception as e:
+            raise RuntimeError(
+                f"Failed to get role assignments for scope {root_management_group_id}: {str(e)}"
+            ) from e
+        return group_assigned_roles_by_scope(
+            assigned_roles,
+            [subscription.id for subscription in subscriptions],
+            root_management_group_id,
+            parents,
+        )
+
+    async def _get_assigned_roles_for_scope(
+        self,
+        subscription_id: str,
+        scope: str,
+        filter: str,
+    ) -> list[models.AssignedRole]:
+        """
+        Lists the role assignments of the authenticated principal that match a filter on a
+        scope.
+        """
+        role_assignments = [
+            role_assignment
+            async for role_assignment in self._auth_client(
+                subscription_id
+            ).role_assignments.list_for_scope(scope, filter=filter)
+        ]
+        role_definitions = await asyncio.gather(
+            *(
+                self._get_role_definition(subscription_id, role_assignment.role_definition_id)
+                for role_assignment in role_assignments
+            )
+        )
+        return [
+            self._auth.create_assigned_role(role_assignment, role_definition)
+            for role_assignment, role_definition in zip(
+                role_assignments, role_definitions, strict=True
+            )
+        ]
+
+    async def _list_management_group_parents(self, management_group_id: str) -> dict[str, str]:
+        """List the parent of every management group and subscription below a management group"""
+        from azure.core.async_paging import AsyncItemPaged, AsyncList
+        from azure.core.exceptions import HttpResponseError
+        from azure.mgmt.core.exceptions import ARMErrorFormat
+
+        arm_client = self._azure_client_factory.get_arm_client()
+
+        async def get_next(next_link: str | None) -> AsyncHttpResponse:
+            response: AsyncHttpResponse = await arm_client.send_request(
+                get_management_group_descendants_request(
+                    arm_client.format_url, management_group_id, next_link
+                )
+            )
+            if response.status_code != 200:
+                raise HttpResponseError(response=response, error_format=ARMErrorFormat)
+            return response
+
+        async def extract_data(
+            response: AsyncHttpResponse,
+        ) -> tuple[str | None, AsyncIterator[tuple[str, str]]]:
+            next_link, descendants = read_management_group_descendants_page(response.json())
+            return next_link, AsyncList(descendants)
+
+        descendants: AsyncItemPaged[tuple[str, str]] = AsyncItemPaged(get_next, extract_data)
+        return {descendant: parent async for descendant, parent in descendants}
+
+    async def _get_role_definition(
+        self, subscription_id: str, role_definition_id: str
+    ) -> RoleDefinition:
+        """
+        Get a role definition by ID; each role definition is only fetched once.
+        """
+        role_definition = self._auth.get_fetched_role_definition(role_definition_id)
+        if role_definition is not None:
+            return role_definition
+        task = self._pending_role_definitions.get(role_definition_id)
+        if task is None:
+            task = asyncio.create_task(
+                self._fetch_role_definition(subscription_id, role_definition_id)
+            )
+            self._pending_role_definitions[role_definition_id] = task
+        return await task
+
+    async def _fetch_role_definition(
+        self, subscription_id: str, role_definition_id: str
+    ) -> RoleDefinition:
+        """
+        Get a role definition from the on-disk cache, or fetch it, and add it to the role
+        definitions of the AuthService.
+        """
+        try:
+            # The on-disk cache reads and writes files, which would block the event loop
+            role_definition = await asyncio.to_thread(
+                self._auth.load_role_definition, role_definition_id
+            )
+            if role_definition is None:
+                role_definition = await self._auth_client(
+                    subscription_id
+                ).role_definitions.get_by_id(role_definition_id)
+                await asyncio.to_thread(self._auth.store_role_definition, role_definition)
+        finally:
+            # Failed lookups are forgotten so a later call can retry them
+            del self._pending_role_definitions[role_definition_id]
+        self._auth.add_fetched_role_definition(role_definition_id, role_definition)
+        return role_definition
+
+    def _auth_client(self, subscription_id: str) -> AuthorizationManagementClient:
+        return self._azure_client_factory.get_auth_client(subscription_id)
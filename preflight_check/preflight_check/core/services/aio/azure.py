@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Self
+
+from ..azure import (
+    ARM_ENDPOINT,
+    DEFAULT_CONNECTION_POOL_SIZE,
+    DEFAULT_MAX_CACHED_CLIENTS,
+    ClientCache,
+)
+from ..identity import ARM_TOKEN_SCOPE
+from ..telemetry import Telemetry
+from ..throttling import ThrottlingScheduler
+
+if TYPE_CHECKING:
+    from types import TracebackType
+
+    from aiohttp import ClientSession
+    from azure.core.credentials_async import AsyncTokenCredential
+    from azure.mgmt.authorization.aio import AuthorizationManagementClient
+    from azure.mgmt.compute.aio import ComputeManagementClient
+    from azure.mgmt.core import AsyncARMPipelineClient
+    from azure.mgmt.network.aio import NetworkManagementClient
+
+
+class AsyncAzureClientFactory:
+    """
+    Factory for asyncio Azure clients
+
+    All clients send their requests through one shared aiohttp session. The session is bound
+    to the event loop that creates it, so the factory must be created, used and closed on a
+    single event loop; use it as an async context manager.
+    """
+
+    credential: AsyncTokenCredential
+    """Schedules the requests of every client"""
+    throttling: ThrottlingScheduler
+    """Records the calls of every client"""
+    telemetry: Telemetry
+    _connection_pool_size: int
+    _session: ClientSession | None
+    _network_clients: ClientCache[NetworkManagementClient]
+    _compute_clients: ClientCache[ComputeManagementClient]
+    _auth_clients: ClientCache[AuthorizationManagementClient]
+    _arm_client: AsyncARMPipelineClient | None
+
+    def __init__(
+        self,
+        credential: AsyncTokenCredential,
+        connection_pool_size: int = DEFAULT_CONNECTION_POOL_SIZE,
+        max_cached_clients: int = DEFAULT_MAX_CACHED_CLIENTS,
+        throttling: ThrottlingScheduler | None = None,
+        telemetry: Telemetry | None = None,
+    ) -> None:
+        """
+        Args:
+            credential: Async credential used by every client
+            connection_pool_size: Maximum number of connections kept open to each Azure host
+            max_cached_clients: Maximum number of clients of each kind kept for reuse
+            throttling: Scheduler that adapts request concurrency to Azure Resource Manager
+                throttling, which may be shared with a blocking factory; defaults to a
+                scheduler of its own
+            telemetry: Records the calls of every client, which may be shared with a blocking
+                factory; defaults to a telemetry of its own
+        """
+        self.credential = credential
+        self.throttling = throttling or ThrottlingScheduler()
+        self.telemetry = telemetry or Telemetry()
+        self._connection_pool_size = connection_pool_size
+        self._session = None
+        self._network_clients = ClientCache(max_cached_clients)
+        self._compute_clients = ClientCache(max_cached_clients)
+        self._auth_clients = ClientCache(max_cached_clients)
+        self._arm_client = None
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+    def get_compute_client(self, subscription_id: str) -> ComputeManagementClient:
+        def create() -> ComputeManagementClient:
+            from azure.mgmt.compute.aio import ComputeManagementClient
+
+            return ComputeManagementClient(
+                self.credential, subscription_id, **self._client_options()
+            )
+
+        return self._compute_clients.get(subscription_id, create)
+
+    def get_network_client(self, subscription_id: str) -> NetworkManagementClient:
+        def create() -> NetworkManagementClient:
+            from azure.mgmt.network.aio import NetworkManagementClient
+
+            return NetworkManagementClient(
+                self.credential, subscription_id, **self._client_options()
+            )
+
+        return self._network_clients.get(subscription_id, create)
+
+    def get_auth_client(self, subscription_id: str) -> AuthorizationManagementClient:
+        def create() -> AuthorizationManagementClient:
+            from azure.mgmt.authorization.aio import AuthorizationManagementClient
+
+            return AuthorizationManagementClient(
+                self.credential, subscription_id, **self._client_options()
+            )
+
+        return self._auth_clients.get(subscription_id, create)
+
+    def get_arm_client(self) -> AsyncARMPipelineClient:
+        """
+        Get a client for raw Azure Resource Manager requests, like
+        AzureClientFactory.get_arm_client; it sends its requests through the shared session.
+        """
+        if self._arm_client is None:
+            from azure.core.pipeline.policies import (
+                AsyncRetryPolicy,
+                HeadersPolicy,
+                RequestIdPolicy,
+                UserAgentPolicy,
+            )
+            from azure.mgmt.core import AsyncARMPipelineClient
+            from azure.mgmt.core.policies import (
+                ARMHttpLoggingPolicy,
+                AsyncARMChallengeAuthenticationPolicy,
+            )
+
+            options = self._client_options()
+            self._arm_client = AsyncARMPipelineClient(
+                base_url=ARM_ENDPOINT,
+                policies=[
+                    RequestIdPolicy(),
+                    HeadersPolicy(),
+                    UserAgentPolicy("preflight-check"),
+                    AsyncRetryPolicy(),
+                    *options["per_retry_policies"],
+                    AsyncARMChallengeAuthenticationPolicy(self.credential, ARM_TOKEN_SCOPE),
+                    ARMHttpLoggingPolicy(),
+                ],
+                transport=options["transport"],
+            )
+        return self._arm_client
+
+    def _client_options(self) -> dict[str, Any]:
+        """
+        Options for a new client: a transport that sends its requests through the shared
+        session, and the throttling and telemetry policies
+        """
+        from azure.core.pipeline.transport import AioHttpTransport
+
+        from ..policies import AsyncTelemetryPolicy, AsyncThrottlingPolicy
+
+        return {
+            "transport": AioHttpTransport(session=self._get_session(), session_owner=False),
+            "per_retry_policies": [
+                AsyncThrottlingPolicy(self.throttling),
+                AsyncTelemetryPolicy(self.telemetry),
+            ],
+        }
+
+    def _get_session(self) -> ClientSession:
+        """Get the session shared by all clients, creating it on first use"""
+        if self._session is None:
+            import aiohttp
+
+            # Same settings as the sessions the Azure SDK creates itself, which decompresses
+            # responses on its own
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self._connection_pool_size),
+                cookie_jar=aiohttp.DummyCookieJar(),
+                auto_decompress=False,
+                trust_env=True,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the shared session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterable, AsyncIterator
+from dataclasses import replace
+from typing import TYPE_CHECKING
+
+from preflight_check import log
+
+from ..concurrency import DEFAULT_CONCURRENCY, gather_concurrently
+from ..inventory import (
+    DEFAULT_SHARD_THRESHOLD,
+    InventoryBackend,
+    InventoryResult,
+    ListedKind,
+    ListedResource,
+    ListingShard,
+    ShardedInventory,
+    ShardSummary,
+    VmssCountStrategy,
+    VmSummary,
+    get_locations_request,
+    get_scale_set_resource_group_and_name,
+    get_vm_listing_request,
+    normalize_regions,
+    read_physical_locations,
+    read_vm_listing_page,
+    summarize_shard,
+)
+
+if TYPE_CHECKING:
+    from azure.core.async_paging import AsyncItemPaged
+    from azure.core.rest import AsyncHttpResponse
+    from azure.mgmt.compute.models import VirtualMachineScaleSet
+    from azure.mgmt.core import AsyncARMPipelineClient
+
+    from .azure import AsyncAzureClientFactory, ComputeManagementClient
+
+
+class AsyncInventoryBackend(ABC):
+    """
+    Counts the VMs, including scale set instances, in each region of a set of subscriptions
+    on the running event loop
+    """
+
+    @abstractmethod
+    async def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        """
+        Count VMs in each region of each subscription.
+
+        Args:
+            subscription_ids: IDs of the subscriptions to count VMs in
+            regions: Names of the only regions to count VMs in; all regions if None
+
+        Returns:
+            VM counts for every subscription that could be counted, and the error for every
+            subscription that could not
+        """
+        pass
+
+
+class AsyncComputeInventoryBackend(AsyncInventoryBackend):
+    """
+    Counts VMs by listing them with the async compute API of each subscription, in the same
+    flat fan-out as ComputeInventoryBackend
+    """
+
+    _azure_client_factory: AsyncAzureClientFactory
+    _concurrency: int
+    _vmss_count_strategy: VmssCountStrategy
+    _shard_threshold: int
+    """Listings of whole subscriptions found to reach the shard threshold on an earlier count"""
+    _sharded_listings: set[ListingShard]
+
+    def __init__(
+        self,
+        azure_client_factory: AsyncAzureClientFactory,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        vmss_count_strategy: VmssCountStrategy = VmssCountStrategy.CAPACITY,
+        shard_threshold: int = DEFAULT_SHARD_THRESHOLD,
+    ) -> None:
+        """
+        Args:
+            azure_client_factory: Factory for the async clients of each subscription
+            concurrency: Maximum number of listings, of subscriptions, locations or scale set
+                instances, run at once across all subscriptions
+            vmss_count_strategy: How scale set instances are counted
+            shard_threshold: Number of VMs or scale sets in a subscription beyond which they
+                are listed one location at a time, concurrently
+        """
+        self._azure_client_factory = azure_client_factory
+        self._concurrency = concurrency
+        self._vmss_count_strategy = vmss_count_strategy
+        self._shard_threshold = shard_threshold
+        self._sharded_listings = set()
+
+    async def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        inventory = ShardedInventory(subscription_ids)
+        regions = normalize_regions(regions)
+        if regions is None:
+            shards = await self._list_whole_subscriptions(subscription_ids, inventory)
+        else:
+            shards = [
+                ListingShard(subscription_id, kind, region)
+                for subscription_id in subscription_ids
+                for kind in ListedKind
+                for region in regions
+            ]
+        for task in await gather_concurrently(self._list_shard, shards, self._concurrency):
+            inventory.add(task.item.subscription_id, task.result, task.error)
+        await self._count_scale_set_instances(inventory)
+        return inventory.get_result()
+
+    async def _list_whole_subscriptions(
+        self, subscription_ids: list[str], inventory: ShardedInventory
+    ) -> list[ListingShard]:
+        """
+        List the resources of each kind in each subscription as a whole, up to the shard
+        threshold, like ComputeInventoryBackend does.
+
+        Returns:
+            The location shards of the listings that reached the threshold
+        """
+        listings = [
+            ListingShard(subscription_id, kind)
+            for subscription_id in subscription_ids
+            for kind in ListedKind
+        ]
+        sharded = [listing for listing in listings if listing in self._sharded_listings]
+        for task in await gather_concurrently(
+            self._list_until_threshold,
+            [listing for listing in listings if listing not in self._sharded_listings],
+            self._concurrency,
+        ):
+            listing, resources = task.item, task.result or []
+            if task.error is not None:
+                inventory.add(listing.subscription_id, error=task.error)
+                continue
+            inventory.add(
+                listing.subscription_id,
+                summarize_shard(listing.kind, resources, self._vmss_count_strategy),
+            )
+            if len(resources) >= self._shard_threshold:
+                self._sharded_listings.add(listing)
+                sharded.append(
+                    replace(listing, listed_ids=frozenset(resource.id for resource in resources))
+                )
+
+        subscription_locations: dict[str, list[str]] = {}
+        for located in await gather_concurrently(
+            self._list_locations,
+            sorted({listing.subscription_id for listing in sharded}),
+            self._concurrency,
+        ):
+            if located.error is not None:
+                inventory.add(located.item, error=located.error)
+                continue
+            subscription_locations[located.item] = located.result or []
+            log.debug(
+                f"Subscription {located.item} has at least {self._shard_threshold} resources of "
+                f"one kind; listing its {len(subscription_locations[located.item])} locations "
+                "concurrently"
+            )
+        return [
+            replace(listing, location=location)
+            for listing in sharded
+            for location in subscription_locations.get(listing.subscription_id, [])
+        ]
+
+    async def _list_until_threshold(self, listing: ListingShard) -> list[ListedResource]:
+        """List the resources of a shard, stopping at the shard threshold"""
+        # Leaving the listing once the threshold is reached fetches no further pages
+        resources: list[ListedResource] = []
+        async for resource in self._list(listing):
+            resources.append(resource)
+            if len(resources) == self._shard_threshold:
+                break
+        return resources
+
+    async def _list_shard(self, listing: ListingShard) -> ShardSummary:
+        """List and summarize the resources of a shard, skipping the IDs already listed"""
+        return summarize_shard(
+            listing.kind,
+            [
+                resource
+                async for resource in self._list(listing)
+                if resource.id not in listing.listed_ids
+            ],
+            self._vmss_count_strategy,
+        )
+
+    def _list(self, listing: ListingShard) -> AsyncIterable[ListedResource]:
+        """Start the listing of the resources of a shard"""
+        if listing.kind == ListedKind.VIRTUAL_MACHINES:
+            return _list_vm_summaries(
+                self._azure_client_factory.get_arm_client(),
+                listing.subscription_id,
+                listing.location,
+            )
+        scale_sets = self._compute_client(listing.subscription_id).virtual_machine_scale_sets
+        if listing.location is None:
+            return scale_sets.list_all()
+        return scale_sets.list_by_location(listing.location)
+
+    async def _count_scale_set_instances(self, inventory: ShardedInventory) -> None:
+        """List the instances of the scale sets left to count, across all subscriptions at once"""
+
+        async def count_instances(item: tuple[str, VirtualMachineScaleSet]) -> ShardSummary:
+            subscription_id, vmss = item
+            compute_client = self._compute_client(subscription_id)
+            count = 0
+            async for _ in compute_client.virtual_machine_scale_set_vms.list(
+                *get_scale_set_resource_group_and_name(vmss)
+            ):
+                count += 1
+            return ShardSummary(vm_counts={vmss.location.lower(): count})
+
+        for task in await gather_concurrently(
+            count_instances, inventory.get_uncounted_scale_sets(), self._concurrency
+        ):
+            inventory.add(task.item[0], task.result, task.error)
+
+    async def _list_locations(self, subscription_id: str) -> list[str]:
+        """List the physical locations available to a subscription, that resources can be in"""
+        from azure.core.exceptions import HttpResponseError
+        from azure.mgmt.core.exceptions import ARMErrorFormat
+
+        arm_client = self._azure_client_factory.get_arm_client()
+        response = await arm_client.send_request(
+            get_locations_request(arm_client.format_url, subscription_id)
+        )
+        if response.status_code != 200:
+            raise HttpResponseError(response=response, error_format=ARMErrorFormat)
+        return read_physical_locations(response.json())
+
+    def _compute_client(self, subscription_id: str) -> ComputeManagementClient:
+        return self._azure_client_factory.get_compute_client(subscription_id)
+
+
+def _list_vm_summaries(
+    arm_client: AsyncARMPipelineClient, subscription_id: str, location: str | None = None
+) -> AsyncItemPaged[VmSummary]:
+    """
+    List the VMs of a subscription, or of one of its locations, from the raw JSON pages, as
+    the blocking compute engine does, instead of deserializing full VirtualMachine models
+    """
+    from azure.core.async_paging import AsyncItemPaged, AsyncList
+    from azure.core.exceptions import HttpResponseError
+    from azure.mgmt.core.exceptions import ARMErrorFormat
+
+    async def get_next(next_link: str | None) -> AsyncHttpResponse:
+        response: AsyncHttpResponse = await arm_client.send_request(
+            get_vm_listing_request(arm_client.format_url, subscription_id, location, next_link)
+        )
+        if response.status_code != 200:
+            raise HttpResponseError(response=response, error_format=ARMErrorFormat)
+        return response
+
+    async def extract_data(
+        response: AsyncHttpResponse,
+    ) -> tuple[str | None, AsyncIterator[VmSummary]]:
+        next_link, vms = read_vm_listing_page(response.json())
+        return next_link, AsyncList(vms)
+
+    return AsyncItemPaged(get_next, extract_data)
+
+
+class ThreadedInventoryBackend(AsyncInventoryBackend):
+    """
+    Runs a blocking inventory backend in a worker thread, for backends without an async
+    counterpart such as the Resource Graph backend, whose few large queries gain little from
+    the event loop
+    """
+
+    _backend: InventoryBackend
+
+    def __init__(self, backend: InventoryBackend) -> None:
+        self._backend = backend
+
+    async def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        return await asyncio.to_thread(self._backend.count_vms, subscription_ids, regions)
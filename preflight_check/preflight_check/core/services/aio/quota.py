@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+
+from ...models.quota import UsageQuotaLimit
+from ..concurrency import DEFAULT_CONCURRENCY, gather_concurrently
+from ..quota import (
+    QUOTA_PROVIDERS,
+    QuotaCache,
+    get_stored_quotas,
+    merge_provider_quotas,
+    put_stored_quotas,
+    raise_for_failed_regions,
+    to_usage_quota_limit,
+)
+from ..store import InventoryStore
+
+if TYPE_CHECKING:
+    from azure.core.async_paging import AsyncItemPaged
+    from azure.mgmt.compute.models import Usage as ComputeUsage
+    from azure.mgmt.network.models import Usage as NetworkUsage
+
+    from .azure import AsyncAzureClientFactory
+
+
+class AsyncQuotaService:
+    """Handles all interactions with Azure Usage Quotas on an event loop"""
+
+    _azure_client_factory: AsyncAzureClientFactory
+    _concurrency: int
+    _inventory_store: InventoryStore | None
+    # Cache of quotas for each subscription and region; given the cache of a QuotaService, quotas
+    # collected on the event loop are not fetched again by the blocking service
+    _quota_cache: QuotaCache
+
+    def __init__(
+        self,
+        azure_client_factory: AsyncAzureClientFactory,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        inventory_store: InventoryStore | None = None,
+        quota_cache: QuotaCache | None = None,
+    ) -> None:
+        self._azure_client_factory = azure_client_factory
+        self._concurrency = concurrency
+        self._inventory_store = inventory_store
+        self._quota_cache = quota_cache or QuotaCache()
+
+    async def get_quota_limits_for_regions(
+        self, subscription_id: str, regions: list[str]
+    ) -> dict[str, dict[str, UsageQuotaLimit]]:
+        """
+        Get and cache compute and network usage quota limits for a subscription in several
+        regions, as QuotaService.get_quota_limits_for_regions does.
+
+        Args:
+            subscription_id: Subscription to get quotas for
+            regions: Regions to get quotas for
+
+        Returns:
+            Dict of region to a dict of quota name to quota check
+        """
+        quota_limits = {
+            region: quotas
+            for region in dict.fromkeys(regions)
+            if (quotas := self._quota_cache.get(subscription_id, region)) is not None
+        }
+        uncached_regions = [
+            region for region in dict.fromkeys(regions) if region not in quota_limits
+        ]
+        # The inventory store reads and writes SQLite, which would block the event loop
+        stored_quotas = await asyncio.to_thread(
+            get_stored_quotas, self._inventory_store, subscription_id, uncached_regions
+        )
+        for region, quotas in stored_quotas.items():
+            self._quota_cache.put(subscription_id, region, quotas)
+            quota_limits[region] = quotas
+        uncached_regions = [region for region in uncached_regions if region not in stored_quotas]
+        results = await gather_concurrently(
+            lambda request: self._list_usages(subscription_id, *request),
+            [(region, provider) for region in uncached_regions for provider in QUOTA_PROVIDERS],
+            self._concurrency,
+        )
+        region_quotas = merge_provider_quotas(results)
+        for region, quotas in region_quotas.quotas.items():
+            self._quota_cache.put(subscription_id, region, quotas)
+            quota_limits[region] = quotas
+        await asyncio.to_thread(
+            put_stored_quotas, self._inventory_store, subscription_id, region_quotas.quotas
+        )
+        raise_for_failed_regions(subscription_id, region_quotas)
+        return {region: quota_limits[region] for region in regions}
+
+    async def _list_usages(
+        self, subscription_id: str, region: str, provider: str
+    ) -> list[UsageQuotaLimit]:
+        """List the usage quota limits of a single resource provider in a region"""
+        usages: AsyncItemPaged[ComputeUsage] | AsyncItemPaged[NetworkUsage]
+        if provider == "compute":
+            usages = self._azure_client_factory.get_compute_client(subscription_id).usage.list(
+                region
+            )
+        else:
+            usages = self._azure_client_factory.get_network_client(subscription_id).usages.list(
+                region
+            )
+        return [to_usage_quota_limit(usage) async for usage in usages]
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+
+from ... import models
+from ..store import InventoryStore
+from ..subscriptions import apply_inventory_result, get_stored_vm_counts
+from .inventory import AsyncInventoryBackend
+
+
+class AsyncSubscriptionService:
+    """
+    Counts the VMs of subscriptions on the running event loop.
+
+    Subscriptions are listed once, by SubscriptionService, before any event loop is started;
+    this service only takes over the per subscription enumeration, which is where the requests
+    are.
+    """
+
+    _inventory: AsyncInventoryBackend
+    _inventory_store: InventoryStore | None
+
+    def __init__(
+        self,
+        inventory_backend: AsyncInventoryBackend,
+        inventory_store: InventoryStore | None = None,
+    ) -> None:
+        """
+        Args:
+            inventory_backend: Backend used to count VMs
+            inventory_store: Local store that fresh enough VM counts are served from, and
+                counted ones are written to
+        """
+        self._inventory = inventory_backend
+        self._inventory_store = inventory_store
+
+    async def get_subscriptions_vms(
+        self, subscriptions: list[models.Subscription], regions: list[str] | None = None
+    ) -> dict[str, Exception]:
+        """
+        Count VMs in each region for several subscriptions, as
+        SubscriptionService.get_subscriptions_vms does.
+
+        Args:
+            subscriptions: The subscriptions to enumerate
+            regions: Names of the only regions to count VMs in; all regions if None
+
+        Returns:
+            Map from subscription ID to the error raised while enumerating it, for each
+            subscription that could not be enumerated
+        """
+        # The inventory store reads and writes SQLite, which would block the event loop
+        stored_vm_counts = await asyncio.to_thread(
+            get_stored_vm_counts, self._inventory_store, subscriptions, regions
+        )
+        inventory = await self._inventory.count_vms(
+            [sub.id for sub in subscriptions if sub.id not in stored_vm_counts], regions
+        )
+        return await asyncio.to_thread(
+            apply_inventory_result,
+            self._inventory_store,
+            subscriptions,
+            stored_vm_counts,
+            inventory,
+            regions,
+        )
@@ -1,14 +1,30 @@
-import asyncio
-import json
-import subprocess
+from __future__ import annotations
 
-from azure.mgmt.authorization.v2022_04_01.models import RoleAssignment, RoleDefinition
-from msgraph import GraphServiceClient
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, TypeVar
 
 from preflight_check import log
 from preflight_check.core import models
 
-from .azure import AuthorizationManagementClient, AzureClientFactory
+from .cache import RoleDefinitionCache
+from .concurrency import DEFAULT_CONCURRENCY, map_concurrently
+from .identity import IdentityResolver, default_identity_resolver
+from .paging import prefetch_pages
+
+if TYPE_CHECKING:
+    from azure.core.rest import HttpRequest, HttpResponse
+    from azure.mgmt.authorization.v2022_04_01.models import RoleAssignment, RoleDefinition
+    from azure.mgmt.core import ARMPipelineClient
+
+    from .azure import AuthorizationManagementClient, AzureClientFactory
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+# API version of the raw management group descendants listing
+MANAGEMENT_GROUP_DESCENDANTS_API_VERSION = "2020-05-01"
 
 
 class AuthService:
@@ -17,16 +33,66 @@ class AuthService:
     _azure_client_factory: AzureClientFactory
     _principal_id: str
     _tenant_id: str
+    _concurrency: int
+    _role_definition_cache: RoleDefinitionCache | None
+    """
+    Map from scope to the roles assigned to the principal on it; holds a pending future while
+    the scope is being listed, so that a prefetch and the later check share one listing
+    """
+    _scope_roles: dict[str, Future[list[models.AssignedRole]]]
+    """
+    Map from management group ID to the parents of the management groups and subscriptions
+    below it, shared by a prefetch and the later check in the same way
+    """
+    _management_group_parents: dict[str, Future[dict[str, str]]]
 
-    """Map from role definition ID to role definition"""
-    _role_definitions: dict[str, RoleDefinition] = {}
+    """
+    Map from role definition ID to role definition; holds a pending future while the
+    definition is being fetched so that concurrent lookups of the same ID share one request
+    """
+    _role_definitions: dict[str, Future[RoleDefinition]] = {}
     """Map from role definition ID to role permissions"""
     _role_permissions: dict[str, models.RolePermissions] = {}
+    """
+    Map from role assignment ID to assigned role; assignments inherited from a management group
+    are listed for every subscription beneath it and share one assigned role
+    """
+    _assigned_roles: dict[str, models.AssignedRole] = {}
+    """Guards the role definition, role permission and assigned role caches"""
+    _role_cache_lock = threading.Lock()
 
-    def __init__(self, azure_client_factory: AzureClientFactory) -> None:
+    def __init__(
+        self,
+        azure_client_factory: AzureClientFactory,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        role_definition_cache: RoleDefinitionCache | None = None,
+        identity_resolver: IdentityResolver | None = None,
+    ) -> None:
+        """
+        Args:
+            azure_client_factory: Factory for the Azure clients used by the service
+            concurrency: Maximum number of scopes whose role assignments are listed in parallel
+            role_definition_cache: On-disk cache of built-in role definitions
+            identity_resolver: Resolves the authenticated principal; defaults to reading the
+                claims of an access token, falling back to the Azure CLI
+        """
         self._azure_client_factory = azure_client_factory
-        self._principal_id, self._tenant_id = asyncio.run(
-            self._get_principal_and_tenant_id())
+        self._concurrency = concurrency
+        self._role_definition_cache = role_definition_cache
+        self._scope_roles = {}
+        self._management_group_parents = {}
+        identity = (identity_resolver or default_identity_resolver(azure_client_factory)).resolve()
+        self._principal_id, self._tenant_id = identity.principal_id, identity.tenant_id
+
+    @property
+    def principal_id(self) -> str:
+        """ID of the authenticated principal"""
+        return self._principal_id
+
+    @property
+    def tenant_id(self) -> str:
+        """ID of the tenant the principal is authenticated in"""
+        return self._tenant_id
 
     def get_all_assigned_roles(
         self,
@@ -35,15 +101,15 @@ class AuthService:
     ) -> dict[str, list[models.AssignedRole]]:
         """
         Lists all roles that the authenticated principal has for a list of subscriptions.
+
+        With the root management group, the assignments of the principal in the whole tenant
+        are listed once at the root management group and grouped by the subscriptions they
+        apply to; otherwise each subscription is listed on its own.
         """
-        assigned_roles = {}
-        for subscription in subscriptions:
-            assigned_roles[subscription.id] = self._get_assigned_roles_for_subscription(
-                subscription.id
-            )
         if include_root_management_group:
-            root_roles = self._get_assigned_roles_for_root_management_group(subscriptions[0].id)
-            assigned_roles[self.get_root_management_group_id()] = root_roles
+            assigned_roles = self._get_assigned_roles_in_tenant(subscriptions)
+        else:
+            assigned_roles = self._get_assigned_roles_for_subscriptions(subscriptions)
         log.debug(f"Assigned roles: {assigned_roles}")
         return assigned_roles
 
@@ -62,9 +128,58 @@ class AuthService:
     #     for role_assignment in role_assignments:
     #         role_definition = self._get_role_definition(
     #             subscription_id, role_assignment.role_definition_id)
-    #         assigned_roles.append(self._create_role(role_assignment, role_definition))
+    #         assigned_roles.append(self.create_assigned_role(role_assignment, role_definition))
     #     return assigned_roles
 
+    def _get_assigned_roles_for_subscriptions(
+        self, subscriptions: list[models.Subscription]
+    ) -> dict[str, list[models.AssignedRole]]:
+        """
+        Lists the roles that the authenticated principal has for each of a list of
+        subscriptions, one subscription at a time.
+        """
+        results = map_concurrently(
+            lambda subscription: self._get_assigned_roles_for_subscription(subscription.id),
+            subscriptions,
+            self._concurrency,
+        )
+        assigned_roles = {}
+        for result in results:
+            if result.error is not None:
+                raise RuntimeError(
+                    f"Failed to get role assignments for subscription {result.item.id}: "
+                    f"{str(result.error)}"
+                ) from result.error
+            assigned_roles[result.item.id] = result.result or []
+        return assigned_roles
+
+    def _get_assigned_roles_in_tenant(
+        self, subscriptions: list[models.Subscription]
+    ) -> dict[str, list[models.AssignedRole]]:
+        """
+        Lists the roles that the authenticated principal has anywhere in the tenant and groups
+        them by the subscriptions, and the root management group, they apply to.
+        """
+        root_management_group_id = self.get_root_management_group_id()
+        try:
+            # The root management group is listed through the client of the first subscription
+            assigned_roles = self._get_assigned_roles_for_scope(
+                subscriptions[0].id,
+                root_management_group_id,
+                f"principalId eq '{self._principal_id}'",
+            )
+            parents = self._get_management_group_parents(root_management_group_id)
+        except Exception as e:
+            raise RuntimeError(
+                f"Failed to get role assignments for scope {root_management_group_id}: {str(e)}"
+            ) from e
+        return group_assigned_roles_by_scope(
+            assigned_roles,
+            [subscription.id for subscription in subscriptions],
+            root_management_group_id,
+            parents,
+        )
+
     def _get_assigned_roles_for_subscription(
         self,
         subscription_id: str,
@@ -73,30 +188,41 @@ class AuthService:
         Lists the roles that the authenticated principal has for a subscription.
         """
         return self._get_assigned_roles_for_scope(
-            subscription_id, f"/subscriptions/{subscription_id}"
+            subscription_id,
+            f"/subscriptions/{subscription_id}",
+            f"assignedTo('{self._principal_id}')",
         )
 
-    def _get_assigned_roles_for_root_management_group(
-        self, subscription_id: str
+    def _get_assigned_roles_for_scope(
+        self,
+        subscription_id: str,
+        scope: str,
+        filter: str,
     ) -> list[models.AssignedRole]:
         """
-        Lists the roles that the authenticated principal has for the root management group.
+        Lists the role assignments of the authenticated principal that match a filter on a
+        scope. Safe to call from several threads; each scope is only listed once.
         """
-        return self._get_assigned_roles_for_scope(
-            subscription_id, self.get_root_management_group_id()
+        return self._load_once(
+            self._scope_roles,
+            scope,
+            lambda: self._list_assigned_roles_for_scope(subscription_id, scope, filter),
         )
 
-    def _get_assigned_roles_for_scope(
+    def _list_assigned_roles_for_scope(
         self,
         subscription_id: str,
         scope: str,
+        filter: str,
     ) -> list[models.AssignedRole]:
         """
-        Lists the roles that the authenticated principal has for a scope.
+        List the role assignments of the authenticated principal that match a filter on a
+        scope, with their role definitions.
         """
         auth_client = self._auth_client(subscription_id)
-        role_assignments = auth_client.role_assignments.list_for_scope(
-            scope, filter=f"assignedTo('{self._principal_id}')"
+        # Role definitions of the first page are fetched while the next pages are listed
+        role_assignments = prefetch_pages(
+            auth_client.role_assignments.list_for_scope(scope, filter=filter)
         )
         log.debug(f"Role assignments: {role_assignments}")
         assigned_roles = []
@@ -106,18 +232,37 @@ class AuthService:
             )
             log.debug(f"Role assignment: {role_assignment}")
             log.debug(f"Role definition: {role_definition}")
-            assigned_roles.append(self._create_role(role_assignment, role_definition))
+            assigned_roles.append(self.create_assigned_role(role_assignment, role_definition))
         return assigned_roles
 
-    def _create_role(
+    def _get_management_group_parents(self, management_group_id: str) -> dict[str, str]:
+        """
+        Get the parent of every management group and subscription below a management group.
+        Safe to call from several threads; each management group is only listed once.
+        """
+        return self._load_once(
+            self._management_group_parents,
+            management_group_id,
+            lambda: _list_management_group_parents(
+                self._azure_client_factory.get_arm_client(), management_group_id
+            ),
+        )
+
+    def create_assigned_role(
         self,
         role_assignment: RoleAssignment,
         role_definition: RoleDefinition,
     ) -> models.AssignedRole:
         """
         Create a Role object from an Azure RoleAssignment and RoleDefinition.
+        Roles created for the same role assignment are shared.
         """
-        return models.AssignedRole(
+        if role_assignment.id:
+            with self._role_cache_lock:
+                assigned_role = self._assigned_roles.get(role_assignment.id)
+            if assigned_role is not None:
+                return assigned_role
+        assigned_role = models.AssignedRole(
             id=role_assignment.role_definition_id or "",
             name=role_definition.role_name or "",
             scope=role_assignment.scope or "",
@@ -128,6 +273,10 @@ class AuthService:
             permissions=self._get_permissions_from_role_definition(role_definition),
             condition=role_assignment.condition or None,
         )
+        if role_assignment.id:
+            with self._role_cache_lock:
+                assigned_role = self._assigned_roles.setdefault(role_assignment.id, assigned_role)
+        return assigned_role
 
     def _get_permissions_from_role_definition(
         self, role_definition: RoleDefinition
@@ -141,27 +290,87 @@ class AuthService:
         if role_definition.id is None:
             raise ValueError("Role definition has no ID")
 
-        if role_definition.id not in self._role_permissions:
-            if not role_definition.permissions:
-                raise ValueError("Role definition has no permissions")
-            permissions = models.RolePermissions()
-            for permission in role_definition.permissions:
-                permissions.actions.extend(permission.actions or [])
-                permissions.not_actions.extend(permission.not_actions or [])
-                permissions.data_actions.extend(permission.data_actions or [])
-                permissions.not_data_actions.extend(permission.not_data_actions or [])
-            self._role_permissions[role_definition.id] = permissions
-        return self._role_permissions[role_definition.id]
+        with self._role_cache_lock:
+            if role_definition.id not in self._role_permissions:
+                if not role_definition.permissions:
+                    raise ValueError("Role definition has no permissions")
+                permissions = models.RolePermissions()
+                for permission in role_definition.permissions:
+                    permissions.actions.extend(permission.actions or [])
+                    permissions.not_actions.extend(permission.not_actions or [])
+                    permissions.data_actions.extend(permission.data_actions or [])
+                    permissions.not_data_actions.extend(permission.not_data_actions or [])
+                self._role_permissions[role_definition.id] = permissions
+            return self._role_permissions[role_definition.id]
 
     def _get_role_definition(self, subscription_id: str, role_definition_id: str) -> RoleDefinition:
         """
         Get a role definition by ID.
+        Safe to call from several threads; each role definition is only fetched once.
+        """
+        return self._load_once(
+            self._role_definitions,
+            role_definition_id,
+            lambda: self._get_role_definition_uncached(subscription_id, role_definition_id),
+        )
+
+    def _get_role_definition_uncached(
+        self, subscription_id: str, role_definition_id: str
+    ) -> RoleDefinition:
+        """
+        Get a role definition from the on-disk cache, or fetch it and cache it on disk if it is
+        a built-in role.
+        """
+        cached = self.load_role_definition(role_definition_id)
+        if cached is not None:
+            return cached
+        role_definition: RoleDefinition = self._auth_client(
+            subscription_id
+        ).role_definitions.get_by_id(role_definition_id)
+        self.store_role_definition(role_definition)
+        return role_definition
+
+    def get_fetched_role_definition(self, role_definition_id: str) -> RoleDefinition | None:
+        """
+        Get a role definition that was already fetched, by this or any other service, without
+        fetching it.
+        """
+        with self._role_cache_lock:
+            future = self._role_definitions.get(role_definition_id)
+        if future is None or not future.done() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def add_fetched_role_definition(
+        self, role_definition_id: str, role_definition: RoleDefinition
+    ) -> None:
+        """
+        Add a role definition fetched by another service, such as AsyncAuthService, so that it
+        is not fetched again.
+        """
+        future: Future[RoleDefinition] = Future()
+        future.set_result(role_definition)
+        with self._role_cache_lock:
+            self._role_definitions.setdefault(role_definition_id, future)
+
+    def load_role_definition(self, role_definition_id: str) -> RoleDefinition | None:
         """
-        if role_definition_id not in self._role_definitions:
-            self._role_definitions[role_definition_id] = self._auth_client(
-                subscription_id
-            ).role_definitions.get_by_id(role_definition_id)
-        return self._role_definitions[role_definition_id]
+        Get a role definition from the on-disk cache.
+
+        Returns:
+            The role definition, or None if it is not cached or there is no on-disk cache
+        """
+        if self._role_definition_cache is None:
+            return None
+        role_definition = self._role_definition_cache.get(self._tenant_id, role_definition_id)
+        if role_definition is not None:
+            log.debug(f"Using cached role definition: {role_definition_id}")
+        return role_definition
+
+    def store_role_definition(self, role_definition: RoleDefinition) -> None:
+        """Cache a role definition on disk if it is a built-in role"""
+        if self._role_definition_cache is not None:
+            self._role_definition_cache.put(self._tenant_id, role_definition)
 
     def get_root_management_group_id(self) -> str:
         """
@@ -169,64 +378,145 @@ class AuthService:
         """
         return f"/providers/Microsoft.Management/managementGroups/{self._tenant_id}"
 
-    async def _get_principal_and_tenant_id(self) -> tuple[str, str]:
+    def _load_once(self, futures: dict[K, Future[V]], key: K, load: Callable[[], V]) -> V:
         """
-        Get the principal ID of the authenticated principal.
+        Get the value of a key from a map of futures, loading it unless another thread already
+        is. Failed loads are forgotten so that a later call can retry them.
         """
-        account_show_response = subprocess.run(
-            ["az", "account", "show"], capture_output=True, text=True, check=True
-        )
-        account = json.loads(account_show_response.stdout)
-        # get the tenant ID from the account show response
-        tenant_id = account.get("tenantId")
-        if not tenant_id:
-            raise RuntimeError("No tenant ID found for user")
-        # get the principal ID
-        principal = account.get("user", {})
-        # determine if the authenticated principal is a user or service principal
-        principal_id: str = ""
-        is_service_principal = principal.get("type") == "servicePrincipal"
-        # for service principals, need to get the objectId, not just the name (appId)
-        if is_service_principal:
-            app_id = principal.get("name")
-            if not app_id:
-                raise RuntimeError(
-                    "No app ID found for service principal; response:",
-                    f"\n{account_show_response.stdout}",
-                )
-            # Get the actual principalId (objectId) for the service principal
-            log.debug(f"Getting service principal ID for name: {app_id}")
-            sp_show_response = subprocess.run(
-                ["az", "ad", "sp", "show", "--id", app_id],
-                capture_output=True,
-                text=True,
-                check=False,
-            )
-
-            # Check if the command succeeded
-            if sp_show_response.returncode == 0:
-                sp_info = json.loads(sp_show_response.stdout)
-                principal_id = sp_info.get("id")
-                log.debug(f"Service principal details: appId={app_id}, objectId={principal_id}")
-                if not principal_id:
-                    raise RuntimeError(
-                        f"No object ID found for service principal {app_id}; response:",
-                        f"\n{sp_show_response.stdout}",
-                    )
-            else:
-                raise RuntimeError(f"Failed to get service principal details for appId: {app_id}")
-        # for users, get the principal ID from the graph client
-        else:
-            principal = await self._graph_client().me.get()
-            principal_id = principal.id
-            if not principal_id:
-                raise RuntimeError("No principal ID found for user")
-
-        log.debug(f"Using principal ID: {principal_id}")
-        return principal_id, tenant_id
+        with self._role_cache_lock:
+            future = futures.get(key)
+            is_loading_thread = future is None
+            if future is None:
+                future = Future()
+                futures[key] = future
+        if is_loading_thread:
+            try:
+                future.set_result(load())
+            except Exception as e:
+                with self._role_cache_lock:
+                    del futures[key]
+                future.set_exception(e)
+        return future.result()
 
     def _auth_client(self, subscription_id: str) -> AuthorizationManagementClient:
         return self._azure_client_factory.get_auth_client(subscription_id)
 
-    def _graph_client(self) -> GraphServiceClient:
-        return self._azure_client_factory.get_graph_client()
+
+def group_assigned_roles_by_scope(
+    assigned_roles: list[models.AssignedRole],
+    subscription_ids: list[str],
+    root_management_group_id: str,
+    parents: dict[str, str],
+) -> dict[str, list[models.AssignedRole]]:
+    """
+    Group the roles assigned to the principal anywhere in a tenant by the subscriptions they
+    apply to, which are those assigned at the subscription itself or at a management group
+    above it. Roles assigned below a subscription, on its resource groups or resources, do not
+    apply to the whole subscription and are left out.
+
+    Args:
+        assigned_roles: Roles listed at the root management group of the tenant
+        subscription_ids: IDs of the subscriptions to group roles for
+        root_management_group_id: ID of the root management group of the tenant
+        parents: Map from lowercase management group or subscription ID to the lowercase ID of
+            its parent management group
+
+    Returns:
+        Map from subscription ID, and from the root management group ID, to the roles that
+        apply to it, the inherited ones first
+    """
+    roles_by_scope: dict[str, list[models.AssignedRole]] = {}
+    for role in assigned_roles:
+        roles_by_scope.setdefault(role.scope.lower(), []).append(role)
+    root = root_management_group_id.lower()
+    root_roles = [*roles_by_scope.get("/", []), *roles_by_scope.get(root, [])]
+
+    grouped_roles = {root_management_group_id: root_roles}
+    for subscription_id in subscription_ids:
+        scope = f"/subscriptions/{subscription_id}".lower()
+        # Management groups between the root management group and the subscription
+        management_groups = []
+        parent = parents.get(scope)
+        while parent is not None and parent != root and parent not in management_groups:
+            management_groups.append(parent)
+            parent = parents.get(parent)
+        grouped_roles[subscription_id] = [
+            *root_roles,
+            *(
+                role
+                for management_group in reversed(management_groups)
+                for role in roles_by_scope.get(management_group, [])
+            ),
+            *roles_by_scope.get(scope, []),
+        ]
+    return grouped_roles
+
+
+def get_management_group_descendants_request(
+    format_url: Callable[[str], str],
+    management_group_id: str,
+    next_link: str | None = None,
+) -> HttpRequest:
+    """
+    Build the request for a page of the management groups and subscriptions below a
+    management group, which both auth services send through their ARM client.
+
+    Args:
+        format_url: Turns a path into a URL of the ARM endpoint, such as the format_url method
+            of an ARM client
+        management_group_id: ID of the management group to list the descendants of
+        next_link: Link to the next page, as read from the previous page; the first page if None
+    """
+    from azure.core.rest import HttpRequest
+
+    if next_link:
+        return HttpRequest("GET", next_link)
+    return HttpRequest(
+        "GET",
+        format_url(f"{management_group_id}/descendants"),
+        params={"api-version": MANAGEMENT_GROUP_DESCENDANTS_API_VERSION},
+    )
+
+
+def read_management_group_descendants_page(
+    page: dict[str, Any],
+) -> tuple[str | None, list[tuple[str, str]]]:
+    """
+    Read a page of the descendants of a management group.
+
+    Returns:
+        Link to the next page, or None if this is the last one, and the lowercase ID of each
+        descendant with the lowercase ID of its parent management group
+    """
+    descendants = [
+        (descendant["id"].lower(), descendant["properties"]["parent"]["id"].lower())
+        for descendant in page.get("value", [])
+        if descendant.get("properties", {}).get("parent")
+    ]
+    return page.get("nextLink") or None, descendants
+
+
+def _list_management_group_parents(
+    arm_client: ARMPipelineClient, management_group_id: str
+) -> dict[str, str]:
+    """List the parent of every management group and subscription below a management group"""
+    from azure.core.exceptions import HttpResponseError
+    from azure.core.paging import ItemPaged
+    from azure.mgmt.core.exceptions import ARMErrorFormat
+
+    def get_next(next_link: str | None) -> HttpResponse:
+        response: HttpResponse = arm_client.send_request(
+            get_management_group_descendants_request(
+                arm_client.format_url, management_group_id, next_link
+            )
+        )
+        if response.status_code != 200:
+            raise HttpResponseError(response=response, error_format=ARMErrorFormat)
+        return response
+
+    def extract_data(response: HttpResponse) -> tuple[str | None, Iterator[tuple[str, str]]]:
+        next_link, descendants = read_management_group_descendants_page(response.json())
+        return next_link, iter(descendants)
+
+    return dict(ItemPaged(get_next, extract_data))
+
@@ -1,48 +1,278 @@
+from __future__ import annotations
 
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.authorization import AuthorizationManagementClient
-from azure.mgmt.compute import ComputeManagementClient
-from azure.mgmt.network import NetworkManagementClient
-from azure.mgmt.subscription import SubscriptionClient
-from msgraph import GraphServiceClient
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any, Generic, TypeVar
+
+from .identity import ARM_TOKEN_SCOPE
+from .telemetry import Telemetry
+from .throttling import ThrottlingScheduler
+from .traffic import TrafficRecorder, TrafficReplay
+
+# The Azure SDK and msgraph packages take seconds to import, so they are only imported when the
+# first client of their kind is requested; commands that never call Azure, such as --help, or
+# that fail argument validation, don't pay for them
+if TYPE_CHECKING:
+    from azure.identity import DefaultAzureCredential
+    from azure.mgmt.authorization import AuthorizationManagementClient
+    from azure.mgmt.compute import ComputeManagementClient
+    from azure.mgmt.core import ARMPipelineClient
+    from azure.mgmt.network import NetworkManagementClient
+    from azure.mgmt.resourcegraph import ResourceGraphClient
+    from azure.mgmt.subscription import SubscriptionClient
+    from msgraph import GraphServiceClient
+    from requests import Session
+
+C = TypeVar("C")
+
+# Endpoint of Azure Resource Manager, that raw requests are sent to
+ARM_ENDPOINT = "https://management.azure.com"
+# Maximum number of connections kept open to each Azure host
+DEFAULT_CONNECTION_POOL_SIZE = 16
+# Maximum number of clients of each kind kept by a factory
+DEFAULT_MAX_CACHED_CLIENTS = 256
+
+
+class ClientCache(Generic[C]):
+    """
+    Bounded cache of clients by subscription ID; the least recently used client is dropped
+    when the cache is full. Dropped clients are not closed, since they share the factory's
+    connection pool and may still be in use by another thread.
+    """
+
+    _clients: OrderedDict[str, C]
+    _max_size: int
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int = DEFAULT_MAX_CACHED_CLIENTS) -> None:
+        self._clients = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, subscription_id: str, create: Callable[[], C]) -> C:
+        """Get the client for a subscription, creating it if it is not cached"""
+        with self._lock:
+            client = self._clients.get(subscription_id)
+            if client is not None:
+                self._clients.move_to_end(subscription_id)
+                return client
+            client = create()
+            self._clients[subscription_id] = client
+            if len(self._clients) > self._max_size:
+                self._clients.popitem(last=False)
+            return client
+
+    def __len__(self) -> int:
+        return len(self._clients)
 
 
 class AzureClientFactory:
-    """Factory for Azure clients"""
+    """
+    Factory for Azure clients
+
+    All management clients send their requests through one shared connection pool, so
+    connections to management.azure.com are reused across subscriptions instead of every client
+    opening its own.
+    """
 
     credential: DefaultAzureCredential
-    principal_id: str
-    _subscription_client: SubscriptionClient
-    _graph_client: GraphServiceClient
-    _network_clients: dict[str, NetworkManagementClient] = {}
-    _compute_clients: dict[str, ComputeManagementClient] = {}
-    _auth_clients: dict[str, AuthorizationManagementClient] = {}
-
-    def __init__(self, credential: DefaultAzureCredential) -> None:
+    """Schedules the requests of every management client"""
+    throttling: ThrottlingScheduler
+    """Records the calls of every management client"""
+    telemetry: Telemetry
+    """Records or replays the requests of every management client"""
+    traffic: TrafficRecorder | TrafficReplay | None
+    _connection_pool_size: int
+    _session: Session | None
+    _subscription_client: SubscriptionClient | None
+    _graph_client: GraphServiceClient | None
+    _resource_graph_client: ResourceGraphClient | None
+    _arm_client: ARMPipelineClient | None
+    _network_clients: ClientCache[NetworkManagementClient]
+    _compute_clients: ClientCache[ComputeManagementClient]
+    _auth_clients: ClientCache[AuthorizationManagementClient]
+    # Guards the shared clients, which may be created from several worker threads
+    _lock: threading.Lock
+    # Guards the session; it is created while creating the first client of any kind, with the
+    # lock of that kind of client held
+    _session_lock: threading.Lock
+
+    def __init__(
+        self,
+        credential: DefaultAzureCredential,
+        connection_pool_size: int = DEFAULT_CONNECTION_POOL_SIZE,
+        max_cached_clients: int = DEFAULT_MAX_CACHED_CLIENTS,
+        throttling: ThrottlingScheduler | None = None,
+        telemetry: Telemetry | None = None,
+        traffic: TrafficRecorder | TrafficReplay | None = None,
+    ) -> None:
+        """
+        Args:
+            credential: Credential used by every client
+            connection_pool_size: Maximum number of connections kept open to each Azure host
+            max_cached_clients: Maximum number of clients of each kind kept for reuse
+            throttling: Scheduler that adapts request concurrency to Azure Resource Manager
+                throttling; defaults to a scheduler of its own
+            telemetry: Records the calls of every management client; defaults to a telemetry
+                of its own
+            traffic: Records the requests of the management clients and their responses, or
+                serves recorded responses instead of calling Azure
+        """
         self.credential = credential
-        self._subscription_client = SubscriptionClient(credential)
-        self._graph_client = GraphServiceClient(credential)
+        self.throttling = throttling or ThrottlingScheduler()
+        self.telemetry = telemetry or Telemetry()
+        self.traffic = traffic
+        self._connection_pool_size = connection_pool_size
+        self._session = None
+        self._subscription_client = None
+        self._graph_client = None
+        self._resource_graph_client = None
+        self._arm_client = None
+        self._network_clients = ClientCache(max_cached_clients)
+        self._compute_clients = ClientCache(max_cached_clients)
+        self._auth_clients = ClientCache(max_cached_clients)
+        self._lock = threading.Lock()
+        self._session_lock = threading.Lock()
 
     def get_subscription_client(self) -> SubscriptionClient:
-        return self._subscription_client
+        with self._lock:
+            if self._subscription_client is None:
+                from azure.mgmt.subscription import SubscriptionClient
+
+                self._subscription_client = SubscriptionClient(
+                    self.credential, **self._client_options()
+                )
+            return self._subscription_client
 
     def get_compute_client(self, subscription_id: str) -> ComputeManagementClient:
-        if subscription_id not in self._compute_clients:
-            self._compute_clients[subscription_id] = ComputeManagementClient(
-                self.credential, subscription_id)
-        return self._compute_clients[subscription_id]
+        def create() -> ComputeManagementClient:
+            from azure.mgmt.compute import ComputeManagementClient
+
+            return ComputeManagementClient(
+                self.credential, subscription_id, **self._client_options()
+            )
+
+        return self._compute_clients.get(subscription_id, create)
 
     def get_network_client(self, subscription_id: str) -> NetworkManagementClient:
-        if subscription_id not in self._network_clients:
-            self._network_clients[subscription_id] = NetworkManagementClient(
-                self.credential, subscription_id)
-        return self._network_clients[subscription_id]
+        def create() -> NetworkManagementClient:
+            from azure.mgmt.network import NetworkManagementClient
+
+            return NetworkManagementClient(
+                self.credential, subscription_id, **self._client_options()
+            )
+
+        return self._network_clients.get(subscription_id, create)
 
     def get_auth_client(self, subscription_id: str) -> AuthorizationManagementClient:
-        if subscription_id not in self._auth_clients:
-            self._auth_clients[subscription_id] = AuthorizationManagementClient(
-                self.credential, subscription_id)
-        return self._auth_clients[subscription_id]
+        def create() -> AuthorizationManagementClient:
+            from azure.mgmt.authorization import AuthorizationManagementClient
+
+            return AuthorizationManagementClient(
+                self.credential, subscription_id, **self._client_options()
+            )
+
+        return self._auth_clients.get(subscription_id, create)
 
     def get_graph_client(self) -> GraphServiceClient:
-        return self._graph_client
+        # msgraph sends its requests with httpx rather than through the shared session
+        with self._lock:
+            if self._graph_client is None:
+                from msgraph import GraphServiceClient
+
+                self._graph_client = GraphServiceClient(self.credential)
+            return self._graph_client
+
+    def get_resource_graph_client(self) -> ResourceGraphClient:
+        with self._lock:
+            if self._resource_graph_client is None:
+                from azure.mgmt.resourcegraph import ResourceGraphClient
+
+                self._resource_graph_client = ResourceGraphClient(
+                    self.credential, **self._client_options()
+                )
+            return self._resource_graph_client
+
+    def get_arm_client(self) -> ARMPipelineClient:
+        """
+        Get a client for raw Azure Resource Manager requests, for listings whose results would
+        cost more to deserialize into SDK models than the fields that are read from them. It
+        sends its requests through the shared session, with the same retry, throttling,
+        telemetry and authentication policies as the management clients.
+        """
+        with self._lock:
+            if self._arm_client is None:
+                from azure.core.pipeline.policies import (
+                    HeadersPolicy,
+                    RequestIdPolicy,
+                    RetryPolicy,
+                    UserAgentPolicy,
+                )
+                from azure.mgmt.core import ARMPipelineClient
+                from azure.mgmt.core.policies import (
+                    ARMChallengeAuthenticationPolicy,
+                    ARMHttpLoggingPolicy,
+                )
+
+                options = self._client_options()
+                self._arm_client = ARMPipelineClient(
+                    base_url=ARM_ENDPOINT,
+                    policies=[
+                        RequestIdPolicy(),
+                        HeadersPolicy(),
+                        UserAgentPolicy("preflight-check"),
+                        RetryPolicy(),
+                        *options["per_retry_policies"],
+                        ARMChallengeAuthenticationPolicy(self.credential, ARM_TOKEN_SCOPE),
+                        ARMHttpLoggingPolicy(),
+                    ],
+                    transport=options["transport"],
+                )
+            return self._arm_client
+
+    def _client_options(self) -> dict[str, Any]:
+        """
+        Options for a new management client: a transport that sends its requests through the
+        shared session, and the throttling and telemetry policies. The factory owns the session,
+        so closing a client leaves the session open.
+        """
+        from azure.core.pipeline.transport import RequestsTransport
+
+        from .policies import TelemetryPolicy, ThrottlingPolicy
+
+        return {
+            "transport": RequestsTransport(session=self._get_session(), session_owner=False),
+            "per_retry_policies": [
+                ThrottlingPolicy(self.throttling),
+                TelemetryPolicy(self.telemetry),
+            ],
+        }
+
+    def _get_session(self) -> Session:
+        """Get the session shared by all clients, creating it on first use"""
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                session = requests.Session()
+                # The Azure SDK retry policy handles retries
+                adapter = HTTPAdapter(
+                    pool_connections=self._connection_pool_size,
+                    pool_maxsize=self._connection_pool_size,
+                    max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+                )
+                mounted = adapter if self.traffic is None else self.traffic.wrap_adapter(adapter)
+                session.mount("https://", mounted)
+                session.mount("http://", mounted)
+                self._session = session
+            return self._session
+
+    def close(self) -> None:
+        """Close the connections of the shared session"""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from datetime import timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from preflight_check import log
+
+if TYPE_CHECKING:
+    from azure.mgmt.authorization.v2022_04_01.models import RoleDefinition
+
+# Directory where caches are kept between runs
+DEFAULT_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "preflight_check"
+)
+# How long cached role definitions are served before they are fetched again
+DEFAULT_ROLE_DEFINITION_CACHE_TTL = timedelta(days=7)
+# Role type of the role definitions that Azure provides; only these are cached on disk
+BUILT_IN_ROLE_TYPE = "BuiltInRole"
+
+
+class RoleDefinitionCache:
+    """
+    On-disk cache of built-in role definitions, keyed by tenant and role definition ID.
+
+    Built-in roles rarely change, so repeat runs serve them locally instead of fetching them
+    again. Custom roles are always fetched. Each tenant's entries are kept in a single JSON
+    file, which is loaded on first use and rewritten whenever a role definition is added.
+    """
+
+    _cache_dir: Path
+    _ttl: timedelta
+    _refresh: bool
+    _clock: Callable[[], float]
+    """Map from tenant ID to a map of role definition ID to cache entry"""
+    _entries: dict[str, dict[str, dict[str, Any]]]
+    """Guards the cache entries and the cache files"""
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        ttl: timedelta = DEFAULT_ROLE_DEFINITION_CACHE_TTL,
+        refresh: bool = False,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Args:
+            cache_dir: Directory to keep the cache files in
+            ttl: How long a cached role definition is served before it is fetched again
+            refresh: Ignore cached role definitions; fetched ones are still cached
+            clock: Returns the current time in seconds since the epoch
+        """
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._refresh = refresh
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: str, role_definition_id: str) -> RoleDefinition | None:
+        """
+        Get a cached role definition.
+
+        Returns:
+            The role definition, or None if it is not cached or has expired
+        """
+        if self._refresh:
+            return None
+        with self._lock:
+            entry = self._tenant_entries(tenant_id).get(
+                _get_role_definition_key(role_definition_id)
+            )
+        if entry is None or self._clock() - entry["cached_at"] > self._ttl.total_seconds():
+            return None
+        from azure.mgmt.authorization.v2022_04_01.models import RoleDefinition
+
+        return RoleDefinition.deserialize(entry["role_definition"])
+
+    def put(self, tenant_id: str, role_definition: RoleDefinition) -> None:
+        """Cache a role definition if it is a built-in role"""
+        if role_definition.id is None or role_definition.role_type != BUILT_IN_ROLE_TYPE:
+            return
+        with self._lock:
+            entries = self._tenant_entries(tenant_id)
+            entries[_get_role_definition_key(role_definition.id)] = {
+                "cached_at": self._clock(),
+                "role_definition": role_definition.serialize(keep_readonly=True),
+            }
+            self._save(tenant_id, entries)
+
+    def _tenant_entries(self, tenant_id: str) -> dict[str, dict[str, Any]]:
+        """Get the cache entries of a tenant, loading them from disk on first use"""
+        if tenant_id not in self._entries:
+            self._entries[tenant_id] = self._load(tenant_id)
+        return self._entries[tenant_id]
+
+    def _load(self, tenant_id: str) -> dict[str, dict[str, Any]]:
+        path = self._path(tenant_id)
+        try:
+            with path.open() as f:
+                entries: dict[str, dict[str, Any]] = json.load(f)
+            return entries
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            # An unreadable cache is treated as empty and overwritten on the next save
+            log.debug(f"Ignoring unreadable role definition cache {path}: {str(e)}")
+            return {}
+
+    def _save(self, tenant_id: str, entries: dict[str, dict[str, Any]]) -> None:
+        path = self._path(tenant_id)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so that concurrent runs never read a partial file
+            temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with temp_path.open("w") as f:
+                json.dump(entries, f)
+            temp_path.replace(path)
+        except OSError as e:
+            log.debug(f"Failed to save role definition cache {path}: {str(e)}")
+
+    def _path(self, tenant_id: str) -> Path:
+        return self._cache_dir / "role_definitions" / f"{tenant_id}.json"
+
+
+def _get_role_definition_key(role_definition_id: str) -> str:
+    """
+    Get the cache key of a role definition ID.
+
+    The same role definition is referenced by a different ID in each scope it is assigned on;
+    the role definition name, the GUID at the end of the ID, identifies it on its own.
+
+    Role definition ID format:
+    /subscriptions/{subscriptionId}/providers/Microsoft.Authorization/roleDefinitions/{roleDefinitionName}
+    """
+    return role_definition_id.rsplit("/", 1)[-1].lower()
@@ -0,0 +1,88 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_CONCURRENCY = 8
+
+
+class ExecutionEngine(StrEnum):
+    """How Azure requests are run concurrently"""
+
+    # Blocking clients on a pool of worker threads
+    THREADS = "threads"
+    # Async clients on a single event loop
+    ASYNCIO = "asyncio"
+
+
+@dataclass
+class TaskResult(Generic[T, R]):
+    """Outcome of running a function against a single item"""
+
+    item: T
+    result: R | None = None
+    error: Exception | None = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+def map_concurrently(
+    func: Callable[[T], R], items: Iterable[T], concurrency: int = DEFAULT_CONCURRENCY
+) -> list[TaskResult[T, R]]:
+    """
+    Apply a function to every item using a bounded pool of worker threads.
+
+    Failures are captured per item instead of aborting the remaining work, so callers can
+    report each failure on its own.
+
+    Args:
+        func: Function to apply to each item
+        items: Items to process
+        concurrency: Maximum number of items processed at once; 1 runs serially
+
+    Returns:
+        One TaskResult per item, in the order the items were given
+    """
+    items = list(items)
+
+    def run(item: T) -> TaskResult[T, R]:
+        try:
+            return TaskResult(item=item, result=func(item))
+        except Exception as e:
+            return TaskResult(item=item, error=e)
+
+    if concurrency <= 1 or len(items) <= 1:
+        return [run(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(items))) as executor:
+        return list(executor.map(run, items))
+
+
+async def gather_concurrently(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> list[TaskResult[T, R]]:
+    """
+    Await a coroutine function for every item on the running event loop, with at most
+    `concurrency` coroutines in flight. The asyncio counterpart of map_concurrently.
+
+    Returns:
+        One TaskResult per item, in the order the items were given
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def run(item: T) -> TaskResult[T, R]:
+        async with semaphore:
+            try:
+                return TaskResult(item=item, result=await func(item))
+            except Exception as e:
+                return TaskResult(item=item, error=e)
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
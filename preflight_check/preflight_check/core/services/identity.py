@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import subprocess
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from preflight_check import log
+
+if TYPE_CHECKING:
+    from azure.core.credentials import TokenCredential
+
+    from .azure import AzureClientFactory
+
+# Scope of the access token whose claims identify the authenticated principal
+ARM_TOKEN_SCOPE = "https://management.azure.com/.default"
+
+
+@dataclass
+class Identity:
+    """The authenticated principal and the tenant it is authenticated in"""
+
+    principal_id: str
+    tenant_id: str
+
+
+class IdentityResolver(ABC):
+    """Resolves the identity of the authenticated principal"""
+
+    @abstractmethod
+    def resolve(self) -> Identity:
+        """
+        Resolve the identity of the authenticated principal.
+
+        Returns:
+            The object ID of the principal and the ID of its tenant
+        """
+        pass
+
+
+class TokenClaimsIdentityResolver(IdentityResolver):
+    """
+    Reads the principal object ID (oid) and tenant ID (tid) from the claims of an access token
+    issued by the credential, without starting any processes or making Graph requests
+    """
+
+    _credential: TokenCredential
+
+    def __init__(self, credential: TokenCredential) -> None:
+        self._credential = credential
+
+    def resolve(self) -> Identity:
+        claims = decode_token_claims(self._credential.get_token(ARM_TOKEN_SCOPE).token)
+        principal_id = claims.get("oid")
+        tenant_id = claims.get("tid")
+        if not principal_id or not tenant_id:
+            raise RuntimeError("Access token has no oid or tid claim")
+        log.debug(f"Using principal ID from access token: {principal_id}")
+        return Identity(principal_id=principal_id, tenant_id=tenant_id)
+
+
+class AzureCliIdentityResolver(IdentityResolver):
+    """
+    Resolves the principal signed in to the Azure CLI with `az account show`, then
+    `az ad sp show` for service principals or Microsoft Graph for users
+    """
+
+    _azure_client_factory: AzureClientFactory
+
+    def __init__(self, azure_client_factory: AzureClientFactory) -> None:
+        self._azure_client_factory = azure_client_factory
+
+    def resolve(self) -> Identity:
+        principal_id, tenant_id = asyncio.run(self._get_principal_and_tenant_id())
+        return Identity(principal_id=principal_id, tenant_id=tenant_id)
+
+    async def _get_principal_and_tenant_id(self) -> tuple[str, str]:
+        """
+        Get the principal ID of the authenticated principal.
+        """
+        account_show_response = subprocess.run(
+            ["az", "account", "show"], capture_output=True, text=True, check=True
+        )
+        account = json.loads(account_show_response.stdout)
+        # get the tenant ID from the account show response
+        tenant_id = account.get("tenantId")
+        if not tenant_id:
+            raise RuntimeError("No tenant ID found for user")
+        # get the principal ID
+        principal = account.get("user", {})
+        # determine if the authenticated principal is a user or service principal
+        principal_id: str = ""
+        is_service_principal = principal.get("type") == "servicePrincipal"
+        # for service principals, need to get the objectId, not just the name (appId)
+        if is_service_principal:
+            app_id = principal.get("name")
+            if not app_id:
+                raise RuntimeError(
+                    "No app ID found for service principal; response:",
+                    f"\n{account_show_response.stdout}",
+                )
+            # Get the actual principalId (objectId) for the service principal
+            log.debug(f"Getting service principal ID for name: {app_id}")
+            sp_show_response = subprocess.run(
+                ["az", "ad", "sp", "show", "--id", app_id],
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+
+            # Check if the command succeeded
+            if sp_show_response.returncode == 0:
+                sp_info = json.loads(sp_show_response.stdout)
+                principal_id = sp_info.get("id")
+                log.debug(f"Service principal details: appId={app_id}, objectId={principal_id}")
+                if not principal_id:
+                    raise RuntimeError(
+                        f"No object ID found for service principal {app_id}; response:",
+                        f"\n{sp_show_response.stdout}",
+                    )
+            else:
+                raise RuntimeError(f"Failed to get service principal details for appId: {app_id}")
+        # for users, get the principal ID from the graph client
+        else:
+            principal = await self._azure_client_factory.get_graph_client().me.get()
+            principal_id = principal.id
+            if not principal_id:
+                raise RuntimeError("No principal ID found for user")
+
+        log.debug(f"Using principal ID: {principal_id}")
+        return principal_id, tenant_id
+
+
+class FallbackIdentityResolver(IdentityResolver):
+    """Tries several resolvers in order and returns the first identity resolved"""
+
+    _resolvers: list[IdentityResolver]
+
+    def __init__(self, resolvers: list[IdentityResolver]) -> None:
+        self._resolvers = resolvers
+
+    def resolve(self) -> Identity:
+        errors = []
+        for resolver in self._resolvers:
+            try:
+                return resolver.resolve()
+            except Exception as e:
+                log.debug(f"{type(resolver).__name__} failed to resolve identity: {str(e)}")
+                errors.append(f"{type(resolver).__name__}: {str(e)}")
+        raise RuntimeError(f"Failed to resolve the authenticated principal: {'; '.join(errors)}")
+
+
+def default_identity_resolver(azure_client_factory: AzureClientFactory) -> IdentityResolver:
+    """Resolve the identity from access token claims, falling back to the Azure CLI"""
+    return FallbackIdentityResolver(
+        [
+            TokenClaimsIdentityResolver(azure_client_factory.credential),
+            AzureCliIdentityResolver(azure_client_factory),
+        ]
+    )
+
+
+def decode_token_claims(token: str) -> dict[str, Any]:
+    """
+    Decode the claims of a JWT access token.
+    The signature is not verified; the token comes straight from the credential.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims: dict[str, Any] = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return claims
+    except (IndexError, ValueError) as e:
+        raise RuntimeError(f"Failed to decode access token claims: {str(e)}") from e
@@ -0,0 +1,721 @@
+from __future__ import annotations
+
+import itertools
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import closing
+from dataclasses import dataclass, field, replace
+from enum import StrEnum
+from typing import TYPE_CHECKING, Any, Protocol, cast
+
+from preflight_check import log
+
+from .concurrency import DEFAULT_CONCURRENCY, map_concurrently
+from .paging import prefetch_pages
+
+if TYPE_CHECKING:
+    from azure.core.paging import ItemPaged
+    from azure.core.rest import HttpRequest, HttpResponse
+    from azure.mgmt.compute.models import VirtualMachineScaleSet
+    from azure.mgmt.core import ARMPipelineClient
+
+    from . import azure
+
+
+class ListedResource(Protocol):
+    """Resource listed by the compute engine, which is told apart from others by its ID"""
+
+    @property
+    def id(self) -> str | None: ...
+
+
+# Maximum number of subscriptions a single Resource Graph query can target
+RESOURCE_GRAPH_SUBSCRIPTION_LIMIT = 1000
+# Maximum number of rows a single Resource Graph query returns
+RESOURCE_GRAPH_ROW_LIMIT = 1000
+# API version of the raw VM listings
+VIRTUAL_MACHINES_API_VERSION = "2024-07-01"
+# API version of the raw location listings; older versions, like the one of the subscription
+# client, don't tell physical locations from logical ones
+LOCATIONS_API_VERSION = "2022-12-01"
+# Number of VMs or scale sets in a subscription beyond which they are listed one location at a
+# time, concurrently; below it, walking the pages of one listing is faster than listing every
+# location
+DEFAULT_SHARD_THRESHOLD = 2000
+
+
+class VmssCountStrategy(StrEnum):
+    """How instances of virtual machine scale sets are counted"""
+
+    # Read the instance count from the scale set's SKU capacity; no extra API calls
+    CAPACITY = "capacity"
+    # List every instance of every scale set; one paged API call per scale set
+    EXACT = "exact"
+
+
+class InventoryEngine(StrEnum):
+    """Which backend is used to count VMs"""
+
+    # Walk the compute API of each subscription
+    COMPUTE = "compute"
+    # Run one summarized Azure Resource Graph query per batch of subscriptions
+    RESOURCE_GRAPH = "resource-graph"
+
+
+@dataclass
+class InventoryResult:
+    """VM counts for a set of subscriptions"""
+
+    """Map from subscription ID to a map of region name to VM count"""
+    vm_counts: dict[str, dict[str, int]] = field(default_factory=dict)
+    """Map from subscription ID to the error raised while counting its VMs"""
+    errors: dict[str, Exception] = field(default_factory=dict)
+
+
+@dataclass
+class VmSummary:
+    """The fields of a VM that are read to count it"""
+
+    id: str
+    location: str
+
+
+class ListedKind(StrEnum):
+    """Kind of resource listed to count the VMs of a subscription"""
+
+    # VMs, including those of flexible orchestration scale sets, which reference their scale set
+    VIRTUAL_MACHINES = "virtual machines"
+    # Scale sets, whose uniform orchestration instances are counted with the VMSS strategy
+    SCALE_SETS = "scale sets"
+
+
+@dataclass(frozen=True)
+class ListingShard:
+    """A listing of the resources of one kind in a whole subscription, or in one of its locations"""
+
+    subscription_id: str
+    kind: ListedKind
+    """Name of the only location listed; the whole subscription if None"""
+    location: str | None = None
+    """IDs of the resources already listed with the whole subscription, skipped in the location"""
+    listed_ids: frozenset[str | None] = frozenset()
+
+
+@dataclass
+class ShardSummary:
+    """What is read from the resources of one listing shard to count VMs"""
+
+    """Map from lowercase region to the number of VMs, and of scale set instances known so far"""
+    vm_counts: dict[str, int] = field(default_factory=dict)
+    """Uniform orchestration scale sets whose instances are still to be listed"""
+    scale_sets: list[VirtualMachineScaleSet] = field(default_factory=list)
+
+
+class ShardedInventory:
+    """
+    Collects the shard summaries of a set of subscriptions into their VM counts. A subscription
+    is reported with the first error of any of its shards instead.
+    """
+
+    _vm_counts: dict[str, dict[str, int]]
+    _scale_sets: dict[str, list[VirtualMachineScaleSet]]
+    _errors: dict[str, Exception]
+
+    def __init__(self, subscription_ids: list[str]) -> None:
+        self._vm_counts = {subscription_id: {} for subscription_id in subscription_ids}
+        self._scale_sets = {subscription_id: [] for subscription_id in subscription_ids}
+        self._errors = {}
+
+    def add(
+        self,
+        subscription_id: str,
+        summary: ShardSummary | None = None,
+        error: Exception | None = None,
+    ) -> None:
+        """Add the summary of a shard of a subscription, or the error that shard failed with"""
+        if error is not None:
+            self._errors.setdefault(subscription_id, error)
+            return
+        if summary is None:
+            return
+        vm_counts = self._vm_counts[subscription_id]
+        for region, count in summary.vm_counts.items():
+            vm_counts[region] = vm_counts.get(region, 0) + count
+        self._scale_sets[subscription_id].extend(summary.scale_sets)
+
+    def get_uncounted_scale_sets(self) -> list[tuple[str, VirtualMachineScaleSet]]:
+        """Get the scale sets whose instances are still to be listed, with their subscription"""
+        return [
+            (subscription_id, vmss)
+            for subscription_id, scale_sets in self._scale_sets.items()
+            if subscription_id not in self._errors
+            for vmss in scale_sets
+        ]
+
+    def get_result(self) -> InventoryResult:
+        return InventoryResult(
+            vm_counts={
+                subscription_id: vm_counts
+                for subscription_id, vm_counts in self._vm_counts.items()
+                if subscription_id not in self._errors
+            },
+            errors=dict(self._errors),
+        )
+
+
+class InventoryBackend(ABC):
+    """Counts the VMs, including scale set instances, in each region of a set of subscriptions"""
+
+    @abstractmethod
+    def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        """
+        Count VMs in each region of each subscription.
+
+        Args:
+            subscription_ids: IDs of the subscriptions to count VMs in
+            regions: Names of the only regions to count VMs in; VMs and scale sets in other
+                regions are not listed. All regions are counted if None
+
+        Returns:
+            VM counts for every subscription that could be counted, and the error for every
+            subscription that could not
+        """
+        pass
+
+
+class ComputeInventoryBackend(InventoryBackend):
+    """
+    Counts VMs by listing them with the compute API of each subscription.
+
+    Every listing, of every kind of resource in every subscription, is one item of a flat
+    fan-out: whole subscriptions are listed first, then the location shards of the large ones,
+    then the instances of the scale sets, so that no more than the concurrency of listings are
+    ever run at once.
+    """
+
+    _azure_client_factory: azure.AzureClientFactory
+    _concurrency: int
+    _vmss_count_strategy: VmssCountStrategy
+    _shard_threshold: int
+    """Listings of whole subscriptions found to reach the shard threshold on an earlier count"""
+    _sharded_listings: set[ListingShard]
+
+    def __init__(
+        self,
+        azure_client_factory: azure.AzureClientFactory,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        vmss_count_strategy: VmssCountStrategy = VmssCountStrategy.CAPACITY,
+        shard_threshold: int = DEFAULT_SHARD_THRESHOLD,
+    ) -> None:
+        """
+        Args:
+            azure_client_factory: Factory for the compute clients of each subscription
+            concurrency: Maximum number of listings, of subscriptions, locations or scale set
+                instances, run at once across all subscriptions
+            vmss_count_strategy: How scale set instances are counted
+            shard_threshold: Number of VMs or scale sets in a subscription beyond which they
+                are listed one location at a time, concurrently
+        """
+        self._azure_client_factory = azure_client_factory
+        self._concurrency = concurrency
+        self._vmss_count_strategy = vmss_count_strategy
+        self._shard_threshold = shard_threshold
+        self._sharded_listings = set()
+
+    def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        inventory = ShardedInventory(subscription_ids)
+        regions = normalize_regions(regions)
+        if regions is None:
+            shards = self._list_whole_subscriptions(subscription_ids, inventory)
+        else:
+            # Scale sets outside the regions are never listed, so neither are their instances
+            shards = [
+                ListingShard(subscription_id, kind, region)
+                for subscription_id in subscription_ids
+                for kind in ListedKind
+                for region in regions
+            ]
+        for task in map_concurrently(self._list_shard, shards, self._concurrency):
+            inventory.add(task.item.subscription_id, task.result, task.error)
+        self._count_scale_set_instances(inventory)
+        return inventory.get_result()
+
+    def _list_whole_subscriptions(
+        self, subscription_ids: list[str], inventory: ShardedInventory
+    ) -> list[ListingShard]:
+        """
+        List the resources of each kind in each subscription as a whole, up to the shard
+        threshold.
+
+        The pages of one listing can only be fetched one after the other, so the listings that
+        reach the threshold are split in location shards, which skip the resources already
+        listed. The resources listed by one location can't be told apart from the others until
+        they are listed, so the listings that reached the threshold on an earlier count skip the
+        whole subscription listing altogether instead.
+
+        Returns:
+            The location shards of the listings that reached the threshold
+        """
+        listings = [
+            ListingShard(subscription_id, kind)
+            for subscription_id in subscription_ids
+            for kind in ListedKind
+        ]
+        sharded = [listing for listing in listings if listing in self._sharded_listings]
+        for task in map_concurrently(
+            self._list_until_threshold,
+            [listing for listing in listings if listing not in self._sharded_listings],
+            self._concurrency,
+        ):
+            listing, resources = task.item, task.result or []
+            if task.error is not None:
+                inventory.add(listing.subscription_id, error=task.error)
+                continue
+            inventory.add(
+                listing.subscription_id,
+                summarize_shard(listing.kind, resources, self._vmss_count_strategy),
+            )
+            if len(resources) >= self._shard_threshold:
+                self._sharded_listings.add(listing)
+                sharded.append(
+                    replace(listing, listed_ids=frozenset(resource.id for resource in resources))
+                )
+
+        subscription_locations: dict[str, list[str]] = {}
+        for located in map_concurrently(
+            self._list_locations,
+            sorted({listing.subscription_id for listing in sharded}),
+            self._concurrency,
+        ):
+            if located.error is not None:
+                inventory.add(located.item, error=located.error)
+                continue
+            subscription_locations[located.item] = located.result or []
+            log.debug(
+                f"Subscription {located.item} has at least {self._shard_threshold} resources of "
+                f"one kind; listing its {len(subscription_locations[located.item])} locations "
+                "concurrently"
+            )
+        return [
+            replace(listing, location=location)
+            for listing in sharded
+            for location in subscription_locations.get(listing.subscription_id, [])
+        ]
+
+    def _list_until_threshold(self, listing: ListingShard) -> list[ListedResource]:
+        """List the resources of a shard, stopping at the shard threshold"""
+        # Closed once the threshold is reached, so that no further pages are fetched
+        with closing(prefetch_pages(self._list(listing))) as resources:
+            return list(itertools.islice(resources, self._shard_threshold))
+
+    def _list_shard(self, listing: ListingShard) -> ShardSummary:
+        """
+        List and summarize the resources of a shard, skipping the IDs already listed. Each
+        shard is summarized as it is listed, so that the resources of large subscriptions are
+        not all held at once.
+        """
+        return summarize_shard(
+            listing.kind,
+            (
+                resource
+                for resource in prefetch_pages(self._list(listing))
+                if resource.id not in listing.listed_ids
+            ),
+            self._vmss_count_strategy,
+        )
+
+    def _list(self, listing: ListingShard) -> Iterable[ListedResource]:
+        """Start the listing of the resources of a shard"""
+        if listing.kind == ListedKind.VIRTUAL_MACHINES:
+            return _list_vm_summaries(
+                self._azure_client_factory.get_arm_client(),
+                listing.subscription_id,
+                listing.location,
+            )
+        scale_sets = self._compute_client(listing.subscription_id).virtual_machine_scale_sets
+        if listing.location is None:
+            return scale_sets.list_all()
+        return scale_sets.list_by_location(listing.location)
+
+    def _list_locations(self, subscription_id: str) -> list[str]:
+        """List the physical locations available to a subscription, that resources can be in"""
+        return _list_physical_locations(
+            self._azure_client_factory.get_arm_client(), subscription_id
+        )
+
+    def _count_scale_set_instances(self, inventory: ShardedInventory) -> None:
+        """
+        List the instances of the scale sets left to count, one paged call per scale set, across
+        all subscriptions at once
+        """
+
+        def count_instances(item: tuple[str, VirtualMachineScaleSet]) -> ShardSummary:
+            subscription_id, vmss = item
+            compute_client = self._compute_client(subscription_id)
+            instances = prefetch_pages(
+                compute_client.virtual_machine_scale_set_vms.list(
+                    *get_scale_set_resource_group_and_name(vmss)
+                )
+            )
+            return ShardSummary(vm_counts={vmss.location.lower(): sum(1 for _ in instances)})
+
+        for task in map_concurrently(
+            count_instances, inventory.get_uncounted_scale_sets(), self._concurrency
+        ):
+            inventory.add(task.item[0], task.result, task.error)
+
+    def _compute_client(self, subscription_id: str) -> azure.ComputeManagementClient:
+        return self._azure_client_factory.get_compute_client(subscription_id)
+
+
+class ResourceGraphInventoryBackend(InventoryBackend):
+    """
+    Counts VMs with summarized Azure Resource Graph queries per batch of subscriptions, instead
+    of walking the compute API of every subscription.
+    """
+
+    _azure_client_factory: azure.AzureClientFactory
+    _vmss_count_strategy: VmssCountStrategy
+    _batch_size: int
+
+    def __init__(
+        self,
+        azure_client_factory: azure.AzureClientFactory,
+        vmss_count_strategy: VmssCountStrategy = VmssCountStrategy.CAPACITY,
+        batch_size: int = RESOURCE_GRAPH_SUBSCRIPTION_LIMIT,
+    ) -> None:
+        self._azure_client_factory = azure_client_factory
+        self._vmss_count_strategy = vmss_count_strategy
+        self._batch_size = min(batch_size, RESOURCE_GRAPH_SUBSCRIPTION_LIMIT)
+
+    def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        result = InventoryResult()
+        regions = normalize_regions(regions)
+        for start in range(0, len(subscription_ids), self._batch_size):
+            batch = subscription_ids[start : start + self._batch_size]
+            try:
+                batch_counts = self._query_vm_counts(batch, regions)
+            except Exception as e:
+                error = RuntimeError(f"Failed to query Resource Graph for VM counts: {str(e)}")
+                result.errors.update(dict.fromkeys(batch, error))
+                continue
+            # Subscriptions without any VMs have no rows in the summarized result
+            for subscription_id in batch:
+                result.vm_counts[subscription_id] = batch_counts.get(subscription_id, {})
+        return result
+
+    def _query_vm_counts(
+        self, subscription_ids: list[str], regions: list[str] | None
+    ) -> dict[str, dict[str, int]]:
+        """Run the summarized VM count queries against a batch of subscriptions"""
+        vm_counts: dict[str, dict[str, int]] = {}
+        for query in self._queries(regions):
+            for row in self._run_summarized_query(subscription_ids, query):
+                subscription_counts = vm_counts.setdefault(row["subscriptionId"], {})
+                region = row["location"].lower()
+                subscription_counts[region] = subscription_counts.get(region, 0) + int(
+                    row["vmCount"] or 0
+                )
+        return vm_counts
+
+    def _run_summarized_query(
+        self, subscription_ids: list[str], query: str
+    ) -> list[dict[str, Any]]:
+        """
+        Run a summarized query, splitting the subscriptions in halves for as long as its result
+        is truncated; summarized results have no resource IDs to page on, so Resource Graph
+        returns no skip token for the rows beyond the first page.
+        """
+        from azure.mgmt.resourcegraph.models import (
+            QueryRequest,
+            QueryRequestOptions,
+            ResultFormat,
+            ResultTruncated,
+        )
+
+        response = self._azure_client_factory.get_resource_graph_client().resources(
+            QueryRequest(
+                subscriptions=subscription_ids,
+                query=query,
+                options=QueryRequestOptions(
+                    top=RESOURCE_GRAPH_ROW_LIMIT, result_format=ResultFormat.OBJECT_ARRAY
+                ),
+            )
+        )
+        # Object array results are lists of rows, although the SDK types them as one mapping
+        rows = cast("list[dict[str, Any]]", response.data)
+        if response.result_truncated != ResultTruncated.TRUE:
+            return rows
+        if len(subscription_ids) == 1:
+            raise RuntimeError(
+                f"VM counts of subscription {subscription_ids[0]} exceed "
+                f"{RESOURCE_GRAPH_ROW_LIMIT} rows"
+            )
+        middle = len(subscription_ids) // 2
+        return self._run_summarized_query(
+            subscription_ids[:middle], query
+        ) + self._run_summarized_query(subscription_ids[middle:], query)
+
+    def _queries(self, regions: list[str] | None = None) -> list[str]:
+        """
+        Build the Resource Graph queries that count VMs by subscription and location, filtering
+        on the locations before anything is projected if regions are given.
+
+        Scale set instances are in the computeresources table, which Resource Graph does not
+        allow in a union with the resources table, so the exact strategy counts them with a
+        second query.
+        """
+        location_filter = (
+            f"| where location in~ ({', '.join(_to_kql_string(region) for region in regions)})"
+            if regions is not None
+            else ""
+        )
+        vms = f"""
+            resources
+            | where type =~ 'microsoft.compute/virtualmachines'
+            {location_filter}
+            | project subscriptionId, location, instances = 1
+        """
+        summarize = "| summarize vmCount = sum(instances) by subscriptionId, location"
+        if self._vmss_count_strategy == VmssCountStrategy.CAPACITY:
+            return [
+                f"""
+                {vms}
+                | union (
+                    resources
+                    | where type =~ 'microsoft.compute/virtualmachinescalesets'
+                    {location_filter}
+                    | where tostring(properties.orchestrationMode) !~ 'Flexible'
+                    | project subscriptionId, location, instances = toint(sku.capacity)
+                )
+                {summarize}
+                """
+            ]
+        return [
+            f"{vms}{summarize}",
+            f"""
+            computeresources
+            | where type =~ 'microsoft.compute/virtualmachinescalesets/virtualmachines'
+            {location_filter}
+            | project subscriptionId, location, instances = 1
+            {summarize}
+            """,
+        ]
+
+
+class InMemoryInventoryBackend(InventoryBackend):
+    """Serves fixed VM counts without calling Azure; stands in for Azure in tests and benchmarks"""
+
+    _vm_counts: dict[str, dict[str, int]]
+
+    def __init__(self, vm_counts: dict[str, dict[str, int]]) -> None:
+        """
+        Args:
+            vm_counts: Map from subscription ID to a map of region name to VM count
+        """
+        self._vm_counts = vm_counts
+
+    def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        result = InventoryResult()
+        for subscription_id in subscription_ids:
+            if subscription_id in self._vm_counts:
+                result.vm_counts[subscription_id] = filter_regions(
+                    self._vm_counts[subscription_id], regions
+                )
+            else:
+                result.errors[subscription_id] = RuntimeError(
+                    f"Subscription {subscription_id} not found"
+                )
+        return result
+
+
+def normalize_regions(regions: list[str] | None) -> list[str] | None:
+    """Lowercase and deduplicate region names, as VM counts are keyed by lowercase region"""
+    if regions is None:
+        return None
+    return sorted({region.strip().lower() for region in regions if region.strip()})
+
+
+def filter_regions(vm_counts: dict[str, int], regions: list[str] | None) -> dict[str, int]:
+    """Keep the VM counts of the given regions, or of every region if None"""
+    regions = normalize_regions(regions)
+    if regions is None:
+        return dict(vm_counts)
+    return {region: count for region, count in vm_counts.items() if region in regions}
+
+
+def _list_vm_summaries(
+    arm_client: ARMPipelineClient, subscription_id: str, location: str | None = None
+) -> ItemPaged[VmSummary]:
+    """
+    List the VMs of a subscription, or of one of its locations, reading only the ID and location
+    of each VM from the raw JSON pages. The compute client would deserialize every VM into a
+    full VirtualMachine model, with its storage, network and OS profiles, which costs more CPU
+    and memory than the rest of the count on large tenants.
+    """
+    from azure.core.exceptions import HttpResponseError
+    from azure.core.paging import ItemPaged
+    from azure.mgmt.core.exceptions import ARMErrorFormat
+
+    def get_next(next_link: str | None) -> HttpResponse:
+        response: HttpResponse = arm_client.send_request(
+            get_vm_listing_request(arm_client.format_url, subscription_id, location, next_link)
+        )
+        if response.status_code != 200:
+            raise HttpResponseError(response=response, error_format=ARMErrorFormat)
+        return response
+
+    def extract_data(response: HttpResponse) -> tuple[str | None, Iterator[VmSummary]]:
+        next_link, vms = read_vm_listing_page(response.json())
+        return next_link, iter(vms)
+
+    return ItemPaged(get_next, extract_data)
+
+
+def _list_physical_locations(arm_client: ARMPipelineClient, subscription_id: str) -> list[str]:
+    """List the names of the physical locations of a subscription, leaving out logical ones"""
+    from azure.core.exceptions import HttpResponseError
+    from azure.mgmt.core.exceptions import ARMErrorFormat
+
+    response = arm_client.send_request(
+        get_locations_request(arm_client.format_url, subscription_id)
+    )
+    if response.status_code != 200:
+        raise HttpResponseError(response=response, error_format=ARMErrorFormat)
+    return read_physical_locations(response.json())
+
+
+def get_vm_listing_request(
+    format_url: Callable[[str], str],
+    subscription_id: str,
+    location: str | None = None,
+    next_link: str | None = None,
+) -> HttpRequest:
+    """
+    Build the request for a page of the raw VM listing of a subscription, or of one of its
+    locations, which both compute engines send through their ARM client.
+
+    Args:
+        format_url: Turns a path into a URL of the ARM endpoint, such as the format_url method
+            of an ARM client
+        subscription_id: ID of the subscription to list VMs in
+        location: Name of the only location to list VMs in; all locations if None
+        next_link: Link to the next page, as read from the previous page; the first page if None
+    """
+    from azure.core.rest import HttpRequest
+
+    # Next links carry the API version and paging parameters of the listing
+    if next_link:
+        return HttpRequest("GET", next_link)
+    path = f"/subscriptions/{subscription_id}/providers/Microsoft.Compute"
+    if location is not None:
+        path += f"/locations/{location}"
+    path += "/virtualMachines"
+    return HttpRequest(
+        "GET", format_url(path), params={"api-version": VIRTUAL_MACHINES_API_VERSION}
+    )
+
+
+def read_vm_listing_page(page: dict[str, Any]) -> tuple[str | None, list[VmSummary]]:
+    """
+    Read a page of the raw VM listing.
+
+    Returns:
+        Link to the next page, or None if this is the last one, and the VMs of the page
+    """
+    vms = [VmSummary(id=vm["id"], location=vm["location"]) for vm in page.get("value", [])]
+    return page.get("nextLink") or None, vms
+
+
+def get_locations_request(format_url: Callable[[str], str], subscription_id: str) -> HttpRequest:
+    """Build the request for the raw location listing of a subscription"""
+    from azure.core.rest import HttpRequest
+
+    return HttpRequest(
+        "GET",
+        format_url(f"/subscriptions/{subscription_id}/locations"),
+        params={"api-version": LOCATIONS_API_VERSION},
+    )
+
+
+def read_physical_locations(page: dict[str, Any]) -> list[str]:
+    """Read the names of the physical locations from the raw location listing"""
+    return [
+        location["name"]
+        for location in page.get("value", [])
+        if location.get("metadata", {}).get("regionType") != "Logical"
+    ]
+
+
+def count_vms_by_region(vms: Iterable[VmSummary]) -> dict[str, int]:
+    """Count VMs by lowercase region name"""
+    vm_counts: dict[str, int] = {}
+    for vm in vms:
+        region = vm.location.lower()
+        vm_counts[region] = vm_counts.get(region, 0) + 1
+    return vm_counts
+
+
+def summarize_shard(
+    kind: ListedKind, resources: Iterable[Any], vmss_count_strategy: VmssCountStrategy
+) -> ShardSummary:
+    """Read what counting VMs needs from the resources listed by one shard"""
+    if kind == ListedKind.VIRTUAL_MACHINES:
+        return ShardSummary(vm_counts=count_vms_by_region(resources))
+    summary = ShardSummary()
+    for vmss in resources:
+        if is_flexible_scale_set(vmss):
+            continue
+        if vmss_count_strategy == VmssCountStrategy.EXACT:
+            summary.scale_sets.append(vmss)
+            continue
+        region = vmss.location.lower()
+        summary.vm_counts[region] = summary.vm_counts.get(region, 0) + get_scale_set_capacity(vmss)
+    return summary
+
+
+def _to_kql_string(value: str) -> str:
+    """Quote a value as a Kusto string literal"""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def is_flexible_scale_set(vmss: VirtualMachineScaleSet) -> bool:
+    """Whether a scale set uses flexible orchestration, whose VMs are listed as regular VMs"""
+    return (vmss.orchestration_mode or "").lower() == "flexible"
+
+
+def get_scale_set_capacity(vmss: VirtualMachineScaleSet) -> int:
+    """Get the number of instances a scale set is configured to run"""
+    if vmss.sku is None or vmss.sku.capacity is None:
+        return 0
+    return vmss.sku.capacity
+
+
+def get_scale_set_resource_group_and_name(vmss: VirtualMachineScaleSet) -> tuple[str, str]:
+    """Get the resource group and the name of a scale set, by which its instances are listed"""
+    if vmss.id is None or vmss.name is None:
+        raise RuntimeError(f"Scale set has no ID or name: {vmss}")
+    return get_resource_group_name_from_vmss_id(vmss.id), vmss.name
+
+
+def get_resource_group_name_from_vmss_id(vmss_id: str) -> str:
+    """
+    Extract the resource group name from a VMSS ID.
+
+    VMSS ID format:
+    /subscriptions/{subscriptionId}/resourceGroups/{resourceGroupName}
+    /providers/Microsoft.Compute/virtualMachineScaleSets/{vmScaleSetName}
+    """
+    id_parts = vmss_id.split("/")
+    if len(id_parts) != 9:
+        raise RuntimeError(f"Invalid VMSS ID: {vmss_id}")
+
+    return id_parts[4]
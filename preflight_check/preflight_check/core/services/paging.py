@@ -0,0 +1,81 @@
+import threading
+from collections.abc import Generator, Iterable
+from queue import Full, Queue
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# Pages of a listing fetched ahead of the page being processed
+DEFAULT_READ_AHEAD = 2
+# How often a fetched page that is waiting for room in the read-ahead checks whether the
+# listing was abandoned, in seconds
+_PUT_POLL_INTERVAL = 0.1
+
+
+def prefetch_pages(
+    pager: Iterable[T], read_ahead: int = DEFAULT_READ_AHEAD
+) -> Generator[T, None, None]:
+    """
+    Iterate over the items of a paged listing, fetching the next pages in a background thread
+    while the caller processes the current one.
+
+    Iterating over a pager fetches each page only once the previous one was processed, so a
+    long listing waits for every page in turn. The first page is fetched by the caller; the
+    background thread is only started if there are more, so single page listings cost nothing
+    extra. Closing the generator, or dropping it, stops the background thread after the page it
+    is fetching.
+
+    Args:
+        pager: Listing to iterate over, such as the ItemPaged returned by Azure SDK list
+            operations; iterables without a by_page method are iterated over as they are
+        read_ahead: Maximum number of fetched pages waiting to be processed
+
+    Raises:
+        Exception: The error raised while fetching a page, once the pages before it were
+            processed
+    """
+    by_page = getattr(pager, "by_page", None)
+    if read_ahead < 1 or by_page is None:
+        yield from pager
+        return
+    pages = by_page()
+    first_page = next(pages, None)
+    if first_page is None:
+        return
+    if not pages.continuation_token:
+        yield from first_page
+        return
+
+    # Each entry is a fetched page, the error that fetching a page raised, or None once the
+    # listing is exhausted
+    fetched: Queue[list[T] | Exception | None] = Queue(maxsize=read_ahead)
+    abandoned = threading.Event()
+
+    def put(entry: list[T] | Exception | None) -> bool:
+        while not abandoned.is_set():
+            try:
+                fetched.put(entry, timeout=_PUT_POLL_INTERVAL)
+                return True
+            except Full:
+                continue
+        return False
+
+    def fetch() -> None:
+        try:
+            for page in pages:
+                if not put(list(page)):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    threading.Thread(target=fetch, name="preflight-check-pages", daemon=True).start()
+    try:
+        yield from first_page
+        while (entry := fetched.get()) is not None:
+            if isinstance(entry, Exception):
+                raise entry
+            yield from entry
+    finally:
+        abandoned.set()
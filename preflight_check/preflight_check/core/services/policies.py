@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+from azure.core.pipeline import PipelineRequest, PipelineResponse
+from azure.core.pipeline.policies import AsyncHTTPPolicy, HTTPPolicy
+from azure.core.pipeline.transport import AsyncHttpResponse, HttpRequest, HttpResponse
+
+from .telemetry import Telemetry, get_operation
+from .throttling import ThrottlingScheduler
+
+# Key of the pipeline context entry that marks requests that were already attempted
+_ATTEMPTED = "preflight_check_attempted"
+# How often a waiting coroutine checks whether its request can start, in seconds
+ASYNC_POLL_INTERVAL = 0.05
+
+
+class ThrottlingPolicy(HTTPPolicy[HttpRequest, HttpResponse]):
+    """
+    Sends every attempt of a request through a throttling scheduler.
+
+    Added after the retry policy, so that each retry waits for the throttled subscription or
+    tenant to cool down and is counted on its own; the retry policy still decides whether a
+    throttled request is retried.
+    """
+
+    _scheduler: ThrottlingScheduler
+
+    def __init__(self, scheduler: ThrottlingScheduler) -> None:
+        super().__init__()
+        self._scheduler = scheduler
+
+    def send(
+        self, request: PipelineRequest[HttpRequest]
+    ) -> PipelineResponse[HttpRequest, HttpResponse]:
+        keys = self._scheduler.keys_for_url(request.http_request.url)
+        self._scheduler.acquire(keys, retry=request.context.get(_ATTEMPTED, False))
+        request.context[_ATTEMPTED] = True
+        try:
+            response = self.next.send(request)
+        except BaseException:
+            self._scheduler.cancel(keys)
+            raise
+        self._scheduler.release(
+            keys, response.http_response.status_code, response.http_response.headers
+        )
+        return response
+
+
+class AsyncThrottlingPolicy(AsyncHTTPPolicy[HttpRequest, AsyncHttpResponse]):
+    """ThrottlingPolicy for async clients; waits on the event loop instead of blocking it"""
+
+    _scheduler: ThrottlingScheduler
+
+    def __init__(self, scheduler: ThrottlingScheduler) -> None:
+        super().__init__()
+        self._scheduler = scheduler
+
+    async def send(
+        self, request: PipelineRequest[HttpRequest]
+    ) -> PipelineResponse[HttpRequest, AsyncHttpResponse]:
+        keys = self._scheduler.keys_for_url(request.http_request.url)
+        retry = request.context.get(_ATTEMPTED, False)
+        while (delay := self._scheduler.try_acquire(keys, retry)) is not None:
+            await asyncio.sleep(min(delay, ASYNC_POLL_INTERVAL) or ASYNC_POLL_INTERVAL)
+        request.context[_ATTEMPTED] = True
+        try:
+            response = await self.next.send(request)
+        except BaseException:
+            self._scheduler.cancel(keys)
+            raise
+        self._scheduler.release(
+            keys, response.http_response.status_code, response.http_response.headers
+        )
+        return response
+
+
+class TelemetryPolicy(HTTPPolicy[HttpRequest, HttpResponse]):
+    """
+    Records every attempt of a request as a call of its operation.
+
+    Added after the throttling policy, so that the latency recorded is that of Azure and not
+    the time spent waiting for the scheduler.
+    """
+
+    _telemetry: Telemetry
+
+    def __init__(self, telemetry: Telemetry) -> None:
+        super().__init__()
+        self._telemetry = telemetry
+
+    def send(
+        self, request: PipelineRequest[HttpRequest]
+    ) -> PipelineResponse[HttpRequest, HttpResponse]:
+        start = time.perf_counter()
+        try:
+            response = self.next.send(request)
+        except BaseException:
+            _record_call(self._telemetry, request, None, time.perf_counter() - start)
+            raise
+        _record_call(self._telemetry, request, response.http_response, time.perf_counter() - start)
+        return response
+
+
+class AsyncTelemetryPolicy(AsyncHTTPPolicy[HttpRequest, AsyncHttpResponse]):
+    """TelemetryPolicy for async clients"""
+
+    _telemetry: Telemetry
+
+    def __init__(self, telemetry: Telemetry) -> None:
+        super().__init__()
+        self._telemetry = telemetry
+
+    async def send(
+        self, request: PipelineRequest[HttpRequest]
+    ) -> PipelineResponse[HttpRequest, AsyncHttpResponse]:
+        start = time.perf_counter()
+        try:
+            response = await self.next.send(request)
+        except BaseException:
+            _record_call(self._telemetry, request, None, time.perf_counter() - start)
+            raise
+        _record_call(self._telemetry, request, response.http_response, time.perf_counter() - start)
+        return response
+
+
+def _record_call(
+    telemetry: Telemetry,
+    request: PipelineRequest[HttpRequest],
+    response: HttpResponse | AsyncHttpResponse | None,
+    seconds: float,
+) -> None:
+    """Record an attempt of a request, which failed if it has no response"""
+    operation, is_collection = get_operation(request.http_request.method, request.http_request.url)
+    if response is None:
+        telemetry.record_call(operation, seconds, error=True)
+        return
+    error = response.status_code >= 400
+    telemetry.record_call(
+        operation,
+        seconds,
+        error=error,
+        page=is_collection and not error,
+        size=_get_body_size(response),
+    )
+
+
+def _get_body_size(response: HttpResponse | AsyncHttpResponse) -> int:
+    """Get the size of a response body, without reading a body that has not been read yet"""
+    content_length = response.headers.get("content-length")
+    if content_length is not None and content_length.isdigit():
+        return int(content_length)
+    try:
+        return len(response.body())
+    except Exception:
+        return 0
@@ -0,0 +1,65 @@
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from preflight_check import log
+
+# Maximum number of prefetches run at once; each one fans out on its service's own workers
+DEFAULT_PREFETCH_WORKERS = 4
+
+
+class Prefetcher:
+    """
+    Runs speculative work in background threads, such as fetching the permissions and quotas
+    that a later step will check while the user is still answering prompts.
+
+    Prefetches are run for their side effects on the caches of the services they call, which
+    the later step then reads from; their results are discarded. A failed prefetch is only
+    logged, leaving the later step to fetch the data itself and report the failure.
+    """
+
+    _executor: ThreadPoolExecutor
+    """Prefetches that were submitted and have not been waited for"""
+    _pending: list[Future[None]]
+    """Guards the pending prefetches"""
+    _lock: threading.Lock
+
+    def __init__(self, max_workers: int = DEFAULT_PREFETCH_WORKERS) -> None:
+        """
+        Args:
+            max_workers: Maximum number of prefetches run at once
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="preflight-check-prefetch"
+        )
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def submit(self, description: str, func: Callable[[], object]) -> None:
+        """
+        Start a prefetch in the background; returns immediately.
+
+        Args:
+            description: What is prefetched, for the debug log
+            func: Fetches the data, filling the caches of the services it calls
+        """
+
+        def prefetch() -> None:
+            try:
+                func()
+                log.debug(f"Prefetched {description}")
+            except Exception as e:
+                log.debug(f"Failed to prefetch {description}: {str(e)}")
+
+        with self._lock:
+            self._pending.append(self._executor.submit(prefetch))
+
+    def wait(self) -> None:
+        """Wait for every submitted prefetch to finish, so its results are in the caches"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        wait(pending)
+
+    def shutdown(self) -> None:
+        """Stop the background threads, dropping the prefetches that have not started"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
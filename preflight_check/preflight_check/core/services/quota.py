@@ -1,19 +1,74 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
 
 from ..models.quota import UsageQuotaLimit
-from .azure import AzureClientFactory, ComputeManagementClient, NetworkManagementClient
+from .concurrency import DEFAULT_CONCURRENCY, TaskResult, map_concurrently
+from .store import InventoryStore
+
+if TYPE_CHECKING:
+    from azure.core.paging import ItemPaged
+    from azure.mgmt.compute.models import Usage as ComputeUsage
+    from azure.mgmt.network.models import Usage as NetworkUsage
+
+    from .azure import AzureClientFactory, ComputeManagementClient, NetworkManagementClient
+
+# Resource providers whose usage quotas are collected for each region
+QUOTA_PROVIDERS = ("compute", "network")
+
+
+@dataclass
+class RegionQuotas:
+    """Usage quota limits listed for a set of regions of a subscription"""
+
+    """Map from region to a map of quota name to quota check, for every region listed in full"""
+    quotas: dict[str, dict[str, UsageQuotaLimit]] = field(default_factory=dict)
+    """Map from region to the error raised while listing one of its providers"""
+    errors: dict[str, Exception] = field(default_factory=dict)
+
+
+class QuotaCache:
+    """
+    In-memory cache of usage quota limits, which the blocking and async quota services share
+    so that quotas collected by either are not fetched again by the other
+    """
+
+    # Dict from (subscription_id, region) to a map of quota names to quota checks
+    _quotas: dict[tuple[str, str], dict[str, UsageQuotaLimit]]
+
+    def __init__(self) -> None:
+        self._quotas = {}
+
+    def get(self, subscription_id: str, region: str) -> dict[str, UsageQuotaLimit] | None:
+        """Get the cached quotas of a subscription and region, if any"""
+        return self._quotas.get((subscription_id, region))
+
+    def put(self, subscription_id: str, region: str, quotas: dict[str, UsageQuotaLimit]) -> None:
+        """Cache the quotas of a subscription and region"""
+        self._quotas[subscription_id, region] = quotas
 
 
 class QuotaService:
     """Handles all interactions with Azure Usage Quotas"""
 
     _azure_client_factory: AzureClientFactory
-
+    _concurrency: int
+    _inventory_store: InventoryStore | None
     # Cache of quotas for each subscription and region
-    # Dict from (subscription_id, region) to a map of quota names to quota checks
-    _quotas: dict[tuple[str, str], dict[str, UsageQuotaLimit]] = {}
+    _quota_cache: QuotaCache
 
-    def __init__(self, azure_client_factory: AzureClientFactory) -> None:
+    def __init__(
+        self,
+        azure_client_factory: AzureClientFactory,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        inventory_store: InventoryStore | None = None,
+        quota_cache: QuotaCache | None = None,
+    ) -> None:
         self._azure_client_factory = azure_client_factory
+        self._concurrency = concurrency
+        self._inventory_store = inventory_store
+        self._quota_cache = quota_cache or QuotaCache()
 
     def get_quota_limit(self, subscription_id: str, region: str, quota_name: str) -> UsageQuotaLimit:
         """
@@ -45,33 +100,148 @@ class QuotaService:
         Returns:
             Dict of quota name to quota check
         """
-        if (subscription_id, region) in self._quotas:
-            return self._quotas[subscription_id, region]
-        try:
+        return self.get_quota_limits_for_regions(subscription_id, [region])[region]
+
+    def get_quota_limits_for_regions(
+        self, subscription_id: str, regions: list[str]
+    ) -> dict[str, dict[str, UsageQuotaLimit]]:
+        """
+        Get and cache compute and network usage quota limits for a subscription in several
+        regions. Regions with fresh enough quotas in the inventory store are served from it;
+        every other uncached (region, provider) pair is fetched concurrently. The regions that
+        were listed are cached even if others failed, so a retry only lists the failed ones.
+
+        Args:
+            subscription_id: Subscription to get quotas for
+            regions: Regions to get quotas for
+
+        Returns:
+            Dict of region to a dict of quota name to quota check
+
+        Raises:
+            RuntimeError: If the quotas of any region could not be listed
+        """
+        quota_limits = {
+            region: quotas
+            for region in dict.fromkeys(regions)
+            if (quotas := self._quota_cache.get(subscription_id, region)) is not None
+        }
+        uncached_regions = [
+            region for region in dict.fromkeys(regions) if region not in quota_limits
+        ]
+        stored_quotas = get_stored_quotas(self._inventory_store, subscription_id, uncached_regions)
+        for region, quotas in stored_quotas.items():
+            self._quota_cache.put(subscription_id, region, quotas)
+            quota_limits[region] = quotas
+        uncached_regions = [region for region in uncached_regions if region not in stored_quotas]
+        requests = [
+            (region, provider) for region in uncached_regions for provider in QUOTA_PROVIDERS
+        ]
+        results = map_concurrently(
+            lambda request: self._list_usages(subscription_id, *request),
+            requests,
+            self._concurrency,
+        )
+        region_quotas = merge_provider_quotas(results)
+        for region, quotas in region_quotas.quotas.items():
+            self._quota_cache.put(subscription_id, region, quotas)
+            quota_limits[region] = quotas
+        put_stored_quotas(self._inventory_store, subscription_id, region_quotas.quotas)
+        raise_for_failed_regions(subscription_id, region_quotas)
+        return {region: quota_limits[region] for region in regions}
+
+    def _list_usages(
+        self, subscription_id: str, region: str, provider: str
+    ) -> list[UsageQuotaLimit]:
+        """List the usage quota limits of a single resource provider in a region"""
+        usages: ItemPaged[ComputeUsage] | ItemPaged[NetworkUsage]
+        if provider == "compute":
             # Get compute quotas (cores)
-            compute_usage = self._compute_client(
-                subscription_id).usage.list(region)
+            usages = self._compute_client(subscription_id).usage.list(region)
+        else:
             # Get network quotas (public IPs)
-            network_usage = self._network_client(
-                subscription_id).usages.list(region)
-            # Cache quotas for this subscription and region
-            self._quotas[subscription_id, region] = {
-                usage.name.value: UsageQuotaLimit(
-                    name=usage.name.value,
-                    display_name=usage.name.localized_value,
-                    limit=usage.limit,
-                    usage=usage.current_value,
-                )
-                for usage in [*compute_usage, *network_usage]
-            }
-            return self._quotas[subscription_id, region]
-        except Exception as e:
-            raise RuntimeError(
-                f"Failed to get quotas for subscription {subscription_id} in region {region}: {str(e)}"
-            ) from e
+            usages = self._network_client(subscription_id).usages.list(region)
+        return [to_usage_quota_limit(usage) for usage in usages]
 
     def _compute_client(self, subscription_id: str) -> ComputeManagementClient:
         return self._azure_client_factory.get_compute_client(subscription_id)
 
     def _network_client(self, subscription_id: str) -> NetworkManagementClient:
         return self._azure_client_factory.get_network_client(subscription_id)
+
+
+def to_usage_quota_limit(usage: ComputeUsage | NetworkUsage) -> UsageQuotaLimit:
+    """
+    Convert a compute or network usage returned by Azure to a usage quota limit.
+
+    Raises:
+        ValueError: If the usage has no name, which quotas are looked up by
+    """
+    if usage.name is None or usage.name.value is None:
+        raise ValueError(f"Usage has no name: {usage}")
+    return UsageQuotaLimit(
+        name=usage.name.value,
+        # The name is shown when Azure gives no display name
+        display_name=usage.name.localized_value or usage.name.value,
+        limit=usage.limit,
+        usage=usage.current_value,
+    )
+
+
+def merge_provider_quotas(
+    results: list[TaskResult[tuple[str, str], list[UsageQuotaLimit]]],
+) -> RegionQuotas:
+    """
+    Merge the quotas listed for each (region, provider) pair into one map per region. A region
+    is only merged if every one of its providers was listed; otherwise its error is recorded.
+    """
+    region_quotas = RegionQuotas()
+    for result in results:
+        region, _ = result.item
+        if result.error is not None:
+            region_quotas.errors.setdefault(region, result.error)
+    for result in results:
+        region, _ = result.item
+        if region not in region_quotas.errors:
+            quotas = region_quotas.quotas.setdefault(region, {})
+            quotas.update((usage.name, usage) for usage in result.result or [])
+    return region_quotas
+
+
+def get_stored_quotas(
+    inventory_store: InventoryStore | None, subscription_id: str, regions: list[str]
+) -> dict[str, dict[str, UsageQuotaLimit]]:
+    """Get the fresh enough quotas of several regions of a subscription from the inventory store"""
+    if inventory_store is None:
+        return {}
+    return {
+        region: quotas
+        for region in regions
+        if (quotas := inventory_store.get_quotas(subscription_id, region)) is not None
+    }
+
+
+def put_stored_quotas(
+    inventory_store: InventoryStore | None,
+    subscription_id: str,
+    quotas: dict[str, dict[str, UsageQuotaLimit]],
+) -> None:
+    """Write the quotas listed for several regions of a subscription to the inventory store"""
+    if inventory_store is None:
+        return
+    for region, region_quotas in quotas.items():
+        inventory_store.put_quotas(subscription_id, region, region_quotas)
+
+
+def raise_for_failed_regions(subscription_id: str, region_quotas: RegionQuotas) -> None:
+    """
+    Raise the error of the first region whose quotas could not be listed, if any.
+
+    Raises:
+        RuntimeError: If the quotas of any region could not be listed
+    """
+    for region, error in region_quotas.errors.items():
+        raise RuntimeError(
+            f"Failed to get quotas for subscription {subscription_id} in region {region}: "
+            f"{str(error)}"
+        ) from error
@@ -0,0 +1,212 @@
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from datetime import timedelta
+from pathlib import Path
+from typing import Any
+
+from preflight_check import log
+
+from .. import models
+
+# Name of the inventory database file in the cache directory
+INVENTORY_STORE_FILENAME = "inventory.sqlite3"
+# Version of the schema below; databases written with another version are emptied and
+# recreated, since the store only holds data that can be fetched again
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+    DROP TABLE IF EXISTS subscriptions;
+    DROP TABLE IF EXISTS vm_counts;
+    DROP TABLE IF EXISTS quotas;
+    CREATE TABLE subscriptions (
+        principal_id TEXT PRIMARY KEY,
+        subscriptions TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    );
+    CREATE TABLE vm_counts (
+        subscription_id TEXT NOT NULL,
+        count_method TEXT NOT NULL,
+        vm_counts TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (subscription_id, count_method)
+    );
+    CREATE TABLE quotas (
+        subscription_id TEXT NOT NULL,
+        region TEXT NOT NULL,
+        quotas TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (subscription_id, region)
+    );
+"""
+
+
+class InventoryStore:
+    """
+    Local SQLite store of subscriptions, VM counts and quota usage, shared between runs.
+
+    Every entry is written with the time it was fetched, and is only served while it is
+    younger than the maximum age, so that reruns can skip Azure for data that is fresh enough
+    and fetch only what is stale. The store is best effort: if the database cannot be read or
+    written, entries are treated as missing.
+    """
+
+    _path: Path
+    _max_age: timedelta
+    """Identifies how VM counts are counted; only counts counted the same way are served"""
+    _count_method: str
+    _clock: Callable[[], float]
+    _connection: sqlite3.Connection | None
+    """Guards the connection, which is shared by the threads of concurrent services"""
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        path: Path,
+        max_age: timedelta = timedelta(0),
+        clock: Callable[[], float] = time.time,
+        count_method: str = "",
+    ) -> None:
+        """
+        Args:
+            path: Path of the SQLite database file
+            max_age: How long entries are served before they are fetched again; entries are
+                still written with a maximum age of zero, for later runs
+            clock: Returns the current time in seconds since the epoch
+            count_method: Identifies how VM counts are counted, such as the inventory backend
+                and scale set count strategy; VM counts are stored and served per method
+        """
+        self._path = path
+        self._max_age = max_age
+        self._count_method = count_method
+        self._clock = clock
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def get_subscriptions(self, principal_id: str) -> list[models.Subscription] | None:
+        """Get the fresh subscriptions available to a principal, or None if they are stale"""
+        rows = self._select(
+            "SELECT subscriptions FROM subscriptions WHERE principal_id = ? AND fetched_at >= ?",
+            (principal_id, self._oldest_fresh_time()),
+        )
+        if not rows:
+            return None
+        return [
+            models.Subscription(id=sub["id"], name=sub["name"], regions={})
+            for sub in json.loads(rows[0][0])
+        ]
+
+    def put_subscriptions(
+        self, principal_id: str, subscriptions: list[models.Subscription]
+    ) -> None:
+        """Store the subscriptions available to a principal"""
+        self._execute(
+            "INSERT OR REPLACE INTO subscriptions VALUES (?, ?, ?)",
+            [
+                (
+                    principal_id,
+                    json.dumps([{"id": sub.id, "name": sub.name} for sub in subscriptions]),
+                    self._clock(),
+                )
+            ],
+        )
+
+    def get_vm_counts(self, subscription_ids: list[str]) -> dict[str, dict[str, int]]:
+        """
+        Get the fresh VM counts of several subscriptions.
+
+        Returns:
+            Map from subscription ID to a map of region name to VM count, for each subscription
+            with fresh VM counts
+        """
+        vm_counts: dict[str, dict[str, int]] = {}
+        oldest_fresh_time = self._oldest_fresh_time()
+        for subscription_id, counts in self._select(
+            "SELECT subscription_id, vm_counts FROM vm_counts"
+            " WHERE count_method = ? AND fetched_at >= ?",
+            (self._count_method, oldest_fresh_time),
+        ):
+            vm_counts[subscription_id] = json.loads(counts)
+        return {
+            subscription_id: vm_counts[subscription_id]
+            for subscription_id in subscription_ids
+            if subscription_id in vm_counts
+        }
+
+    def put_vm_counts(self, vm_counts: dict[str, dict[str, int]]) -> None:
+        """Store the VM counts of several subscriptions"""
+        fetched_at = self._clock()
+        self._execute(
+            "INSERT OR REPLACE INTO vm_counts VALUES (?, ?, ?, ?)",
+            [
+                (subscription_id, self._count_method, json.dumps(counts), fetched_at)
+                for subscription_id, counts in vm_counts.items()
+            ],
+        )
+
+    def get_quotas(
+        self, subscription_id: str, region: str
+    ) -> dict[str, models.UsageQuotaLimit] | None:
+        """Get the fresh quotas of a subscription in a region, or None if they are stale"""
+        rows = self._select(
+            "SELECT quotas FROM quotas"
+            " WHERE subscription_id = ? AND region = ? AND fetched_at >= ?",
+            (subscription_id, region, self._oldest_fresh_time()),
+        )
+        if not rows:
+            return None
+        return {
+            name: models.UsageQuotaLimit(**quota) for name, quota in json.loads(rows[0][0]).items()
+        }
+
+    def put_quotas(
+        self, subscription_id: str, region: str, quotas: dict[str, models.UsageQuotaLimit]
+    ) -> None:
+        """Store the quotas of a subscription in a region"""
+        self._execute(
+            "INSERT OR REPLACE INTO quotas VALUES (?, ?, ?, ?)",
+            [
+                (
+                    subscription_id,
+                    region,
+                    json.dumps({name: vars(quota) for name, quota in quotas.items()}),
+                    self._clock(),
+                )
+            ],
+        )
+
+    def _oldest_fresh_time(self) -> float:
+        """Get the time before which entries are stale"""
+        return self._clock() - self._max_age.total_seconds()
+
+    def _select(self, query: str, parameters: tuple[Any, ...]) -> list[tuple[Any, ...]]:
+        if self._max_age <= timedelta(0):
+            return []
+        try:
+            with self._lock:
+                return self._connect().execute(query, parameters).fetchall()
+        except (sqlite3.Error, OSError) as e:
+            log.debug(f"Failed to read inventory store {self._path}: {str(e)}")
+            return []
+
+    def _execute(self, statement: str, parameters: list[tuple[Any, ...]]) -> None:
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(statement, parameters)
+        except (sqlite3.Error, OSError) as e:
+            log.debug(f"Failed to write inventory store {self._path}: {str(e)}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the database on first use; must be called with the lock held"""
+        if self._connection is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self._path, check_same_thread=False)
+            (version,) = connection.execute("PRAGMA user_version").fetchone()
+            if version != _SCHEMA_VERSION:
+                connection.executescript(_SCHEMA + f"PRAGMA user_version = {_SCHEMA_VERSION};")
+            self._connection = connection
+        return self._connection
@@ -1,28 +1,82 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 from .. import models
-from . import azure
+from .concurrency import DEFAULT_CONCURRENCY, map_concurrently
+from .inventory import (
+    ComputeInventoryBackend,
+    InventoryBackend,
+    InventoryResult,
+    VmssCountStrategy,
+    filter_regions,
+)
+from .store import InventoryStore
+
+if TYPE_CHECKING:
+    from . import azure
 
 
 class SubscriptionService:
     """Handles all interactions with Azure models.Subscriptions"""
 
     _azure: azure.AzureClientFactory
-    _subscriptions: dict[str, models.Subscription] = {}
+    """Map from ID to every subscription listed or fetched so far"""
+    _subscriptions: dict[str, models.Subscription]
+    """Whether every subscription available to the principal has been listed"""
+    _listed: bool
+    """IDs of subscriptions that were fetched and not found"""
+    _missing: set[str]
+    _concurrency: int
+    _inventory: InventoryBackend
+    _inventory_store: InventoryStore | None
+    _principal_id: str
 
-    def __init__(self, azure_client_factory: azure.AzureClientFactory) -> None:
+    def __init__(
+        self,
+        azure_client_factory: azure.AzureClientFactory,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        vmss_count_strategy: VmssCountStrategy = VmssCountStrategy.CAPACITY,
+        inventory_backend: InventoryBackend | None = None,
+        inventory_store: InventoryStore | None = None,
+        principal_id: str = "",
+    ) -> None:
+        """
+        Args:
+            azure_client_factory: Factory for the Azure clients used by the service
+            concurrency: Maximum number of subscriptions fetched or enumerated in parallel
+            vmss_count_strategy: How scale set instances are counted
+            inventory_backend: Backend used to count VMs; defaults to walking the compute API
+                of each subscription
+            inventory_store: Local store that fresh enough subscriptions and VM counts are
+                served from, and fetched ones are written to
+            principal_id: ID of the authenticated principal, which the stored subscriptions
+                are kept for
+        """
         self.azure_client_factory = azure_client_factory
-        self.get_subscriptions()
+        self._subscriptions = {}
+        self._listed = False
+        self._missing = set()
+        self._concurrency = concurrency
+        self._inventory_store = inventory_store
+        self._principal_id = principal_id
+        self._inventory = inventory_backend or ComputeInventoryBackend(
+            azure_client_factory, concurrency, vmss_count_strategy
+        )
 
     def get_subscriptions(self) -> list[models.Subscription]:
         """
         Get all subscriptions available to the authenticated principal.
+        The subscriptions are listed on first use, unless fresh ones are stored.
 
         Returns:
             List of models.Subscription objects
         """
-        if not self._subscriptions:
+        self._load_stored_subscriptions()
+        if not self._listed:
             try:
                 subs = self._subscription_client().subscriptions.list()
-                self._subscriptions = {
+                listed_subscriptions = {
                     sub.subscription_id: models.Subscription(
                         id=sub.subscription_id or "",
                         name=sub.display_name or "",
@@ -32,15 +86,119 @@ class SubscriptionService:
                 }
             except Exception as e:
                 raise RuntimeError(f"Failed to list subscriptions: {str(e)}") from e
+            self._add_listed_subscriptions(listed_subscriptions)
+            if self._inventory_store is not None:
+                self._inventory_store.put_subscriptions(
+                    self._principal_id, list(listed_subscriptions.values())
+                )
         return list(self._subscriptions.values())
 
+    def get_subscriptions_by_id(
+        self, subscription_ids: list[str]
+    ) -> dict[str, models.Subscription]:
+        """
+        Get several subscriptions by ID without listing every subscription of the tenant.
+        Subscriptions that are not known yet are fetched one by one, concurrently.
+
+        Args:
+            subscription_ids: IDs of the subscriptions to get
+
+        Returns:
+            Map from subscription ID to subscription, for each subscription that was found
+        """
+        self._load_stored_subscriptions()
+        unknown_ids = [
+            subscription_id
+            for subscription_id in dict.fromkeys(subscription_ids)
+            if subscription_id not in self._subscriptions
+            and subscription_id not in self._missing
+            and not self._listed
+        ]
+        for task in map_concurrently(self._fetch_subscription, unknown_ids, self._concurrency):
+            if task.error is not None:
+                raise RuntimeError(
+                    f"Failed to get subscription {task.item}: {str(task.error)}"
+                ) from task.error
+            if task.result is None:
+                self._missing.add(task.item)
+            else:
+                self._subscriptions[task.item] = task.result
+        return {
+            subscription_id: self._subscriptions[subscription_id]
+            for subscription_id in subscription_ids
+            if subscription_id in self._subscriptions
+        }
+
     def get_subscription(self, subscription_id: str) -> models.Subscription:
         """
-        Get a subscription by ID.
+        Get a subscription by ID, fetching it if it is not known yet.
         """
-        if subscription_id not in self._subscriptions:
+        subscription = self.get_subscriptions_by_id([subscription_id]).get(subscription_id)
+        if subscription is None:
             raise ValueError(f"models.Subscription {subscription_id} not found")
-        return self._subscriptions[subscription_id]
+        return subscription
+
+    def get_location_names(self, subscription_id: str) -> set[str]:
+        """Get the lowercase names of the locations available to a subscription"""
+        try:
+            locations = self._subscription_client().subscriptions.list_locations(subscription_id)
+            return {location.name.lower() for location in locations if location.name}
+        except Exception as e:
+            raise RuntimeError(
+                f"Failed to list locations of subscription {subscription_id}: {str(e)}"
+            ) from e
+
+    def get_available_regions(
+        self, subscription_ids: list[str], regions: list[str]
+    ) -> dict[str, list[str]]:
+        """
+        Keep, for each subscription, the regions that are available to it, listing the
+        locations of the subscriptions concurrently. VMs are listed in each region they are
+        counted in, and listing a region unknown to a subscription fails the subscription.
+
+        Args:
+            subscription_ids: IDs of the subscriptions to check the regions against
+            regions: Lowercase names of the regions to keep
+
+        Returns:
+            Map from subscription ID to the names of the regions available to it, in the order
+            they were given
+        """
+        results = map_concurrently(
+            self.get_location_names, list(dict.fromkeys(subscription_ids)), self._concurrency
+        )
+        for task in results:
+            if task.error is not None:
+                raise task.error
+        return {
+            task.item: [region for region in regions if region in (task.result or set())]
+            for task in results
+        }
+
+    def get_subscriptions_vms(
+        self, subscriptions: list[models.Subscription], regions: list[str] | None = None
+    ) -> dict[str, Exception]:
+        """
+        Count VMs in each region for several subscriptions with the inventory backend.
+        Each subscription's regions are updated in place, as with get_subscription_vms.
+        Subscriptions with fresh enough VM counts in the inventory store are not enumerated.
+
+        Args:
+            subscriptions: The subscriptions to enumerate
+            regions: Names of the only regions to count VMs in, so that VMs and scale sets in
+                other regions are never listed; all regions if None
+
+        Returns:
+            Map from subscription ID to the error raised while enumerating it, for each
+            subscription that could not be enumerated
+        """
+        stored_vm_counts = get_stored_vm_counts(self._inventory_store, subscriptions, regions)
+        inventory = self._inventory.count_vms(
+            [sub.id for sub in subscriptions if sub.id not in stored_vm_counts], regions
+        )
+        return apply_inventory_result(
+            self._inventory_store, subscriptions, stored_vm_counts, inventory, regions
+        )
 
     def get_subscription_vms(self, subscription: models.Subscription) -> models.Subscription:
         """
@@ -53,52 +211,102 @@ class SubscriptionService:
         Returns:
             Updated models.Subscription object with region VM counts
         """
-        try:
-            # Track instances by region
-            vm_counts: dict[str, int] = {}
-
-            # List all VMs in the subscription
-            for vm in self._compute_client(subscription.id).virtual_machines.list_all():
-                region = vm.location.lower()
-                vm_counts[region] = vm_counts.get(region, 0) + 1
-
-            # List all VMSS VMs in the subscription
-            for vmss in self._compute_client(subscription.id).virtual_machine_scale_sets.list_all():
-                region = vmss.location.lower()
-                vmss_resource_group_name = _get_resource_group_name_from_vmss_id(vmss.id)
-                for _ in self._compute_client(subscription.id).virtual_machine_scale_set_vms.list(
-                    vmss_resource_group_name, vmss.name
-                ):
-                    vm_counts[region] = vm_counts.get(region, 0) + 1
-
-            # Convert to Region objects
-            subscription.regions = {
-                region_name: models.Region(name=region_name, vm_count=vm_count)
-                for region_name, vm_count in vm_counts.items()
-            }
-
-            return subscription
-
-        except Exception as e:
+        failures = self.get_subscriptions_vms([subscription])
+        if subscription.id in failures:
             # TODO: Better error handling
-            raise RuntimeError(
-                f"Failed to count VMs in subscription {subscription.id}: {str(e)}"
-            ) from e
+            raise failures[subscription.id]
+        return subscription
 
-    def _compute_client(self, subscription_id: str) -> azure.ComputeManagementClient:
-        return self.azure_client_factory.get_compute_client(subscription_id)
+    def _load_stored_subscriptions(self) -> None:
+        """Use the fresh subscriptions of the inventory store as the listed subscriptions"""
+        if self._listed or self._inventory_store is None:
+            return
+        stored_subscriptions = self._inventory_store.get_subscriptions(self._principal_id)
+        if stored_subscriptions is not None:
+            self._add_listed_subscriptions({sub.id: sub for sub in stored_subscriptions})
+
+    def _add_listed_subscriptions(self, subscriptions: dict[str, models.Subscription]) -> None:
+        """
+        Record every subscription available to the principal, keeping the subscriptions that
+        were already fetched, whose regions may have been counted
+        """
+        self._subscriptions = {**subscriptions, **self._subscriptions}
+        self._listed = True
+
+    def _fetch_subscription(self, subscription_id: str) -> models.Subscription | None:
+        """Fetch a single subscription, or return None if it is not found or not accessible"""
+        from azure.core.exceptions import HttpResponseError
+
+        try:
+            sub = self._subscription_client().subscriptions.get(subscription_id)
+        except HttpResponseError as e:
+            if e.status_code in (403, 404):
+                return None
+            raise
+        return models.Subscription(
+            id=sub.subscription_id or subscription_id, name=sub.display_name or "", regions={}
+        )
 
     def _subscription_client(self) -> azure.SubscriptionClient:
         return self.azure_client_factory.get_subscription_client()
 
-def _get_resource_group_name_from_vmss_id(vmss_id: str) -> str:
+
+def _set_vm_counts(subscription: models.Subscription, vm_counts: dict[str, int]) -> None:
+    """Replace a subscription's regions with the given VM counts"""
+    subscription.regions = {
+        region_name: models.Region(name=region_name, vm_count=vm_count)
+        for region_name, vm_count in vm_counts.items()
+    }
+
+
+def get_stored_vm_counts(
+    inventory_store: InventoryStore | None,
+    subscriptions: list[models.Subscription],
+    regions: list[str] | None = None,
+) -> dict[str, dict[str, int]]:
+    """
+    Get the fresh enough VM counts of several subscriptions from the inventory store, keeping
+    only the given regions if any
     """
-    Extract the resource group name from a VMSS ID.
+    if inventory_store is None:
+        return {}
+    return {
+        subscription_id: filter_regions(vm_counts, regions)
+        for subscription_id, vm_counts in inventory_store.get_vm_counts(
+            [sub.id for sub in subscriptions]
+        ).items()
+    }
 
-    VMSS ID format: /subscriptions/{subscriptionId}/resourceGroups/{resourceGroupName}/providers/Microsoft.Compute/virtualMachineScaleSets/{vmScaleSetName}
+
+def apply_inventory_result(
+    inventory_store: InventoryStore | None,
+    subscriptions: list[models.Subscription],
+    stored_vm_counts: dict[str, dict[str, int]],
+    inventory: InventoryResult,
+    regions: list[str] | None = None,
+) -> dict[str, Exception]:
     """
-    id_parts = vmss_id.split("/")
-    if len(id_parts) != 9:
-        raise RuntimeError(f"Invalid VMSS ID: {vmss_id}")
+    Store the VM counts counted by an inventory backend, and update the regions of each
+    subscription with its stored or counted VM counts.
+
+    Counts limited to some regions are not stored, since the store holds the VM counts of
+    every region of a subscription.
 
-    return id_parts[4]
+    Returns:
+        Map from subscription ID to the error raised while enumerating it, for each
+        subscription that could not be enumerated
+    """
+    if inventory_store is not None and regions is None:
+        inventory_store.put_vm_counts(inventory.vm_counts)
+    vm_counts = {**stored_vm_counts, **inventory.vm_counts}
+    for subscription in subscriptions:
+        if subscription.id in vm_counts:
+            _set_vm_counts(subscription, vm_counts[subscription.id])
+    failures: dict[str, Exception] = {}
+    for subscription_id, error in inventory.errors.items():
+        failure = RuntimeError(
+            f"Failed to count VMs in subscription {subscription_id}: {str(error)}"
+        )
+        failure.__cause__ = error
+        failures[subscription_id] = failure
+    return failures
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, cast
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from azure.core.credentials import (
+        AccessToken,
+        AccessTokenInfo,
+        SupportsTokenInfo,
+        TokenCredential,
+        TokenRequestOptions,
+    )
+    from azure.core.credentials_async import AsyncSupportsTokenInfo, AsyncTokenCredential
+
+# Upper bounds of the latency histogram buckets, in milliseconds; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+# Operation recorded for access token requests
+GET_TOKEN_OPERATION = "credential get_token"
+# Phase that calls made outside of any phase are attributed to
+NO_PHASE = "other"
+
+
+@dataclass
+class OperationStats:
+    """Counters of the calls made for one operation"""
+
+    calls: int = 0
+    """Calls that failed, or returned a status code of 400 or more"""
+    errors: int = 0
+    """Successful responses to list requests; one per page of results"""
+    pages: int = 0
+    """Bytes received in response bodies"""
+    bytes: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    """Number of calls in each bucket of LATENCY_BUCKETS_MS, plus one for slower calls"""
+    latency_histogram: list[int] = field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    )
+
+    def record(self, seconds: float, error: bool, page: bool, size: int) -> None:
+        self.calls += 1
+        self.errors += error
+        self.pages += page
+        self.bytes += size
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "pages": self.pages,
+            "bytes": self.bytes,
+            "total_ms": round(self.total_seconds * 1000, 1),
+            "mean_ms": round(self.total_seconds * 1000 / self.calls, 1) if self.calls else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 1),
+            "latency_histogram_ms": {
+                bucket: count
+                for bucket, count in zip(
+                    [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"],
+                    self.latency_histogram,
+                    strict=True,
+                )
+                if count
+            },
+        }
+
+
+@dataclass
+class _PhaseStats:
+    """Wall clock time of one phase and the calls made during it"""
+
+    seconds: float = 0.0
+    """Map from operation name to its counters"""
+    operations: dict[str, OperationStats] = field(default_factory=dict)
+
+
+class Telemetry:
+    """
+    Records the time spent in each phase of a run and the Azure calls made during it.
+
+    Calls are attributed to the innermost phase that is running when they finish, and to their
+    operation, such as "GET Microsoft.Compute/virtualMachines". Safe to use from several
+    threads and from event loops.
+    """
+
+    _clock: Callable[[], float]
+    """Map from phase name to its stats, in the order the phases first started"""
+    _phases: dict[str, _PhaseStats]
+    """Names of the running phases, innermost last"""
+    _running: list[str]
+    """Guards the phases"""
+    _lock: threading.Lock
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        """
+        Args:
+            clock: Returns the current time in seconds, for measuring durations
+        """
+        self._clock = clock
+        self._phases = {}
+        self._running = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a phase; phases with the same name add up"""
+        start = self._clock()
+        with self._lock:
+            self._phases.setdefault(name, _PhaseStats())
+            self._running.append(name)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running.remove(name)
+                self._phases[name].seconds += self._clock() - start
+
+    def record_call(
+        self,
+        operation: str,
+        seconds: float,
+        error: bool = False,
+        page: bool = False,
+        size: int = 0,
+    ) -> None:
+        """
+        Record a call to Azure.
+
+        Args:
+            operation: Name of the operation called
+            seconds: How long the call took
+            error: Whether the call failed
+            page: Whether the call returned a page of list results
+            size: Number of bytes received
+        """
+        with self._lock:
+            phase = self._phases.setdefault(
+                self._running[-1] if self._running else NO_PHASE, _PhaseStats()
+            )
+            phase.operations.setdefault(operation, OperationStats()).record(
+                seconds, error, page, size
+            )
+
+    @contextmanager
+    def time_call(self, operation: str) -> Iterator[None]:
+        """Record the code run in the context as a call, which failed if it raises"""
+        start = self._clock()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.record_call(operation, self._clock() - start, error=error)
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Summarize the phases and calls recorded so far.
+
+        Returns:
+            Map from phase name to its duration and a summary of each operation called in it
+        """
+        with self._lock:
+            return {
+                name: {
+                    "duration_ms": round(phase.seconds * 1000, 1),
+                    "operations": {
+                        operation: stats.summary()
+                        for operation, stats in sorted(phase.operations.items())
+                    },
+                }
+                for name, phase in self._phases.items()
+            }
+
+
+class InstrumentedCredential:
+    """Records every access token request of a credential as a call"""
+
+    _credential: TokenCredential
+    _telemetry: Telemetry
+
+    def __init__(self, credential: TokenCredential, telemetry: Telemetry) -> None:
+        self._credential = credential
+        self._telemetry = telemetry
+
+    def get_token(
+        self,
+        *scopes: str,
+        claims: str | None = None,
+        tenant_id: str | None = None,
+        enable_cae: bool = False,
+    ) -> AccessToken:
+        with self._telemetry.time_call(GET_TOKEN_OPERATION):
+            return self._credential.get_token(
+                *scopes, claims=claims, tenant_id=tenant_id, enable_cae=enable_cae
+            )
+
+    def get_token_info(
+        self, *scopes: str, options: TokenRequestOptions | None = None
+    ) -> AccessTokenInfo:
+        with self._telemetry.time_call(GET_TOKEN_OPERATION):
+            if hasattr(self._credential, "get_token_info"):
+                return cast("SupportsTokenInfo", self._credential).get_token_info(
+                    *scopes, options=options
+                )
+            from azure.core.credentials import AccessTokenInfo
+
+            token = self._credential.get_token(*scopes, **(options or {}))
+            return AccessTokenInfo(token.token, token.expires_on)
+
+    def close(self) -> None:
+        # close is not part of the TokenCredential protocol
+        close = getattr(self._credential, "close", None)
+        if close is not None:
+            close()
+
+
+class AsyncInstrumentedCredential:
+    """Records every access token request of an async credential as a call"""
+
+    _credential: AsyncTokenCredential
+    _telemetry: Telemetry
+
+    def __init__(self, credential: AsyncTokenCredential, telemetry: Telemetry) -> None:
+        self._credential = credential
+        self._telemetry = telemetry
+
+    async def get_token(
+        self,
+        *scopes: str,
+        claims: str | None = None,
+        tenant_id: str | None = None,
+        enable_cae: bool = False,
+    ) -> AccessToken:
+        with self._telemetry.time_call(GET_TOKEN_OPERATION):
+            return await self._credential.get_token(
+                *scopes, claims=claims, tenant_id=tenant_id, enable_cae=enable_cae
+            )
+
+    async def get_token_info(
+        self, *scopes: str, options: TokenRequestOptions | None = None
+    ) -> AccessTokenInfo:
+        with self._telemetry.time_call(GET_TOKEN_OPERATION):
+            if hasattr(self._credential, "get_token_info"):
+                return await cast("AsyncSupportsTokenInfo", self._credential).get_token_info(
+                    *scopes, options=options
+                )
+            from azure.core.credentials import AccessTokenInfo
+
+            token = await self._credential.get_token(*scopes, **(options or {}))
+            return AccessTokenInfo(token.token, token.expires_on)
+
+    async def close(self) -> None:
+        await self._credential.close()
+
+
+def get_operation(method: str, url: str) -> tuple[str, bool]:
+    """
+    Name the Azure Resource Manager operation of a request after its resource type.
+
+    For example, GET /subscriptions/{id}/providers/Microsoft.Compute/virtualMachines is
+    "GET Microsoft.Compute/virtualMachines".
+
+    Returns:
+        The operation name, and whether the request lists a collection of resources
+    """
+    segments = [segment for segment in urlparse(url).path.split("/") if segment]
+    lowered = [segment.lower() for segment in segments]
+    if "providers" in lowered:
+        start = len(lowered) - 1 - lowered[::-1].index("providers")
+        namespace, *rest = segments[start + 1 :] or [""]
+        types = rest[::2]
+        is_collection = len(rest) % 2 == 1
+        return f"{method} {'/'.join([namespace, *types])}", is_collection
+    # Subscription, resource group and tenant level requests, e.g. /subscriptions/{id}
+    types = segments[::2]
+    return f"{method} {'/'.join(types)}", len(segments) % 2 == 1
@@ -0,0 +1,272 @@
+import random
+import re
+import threading
+import time
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+# Maximum number of requests in flight to Azure Resource Manager for a single subscription
+DEFAULT_SUBSCRIPTION_CONCURRENCY = 16
+# Maximum number of requests in flight to Azure Resource Manager for the whole tenant
+DEFAULT_TENANT_CONCURRENCY = 64
+# Remaining request budget below which the concurrency of a subscription or tenant stops growing
+DEFAULT_LOW_WATERMARK = 50
+# Base and cap of the backoff after a throttled response without a Retry-After header
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_CAP_SECONDS = 60.0
+# Fraction of the Retry-After delay added at random, so that throttled requests don't all
+# retry at the same moment
+RETRY_AFTER_JITTER = 0.2
+
+# Key of the limit shared by every request of the tenant
+TENANT_KEY = "tenant"
+
+_SUBSCRIPTION_PATTERN = re.compile(r"/subscriptions/([^/?]+)", re.IGNORECASE)
+# Headers with the remaining request budget of the subscription or tenant, such as
+# x-ms-ratelimit-remaining-subscription-reads
+_REMAINING_HEADER_PREFIX = "x-ms-ratelimit-remaining-"
+# Header with the remaining budget of resource provider specific limits, such as
+# "Microsoft.Compute/HighCostGet3Min;107,Microsoft.Compute/HighCostGet30Min;672"
+_REMAINING_RESOURCE_HEADER = "x-ms-ratelimit-remaining-resource"
+
+
+@dataclass
+class ThrottlingStats:
+    """Counters of the requests that went through a throttling scheduler"""
+
+    """Attempts started, including retries"""
+    requests: int = 0
+    """Responses with status 429, or 503 with a Retry-After header"""
+    throttles: int = 0
+    """Attempts that retried a request"""
+    retries: int = 0
+    """Total time requests waited for a throttled subscription or tenant to cool down"""
+    backoff_seconds: float = 0.0
+
+
+@dataclass
+class _AdaptiveLimit:
+    """Additive increase, multiplicative decrease concurrency limit of one subscription or tenant"""
+
+    limit: float
+    max_limit: int
+    in_flight: int = 0
+    """Monotonic time before which no request is started"""
+    cooldown_until: float = 0.0
+    """Number of throttled responses since the last successful one"""
+    consecutive_throttles: int = 0
+
+
+class ThrottlingScheduler:
+    """
+    Schedules every request sent to Azure Resource Manager by the clients of a factory.
+
+    Each subscription, and the tenant as a whole, has a concurrency limit that starts at its
+    maximum. A throttled response halves the limit of its subscription, or of the tenant for
+    requests outside any subscription or when the tenant's budget is exhausted, and pauses it
+    until its Retry-After delay, with jitter, has passed. Successful responses grow the limit
+    by one request per limit's worth of responses, until the remaining request budget reported
+    in the x-ms-ratelimit-remaining-* headers falls below the low watermark. Safe to use from
+    several threads and from event loops.
+    """
+
+    _subscription_concurrency: int
+    _tenant_concurrency: int
+    _low_watermark: int
+    _clock: Callable[[], float]
+    _random: random.Random
+    """Map from subscription ID, or TENANT_KEY, to its limit"""
+    _limits: dict[str, _AdaptiveLimit]
+    _stats: ThrottlingStats
+    """Guards the limits and the stats; notified whenever a request finishes"""
+    _condition: threading.Condition
+
+    def __init__(
+        self,
+        subscription_concurrency: int = DEFAULT_SUBSCRIPTION_CONCURRENCY,
+        tenant_concurrency: int = DEFAULT_TENANT_CONCURRENCY,
+        low_watermark: int = DEFAULT_LOW_WATERMARK,
+        clock: Callable[[], float] = time.monotonic,
+        rng: random.Random | None = None,
+    ) -> None:
+        """
+        Args:
+            subscription_concurrency: Maximum number of requests in flight per subscription
+            tenant_concurrency: Maximum number of requests in flight for the whole tenant
+            low_watermark: Remaining request budget below which concurrency stops growing
+            clock: Returns the current monotonic time in seconds
+            rng: Source of the backoff jitter
+        """
+        self._subscription_concurrency = subscription_concurrency
+        self._tenant_concurrency = tenant_concurrency
+        self._low_watermark = low_watermark
+        self._clock = clock
+        self._random = rng or random.Random()
+        self._limits = {}
+        self._stats = ThrottlingStats()
+        self._condition = threading.Condition()
+
+    @property
+    def stats(self) -> ThrottlingStats:
+        """A snapshot of the counters"""
+        with self._condition:
+            return ThrottlingStats(**vars(self._stats))
+
+    def limit(self, key: str) -> int:
+        """Current concurrency limit of a subscription ID or TENANT_KEY"""
+        with self._condition:
+            return int(self._get_limit(key).limit)
+
+    def keys_for_url(self, url: str) -> list[str]:
+        """Get the keys of the limits a request to a URL counts against"""
+        match = _SUBSCRIPTION_PATTERN.search(url)
+        return [TENANT_KEY, match.group(1).lower()] if match else [TENANT_KEY]
+
+    def try_acquire(self, keys: list[str], retry: bool = False) -> float | None:
+        """
+        Start a request if every limit it counts against has room.
+
+        Args:
+            keys: Keys of the limits the request counts against
+            retry: Whether the request is a retry of a throttled or failed attempt
+
+        Returns:
+            None if the request was started, otherwise how long to wait before trying again;
+            zero means waiting until another request finishes
+        """
+        with self._condition:
+            now = self._clock()
+            limits = [self._get_limit(key) for key in keys]
+            cooldown = max(limit.cooldown_until for limit in limits) - now
+            if cooldown > 0:
+                return cooldown
+            if any(limit.in_flight >= int(limit.limit) for limit in limits):
+                return 0.0
+            for limit in limits:
+                limit.in_flight += 1
+            self._stats.requests += 1
+            if retry:
+                self._stats.retries += 1
+            return None
+
+    def acquire(self, keys: list[str], retry: bool = False) -> None:
+        """Start a request, blocking the calling thread until it is allowed to start"""
+        with self._condition:
+            while (delay := self.try_acquire(keys, retry)) is not None:
+                # Wake up when another request finishes, or when the cooldown has passed
+                self._condition.wait(timeout=delay or None)
+
+    def release(self, keys: list[str], status_code: int, headers: Mapping[str, str]) -> None:
+        """
+        Finish a request and adapt the limits it counted against to its response.
+
+        Args:
+            keys: Keys the request was started with
+            status_code: Status code of the response
+            headers: Headers of the response
+        """
+        with self._condition:
+            remaining = _get_remaining_budgets(headers)
+            throttled = status_code == 429 or (status_code == 503 and "retry-after" in headers)
+            if throttled:
+                self._stats.throttles += 1
+            # A throttled request is charged to its subscription, unless it has none or the
+            # tenant has run out of budget
+            throttled_keys = [key for key in keys if key != TENANT_KEY] or [TENANT_KEY]
+            if remaining.get("tenant") == 0:
+                throttled_keys.append(TENANT_KEY)
+            for key in keys:
+                limit = self._get_limit(key)
+                limit.in_flight -= 1
+                scope = "tenant" if key == TENANT_KEY else "subscription"
+                if throttled:
+                    if key in throttled_keys:
+                        self._throttle(limit, headers)
+                elif status_code < 400:
+                    limit.consecutive_throttles = 0
+                    if remaining.get(scope, self._low_watermark) >= self._low_watermark:
+                        limit.limit = min(limit.limit + 1 / limit.limit, limit.max_limit)
+            self._condition.notify_all()
+
+    def cancel(self, keys: list[str]) -> None:
+        """Finish a request that failed without a response"""
+        with self._condition:
+            for key in keys:
+                self._get_limit(key).in_flight -= 1
+            self._condition.notify_all()
+
+    def _throttle(self, limit: _AdaptiveLimit, headers: Mapping[str, str]) -> None:
+        """Halve a throttled limit and pause it for the Retry-After delay, with jitter"""
+        limit.limit = max(limit.limit / 2, 1)
+        limit.consecutive_throttles += 1
+        retry_after = _get_retry_after(headers)
+        if retry_after is not None:
+            delay = retry_after * (1 + self._random.uniform(0, RETRY_AFTER_JITTER))
+        else:
+            # Full jitter exponential backoff
+            delay = self._random.uniform(
+                0,
+                min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2**limit.consecutive_throttles),
+            )
+        now = self._clock()
+        if now + delay > limit.cooldown_until:
+            self._stats.backoff_seconds += now + delay - max(limit.cooldown_until, now)
+            limit.cooldown_until = now + delay
+
+    def _get_limit(self, key: str) -> _AdaptiveLimit:
+        """Get the limit of a key, creating it at its maximum; must be called with the lock held"""
+        if key not in self._limits:
+            max_limit = (
+                self._tenant_concurrency if key == TENANT_KEY else self._subscription_concurrency
+            )
+            self._limits[key] = _AdaptiveLimit(limit=max_limit, max_limit=max_limit)
+        return self._limits[key]
+
+
+def _get_retry_after(headers: Mapping[str, str]) -> float | None:
+    """Get the delay requested by the Retry-After headers of a response, in seconds"""
+    for header, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001)):
+        if header in headers:
+            try:
+                return max(float(headers[header]) * scale, 0.0)
+            except ValueError:
+                pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_remaining_budgets(headers: Mapping[str, str]) -> dict[str, int]:
+    """
+    Get the lowest remaining request budget reported for the subscription and for the tenant.
+
+    Returns:
+        Map from "subscription" or "tenant" to the lowest remaining budget of its limits
+    """
+    budgets: dict[str, int] = {}
+    for header, value in headers.items():
+        header = header.lower()
+        if header == _REMAINING_RESOURCE_HEADER:
+            # Resource provider limits apply to the subscription
+            scope = "subscription"
+            values = [item.rpartition(";")[2] for item in value.split(",")]
+        elif header.startswith(_REMAINING_HEADER_PREFIX):
+            scope = header.removeprefix(_REMAINING_HEADER_PREFIX).partition("-")[0]
+            values = [value]
+        else:
+            continue
+        for remaining in values:
+            try:
+                budgets[scope] = min(budgets.get(scope, int(remaining)), int(remaining))
+            except ValueError:
+                continue
+    return budgets
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import base64
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from preflight_check import log
+
+from .identity import Identity, decode_token_claims
+
+if TYPE_CHECKING:
+    from azure.core.credentials import AccessToken
+    from requests.adapters import BaseAdapter, HTTPAdapter
+
+# Files written to a traffic directory: one JSON line per request, and the identity the
+# requests were sent as
+TRAFFIC_FILENAME = "traffic.jsonl"
+IDENTITY_FILENAME = "identity.json"
+# Lifetime of the access tokens issued during a replay, in seconds
+_REPLAY_TOKEN_LIFETIME = 3600
+
+
+@dataclass
+class Exchange:
+    """A request sent to Azure and the response it got"""
+
+    method: str
+    url: str
+    """Request body; empty for requests without one"""
+    body: str
+    status_code: int
+    headers: dict[str, str]
+    content: str
+    """Seconds from sending the request to receiving the whole response"""
+    seconds: float
+
+
+class TrafficRecorder:
+    """
+    Records the requests sent by the management clients and their responses to a directory,
+    so that the run can be replayed offline with TrafficReplay.
+
+    Request headers are not recorded, so access tokens are never written; only the principal
+    and tenant IDs of the first token are kept, for the replay to authenticate as.
+    """
+
+    directory: Path
+    _identity: Identity | None
+    _lock: threading.Lock
+
+    def __init__(self, directory: Path) -> None:
+        """
+        Args:
+            directory: Directory to write the traffic to, replacing any earlier recording
+        """
+        self.directory = directory
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / TRAFFIC_FILENAME).write_text("")
+        self._identity = None
+        self._lock = threading.Lock()
+
+    def record(self, exchange: Exchange) -> None:
+        with self._lock, open(self.directory / TRAFFIC_FILENAME, "a") as f:
+            f.write(json.dumps(asdict(exchange)) + "\n")
+
+    def record_access_token(self, token: str) -> None:
+        """Record the identity of the first access token that requests are sent with"""
+        with self._lock:
+            if self._identity is not None:
+                return
+            claims = decode_token_claims(token)
+            self._identity = Identity(principal_id=claims["oid"], tenant_id=claims["tid"])
+            (self.directory / IDENTITY_FILENAME).write_text(json.dumps(asdict(self._identity)))
+
+    def wrap_adapter(self, adapter: HTTPAdapter) -> BaseAdapter:
+        """Wrap the adapter of the shared session, recording the requests it sends"""
+        from .adapters import RecordingAdapter
+
+        return RecordingAdapter(adapter, self)
+
+    def close(self) -> None:
+        log.debug(f"Recorded Azure traffic to {self.directory}")
+
+
+class TrafficReplay:
+    """
+    Serves the responses recorded by TrafficRecorder instead of calling Azure.
+
+    Requests are matched on their method, URL and body. A request that was sent several times
+    gets the recorded responses in order, so that throttled requests are throttled again, then
+    the last response for any further attempts.
+    """
+
+    directory: Path
+    identity: Identity
+    """Seconds every response takes; None waits as long as the recorded response took"""
+    latency: float | None
+    _exchanges: dict[tuple[str, str, str], deque[Exchange]]
+    _lock: threading.Lock
+
+    def __init__(self, directory: Path, latency: float | None = None) -> None:
+        """
+        Args:
+            directory: Directory that the traffic was recorded to
+            latency: Seconds every response takes; defaults to the time the recorded response
+                took
+        """
+        self.directory = directory
+        self.latency = latency
+        self._exchanges = {}
+        self._lock = threading.Lock()
+        try:
+            self.identity = Identity(**json.loads((directory / IDENTITY_FILENAME).read_text()))
+            with open(directory / TRAFFIC_FILENAME) as f:
+                for line in f:
+                    exchange = Exchange(**json.loads(line))
+                    key = (exchange.method, exchange.url, exchange.body)
+                    self._exchanges.setdefault(key, deque()).append(exchange)
+        except (OSError, ValueError, TypeError) as e:
+            raise RuntimeError(f"Failed to load recorded traffic from {directory}: {str(e)}") from e
+
+    def respond(self, method: str, url: str, body: str) -> Exchange:
+        """
+        Get the recorded response to a request.
+
+        Raises:
+            RuntimeError: If no response was recorded for the request
+        """
+        with self._lock:
+            exchanges = self._exchanges.get((method, url, body))
+            if not exchanges:
+                raise RuntimeError(f"No response was recorded for {method} {url}")
+            return exchanges.popleft() if len(exchanges) > 1 else exchanges[0]
+
+    def wrap_adapter(self, _adapter: HTTPAdapter) -> BaseAdapter:
+        """Replace the adapter of the shared session with one serving the recorded responses"""
+        from .adapters import ReplayAdapter
+
+        return ReplayAdapter(self)
+
+    def close(self) -> None:
+        pass
+
+
+class ReplayCredential:
+    """Issues unsigned access tokens for the identity that the replayed traffic was sent as"""
+
+    _token: str
+
+    def __init__(self, identity: Identity) -> None:
+        claims = {"oid": identity.principal_id, "tid": identity.tenant_id}
+        payload = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+        self._token = f"replay.{payload}.replay"
+
+    def get_token(self, *_scopes: str, **_kwargs: object) -> AccessToken:
+        from azure.core.credentials import AccessToken
+
+        return AccessToken(self._token, int(time.time()) + _REPLAY_TOKEN_LIFETIME)
+
+    def close(self) -> None:
+        pass
@@ -1,7 +1,7 @@
 import logging
 from enum import Enum
 
-import rich
+import rich.console
 
 
 class LogLevel(int, Enum):
@@ -49,6 +49,10 @@ def set_level(level: LogLevel) -> None:
     log.set_level(level)
 
 
+def is_debug_enabled() -> bool:
+    return log.level <= LogLevel.DEBUG
+
+
 def debug(message: str) -> None:
     log.debug(message)
 
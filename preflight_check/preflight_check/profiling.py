@@ -0,0 +1,121 @@
+import cProfile
+import re
+import sys
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from types import FrameType
+
+# Seconds between two samples of the stacks of every thread
+DEFAULT_SAMPLING_INTERVAL = 0.005
+# Suffixes of the files written by profile()
+PROFILE_SUFFIX = ".prof"
+COLLAPSED_SUFFIX = ".collapsed"
+
+# Suffix that numbers the threads of a pool, such as the "_3" of "ThreadPoolExecutor-0_3"
+_WORKER_NUMBER_PATTERN = re.compile(r"_\d+$")
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread at a fixed interval.
+
+    Unlike cProfile, which only sees the thread it was enabled in and the time spent running
+    Python code, samples include the worker threads and the time spent waiting on the network,
+    so that both show up in a flame graph.
+    """
+
+    _interval: float
+    """Number of times each stack was sampled, keyed by its collapsed representation"""
+    _samples: Counter[str]
+    _stopped: threading.Event
+    _thread: threading.Thread | None
+
+    def __init__(self, interval: float = DEFAULT_SAMPLING_INTERVAL) -> None:
+        """
+        Args:
+            interval: Seconds between two samples
+        """
+        self._interval = interval
+        self._samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def samples(self) -> Counter[str]:
+        return self._samples
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="preflight-check-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def sample(self) -> None:
+        """Sample the stack of every thread except the profiler's own"""
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == threading.get_ident():
+                continue
+            thread_name = _WORKER_NUMBER_PATTERN.sub("", thread_names.get(thread_id, "unknown"))
+            self._samples[";".join([thread_name, *_get_stack(frame)])] += 1
+
+    def write_collapsed(self, path: Path) -> None:
+        """
+        Write the samples in the collapsed stack format read by flamegraph.pl, speedscope and
+        other flame graph tools: one "thread;outermost;...;innermost count" line per stack.
+        """
+        with open(path, "w") as f:
+            for stack, count in sorted(self._samples.items()):
+                f.write(f"{stack} {count}\n")
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._interval):
+            self.sample()
+
+
+@contextmanager
+def profile(path: Path, interval: float = DEFAULT_SAMPLING_INTERVAL) -> Iterator[None]:
+    """
+    Profile the code run in the context.
+
+    Writes the cProfile statistics of the calling thread to path with a .prof suffix, readable
+    by pstats or snakeviz, and the stacks sampled from every thread to path with a .collapsed
+    suffix, readable by flame graph tools. The files are written even if the code raises.
+
+    Args:
+        path: Path of the files to write, without their suffix
+        interval: Seconds between two samples of the stacks
+    """
+    profiler = cProfile.Profile()
+    sampler = SamplingProfiler(interval)
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(path.with_suffix(PROFILE_SUFFIX))
+        sampler.write_collapsed(path.with_suffix(COLLAPSED_SUFFIX))
+
+
+def _get_stack(frame: FrameType | None) -> list[str]:
+    """Get the functions of a stack as "module:qualified name", outermost first"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{frame.f_globals.get('__name__', code.co_filename)}:{code.co_qualname}")
+        frame = frame.f_back
+    # Semicolons separate the frames of a collapsed stack
+    return [function.replace(";", ":") for function in reversed(stack)]
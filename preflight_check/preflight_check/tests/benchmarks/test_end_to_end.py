@@ -0,0 +1,24 @@
+import pytest
+
+from preflight_check import cli
+from preflight_check.benchmarks.end_to_end import measure
+from preflight_check.core import services
+
+
+class TestEndToEndBenchmark:
+    """Test the end-to-end benchmark against a small synthetic tenant"""
+
+    def test_checks_every_subscription_without_azure(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(cli, "console", cli.Console(quiet=True))
+        monkeypatch.setattr(services.AuthService, "_role_definitions", {})
+        monkeypatch.setattr(services.AuthService, "_role_permissions", {})
+        monkeypatch.setattr(services.AuthService, "_assigned_roles", {})
+
+        result = measure(subscription_count=3, latency=0)
+
+        assert result.subscriptions == 3
+        assert result.vms > 0
+        # Subscriptions are listed once, then every subscription has its VMs, scale sets and
+        # scale set instances listed and its role assignments checked
+        assert result.api_calls > 3 * 3
+        assert result.total_seconds > 0
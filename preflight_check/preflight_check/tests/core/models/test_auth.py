@@ -92,6 +92,26 @@ class TestRolePermission:
                 ("Microsoft.Compute/virtualMachines/delete", False),
             ],
         },
+        {
+            "permissions": RolePermissions(
+                actions=[
+                    "Microsoft.Storage/*",
+                    "Microsoft.Web/sites/config/list/Action",
+                ],
+                data_actions=[
+                    "Microsoft.KeyVault/vaults/secrets/*/read",
+                ],
+            ),
+            "cases": [
+                ("Microsoft.Storage/storageAccounts/read", True),
+                # Dots in patterns only match literal dots
+                ("MicrosoftXStorage/storageAccounts/read", False),
+                ("Microsoft.Web/sites/config/list/Action", True),
+                ("Microsoft.Web/sites/config/list/ActionX", False),
+                ("Microsoft.KeyVault/vaults/secrets/mysecret/read", True),
+                ("Microsoft.KeyVault/vaults/secrets/read", False),
+            ],
+        },
     ]
 
     @pytest.mark.parametrize(
@@ -112,3 +132,14 @@ class TestRolePermission:
         assert role_permissions.grants_action(action_string) == expected, (
             f"Expected {expected} for {action_string} in {role_permissions}"
         )
+
+    def test_grants_action_after_permissions_change(self) -> None:
+        """Test that permissions added after the first check are matched"""
+        role_permissions = RolePermissions(actions=["Microsoft.Compute/*/read"])
+        assert not role_permissions.grants_action("Microsoft.Network/virtualNetworks/read")
+
+        role_permissions.actions.extend(["Microsoft.Network/*"])
+        role_permissions.not_actions.extend(["Microsoft.Network/*/delete"])
+
+        assert role_permissions.grants_action("Microsoft.Network/virtualNetworks/read")
+        assert not role_permissions.grants_action("Microsoft.Network/virtualNetworks/delete")
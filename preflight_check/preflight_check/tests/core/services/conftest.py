@@ -0,0 +1,59 @@
+import threading
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class FakeArmServer(ThreadingHTTPServer):
+    """Throttles the first requests to each path, then reports a low remaining budget"""
+
+    def __init__(self, throttled_requests: int) -> None:
+        super().__init__(("127.0.0.1", 0), _FakeArmHandler)
+        self.throttled_requests = throttled_requests
+        self.requests: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+
+class _FakeArmHandler(BaseHTTPRequestHandler):
+    server: FakeArmServer
+
+    def do_GET(self) -> None:
+        with self.server.lock:
+            count = self.server.requests[self.path] = self.server.requests.get(self.path, 0) + 1
+        if count <= self.server.throttled_requests:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("x-ms-ratelimit-remaining-subscription-reads", "0")
+        else:
+            self.send_response(200)
+            self.send_header("x-ms-ratelimit-remaining-subscription-reads", "10")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *_args: object) -> None:
+        pass
+
+
+@pytest.fixture
+def arm_server() -> Iterator[FakeArmServer]:
+    server = FakeArmServer(throttled_requests=2)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
@@ -0,0 +1,350 @@
+import asyncio
+from collections import Counter
+from collections.abc import AsyncIterator, Iterable
+from types import SimpleNamespace
+from typing import TypeVar
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from azure.core.rest import HttpRequest
+
+from preflight_check.core.models import Subscription
+from preflight_check.core.services import (
+    AuthService,
+    InMemoryInventoryBackend,
+    QuotaCache,
+    QuotaService,
+    VmssCountStrategy,
+)
+from preflight_check.core.services.aio import (
+    AsyncAuthService,
+    AsyncComputeInventoryBackend,
+    AsyncQuotaService,
+    AsyncSubscriptionService,
+    ThreadedInventoryBackend,
+)
+from preflight_check.core.services.concurrency import gather_concurrently
+
+from .test_auth import (
+    MANAGEMENT_GROUP,
+    ROOT_MANAGEMENT_GROUP,
+    FakeAuthorizationClient,
+    _auth_service,
+    _role_definition,
+)
+
+T = TypeVar("T")
+
+
+async def _pager(items: Iterable[T]) -> AsyncIterator[T]:
+    """Stands in for the AsyncItemPaged returned by the list operations of async clients"""
+    for item in items:
+        await asyncio.sleep(0)
+        yield item
+
+
+def _scale_set(name: str, location: str, capacity: int, mode: str = "Uniform") -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"/subscriptions/sub-1/resourceGroups/rg-1/providers/Microsoft.Compute/virtualMachineScaleSets/{name}",
+        name=name,
+        location=location,
+        orchestration_mode=mode,
+        sku=SimpleNamespace(capacity=capacity),
+    )
+
+
+class FakeAsyncComputeClient:
+    def __init__(self) -> None:
+        scale_sets = [
+            _scale_set("uniform", "eastus", capacity=3),
+            _scale_set("flexible", "eastus", capacity=5, mode="Flexible"),
+        ]
+        self.virtual_machine_scale_sets = SimpleNamespace(
+            list_all=lambda: _pager(scale_sets),
+            list_by_location=lambda location: _pager(
+                vmss for vmss in scale_sets if vmss.location.lower() == location
+            ),
+        )
+        self.virtual_machine_scale_set_vms = SimpleNamespace(
+            list=lambda _resource_group, _name: _pager(range(2))
+        )
+
+
+class FakeAsyncArmClient:
+    """Serves the raw VM listing of a subscription, one VM per page, and its raw location listing"""
+
+    def __init__(self, vm_locations: list[str]) -> None:
+        self.listed_locations: list[str | None] = []
+        self._vm_locations = vm_locations
+
+    def format_url(self, path: str) -> str:
+        return f"https://management.azure.com{path}"
+
+    async def send_request(self, request: HttpRequest) -> SimpleNamespace:
+        await asyncio.sleep(0)
+        url = urlparse(request.url)
+        query = parse_qs(url.query)
+        parts = url.path.split("/")
+        if parts[3] == "locations":
+            locations = {
+                "value": [
+                    {"name": "eastus", "metadata": {"regionType": "Physical"}},
+                    {"name": "westus", "metadata": {"regionType": "Physical"}},
+                    {"name": "global", "metadata": {"regionType": "Logical"}},
+                ]
+            }
+            return SimpleNamespace(status_code=200, json=lambda: locations)
+        # /subscriptions/{id}/providers/Microsoft.Compute[/locations/{location}]/virtualMachines
+        location = parts[6] if parts[5] == "locations" else None
+        index = int(query.get("$skipToken", ["0"])[0])
+        if index == 0:
+            self.listed_locations.append(location)
+        vms = [
+            {"id": f"vm-{vm_index}", "location": vm_location}
+            for vm_index, vm_location in enumerate(self._vm_locations)
+            if location is None or vm_location.lower() == location
+        ]
+        page = {
+            "value": vms[index : index + 1],
+            "nextLink": f"{url._replace(query='')}?$skipToken={index + 1}"
+            if index + 1 < len(vms)
+            else None,
+        }
+        return SimpleNamespace(status_code=200, json=lambda: page)
+
+
+def _compute_factory(vm_locations: list[str]) -> SimpleNamespace:
+    arm_client = FakeAsyncArmClient(vm_locations)
+    return SimpleNamespace(
+        get_compute_client=lambda _: FakeAsyncComputeClient(),
+        get_arm_client=lambda: arm_client,
+    )
+
+
+class TestGatherConcurrently:
+    """Test running coroutines with bounded concurrency"""
+
+    def test_preserves_order_and_bounds_in_flight_coroutines(self) -> None:
+        in_flight = 0
+        max_in_flight = 0
+
+        async def square(item: int) -> int:
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01 * (5 - item))
+            in_flight -= 1
+            if item == 3:
+                raise RuntimeError("failed")
+            return item * item
+
+        results = asyncio.run(gather_concurrently(square, range(5), concurrency=2))
+
+        assert max_in_flight == 2
+        assert [result.item for result in results] == [0, 1, 2, 3, 4]
+        assert [result.result for result in results] == [0, 1, 4, None, 16]
+        assert str(results[3].error) == "failed"
+
+
+class TestAsyncSubscriptionService:
+    """Test counting VMs on the event loop"""
+
+    @pytest.mark.parametrize(
+        ("strategy", "eastus_count"),
+        [(VmssCountStrategy.CAPACITY, 5), (VmssCountStrategy.EXACT, 4)],
+    )
+    def test_counts_vms_and_uniform_scale_set_instances(
+        self, strategy: VmssCountStrategy, eastus_count: int
+    ) -> None:
+        factory = _compute_factory(["EastUS", "eastus", "westus"])
+        service = AsyncSubscriptionService(
+            AsyncComputeInventoryBackend(factory, vmss_count_strategy=strategy)  # type: ignore[arg-type]
+        )
+        subscription = Subscription(id="sub-1", name="Sub 1", regions={})
+
+        failures = asyncio.run(service.get_subscriptions_vms([subscription]))
+
+        assert failures == {}
+        assert {name: region.vm_count for name, region in subscription.regions.items()} == {
+            "eastus": eastus_count,
+            "westus": 1,
+        }
+
+    def test_only_lists_the_requested_regions(self) -> None:
+        factory = _compute_factory(["EastUS", "eastus", "westus"])
+        service = AsyncSubscriptionService(AsyncComputeInventoryBackend(factory))  # type: ignore[arg-type]
+        subscription = Subscription(id="sub-1", name="Sub 1", regions={})
+
+        asyncio.run(service.get_subscriptions_vms([subscription], regions=["westus"]))
+
+        assert {name: region.vm_count for name, region in subscription.regions.items()} == {
+            "westus": 1
+        }
+        assert factory.get_arm_client().listed_locations == ["westus"]
+
+    def test_lists_large_subscriptions_one_location_at_a_time(self) -> None:
+        factory = _compute_factory(["eastus", "westus", "EastUS", "westus"])
+        service = AsyncSubscriptionService(
+            AsyncComputeInventoryBackend(factory, shard_threshold=3)  # type: ignore[arg-type]
+        )
+        subscription = Subscription(id="sub-1", name="Sub 1", regions={})
+
+        asyncio.run(service.get_subscriptions_vms([subscription]))
+
+        # The VMs listed before the threshold was reached are counted once
+        assert {name: region.vm_count for name, region in subscription.regions.items()} == {
+            "eastus": 5,
+            "westus": 2,
+        }
+        # Logical locations hold no resources and are skipped
+        listed = factory.get_arm_client().listed_locations
+        assert listed[0] is None
+        assert sorted(listed[1:]) == ["eastus", "westus"]
+
+    def test_lists_subscriptions_sharded_before_one_location_at_a_time_only(self) -> None:
+        factory = _compute_factory(["eastus", "westus", "EastUS", "westus"])
+        backend = AsyncComputeInventoryBackend(factory, shard_threshold=3)  # type: ignore[arg-type]
+
+        asyncio.run(backend.count_vms(["sub-1"]))
+        result = asyncio.run(backend.count_vms(["sub-1"]))
+
+        assert result.vm_counts == {"sub-1": {"eastus": 5, "westus": 2}}
+        # The whole subscription is only listed until it is found to reach the threshold
+        listed = factory.get_arm_client().listed_locations
+        assert listed.count(None) == 1
+        assert sorted(listed[3:]) == ["eastus", "westus"]
+
+    def test_runs_blocking_backends_in_a_thread(self) -> None:
+        service = AsyncSubscriptionService(
+            ThreadedInventoryBackend(InMemoryInventoryBackend({"sub-1": {"eastus": 2}}))
+        )
+        subscriptions = [
+            Subscription(id="sub-1", name="Sub 1", regions={}),
+            Subscription(id="sub-2", name="Sub 2", regions={}),
+        ]
+
+        failures = asyncio.run(service.get_subscriptions_vms(subscriptions))
+
+        assert subscriptions[0].total_vms == 2
+        assert list(failures) == ["sub-2"]
+        assert str(failures["sub-2"]).startswith("Failed to count VMs in subscription sub-2")
+
+
+class TestAsyncQuotaService:
+    """Test collecting quotas on the event loop"""
+
+    def test_fetches_each_region_and_provider_once_and_shares_the_cache(self) -> None:
+        requests: list[tuple[str, str]] = []
+
+        def usages(provider: str, name: str) -> SimpleNamespace:
+            def list_usages(region: str) -> AsyncIterator[SimpleNamespace]:
+                requests.append((region, provider))
+                return _pager(
+                    [
+                        SimpleNamespace(
+                            name=SimpleNamespace(value=name, localized_value=name.title()),
+                            limit=100,
+                            current_value=len(region),
+                        )
+                    ]
+                )
+
+            return SimpleNamespace(list=list_usages)
+
+        factory = SimpleNamespace(
+            get_compute_client=lambda _: SimpleNamespace(usage=usages("compute", "cores")),
+            get_network_client=lambda _: SimpleNamespace(usages=usages("network", "PublicIPs")),
+        )
+        quota_cache = QuotaCache()
+        service = AsyncQuotaService(factory, concurrency=4, quota_cache=quota_cache)  # type: ignore[arg-type]
+
+        quotas = asyncio.run(
+            service.get_quota_limits_for_regions("async-sub", ["eastus", "westus2", "eastus"])
+        )
+        asyncio.run(service.get_quota_limits_for_regions("async-sub", ["westus2"]))
+
+        assert sorted(requests) == [
+            ("eastus", "compute"),
+            ("eastus", "network"),
+            ("westus2", "compute"),
+            ("westus2", "network"),
+        ]
+        assert set(quotas["westus2"]) == {"cores", "PublicIPs"}
+        assert quotas["westus2"]["cores"].usage == len("westus2")
+        # Quotas collected on the event loop are served by a blocking service sharing the cache
+        blocking_service = QuotaService(factory, quota_cache=quota_cache)  # type: ignore[arg-type]
+        assert blocking_service.get_quota_limits("async-sub", "eastus") == quotas["eastus"]
+
+
+class FakeAsyncAuthorizationClient:
+    """Async counterpart of FakeAuthorizationClient"""
+
+    def __init__(self, client: FakeAuthorizationClient) -> None:
+        self.role_definition_requests: Counter[str] = Counter()
+        self.role_assignments = SimpleNamespace(list_for_scope=self._list_for_scope)
+        self.role_definitions = SimpleNamespace(get_by_id=self._get_by_id)
+        self.format_url = client.format_url
+        self._client = client
+
+    def _list_for_scope(self, scope: str, filter: str) -> AsyncIterator[SimpleNamespace]:
+        return _pager(self._client.role_assignments.list_for_scope(scope, filter=filter))
+
+    async def send_request(self, request: HttpRequest) -> SimpleNamespace:
+        await asyncio.sleep(0)
+        return self._client.send_request(request)
+
+    async def _get_by_id(self, role_definition_id: str) -> SimpleNamespace:
+        self.role_definition_requests[role_definition_id] += 1
+        # Give other coroutines a chance to request the same role definition
+        await asyncio.sleep(0.01)
+        return _role_definition(role_definition_id)
+
+
+class TestAsyncAuthService:
+    """Test collecting role assignments on the event loop"""
+
+    def test_collects_roles_and_fetches_each_role_definition_once(
+        self, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr(AuthService, "_role_definitions", {})
+        monkeypatch.setattr(AuthService, "_role_permissions", {})
+        monkeypatch.setattr(AuthService, "_assigned_roles", {})
+        auth_client = FakeAuthorizationClient(
+            {
+                ROOT_MANAGEMENT_GROUP: ["Owner"],
+                MANAGEMENT_GROUP: ["Reader"],
+                "/subscriptions/sub-1": ["Reader", "Contributor"],
+                "/subscriptions/sub-2": ["Reader"],
+            },
+            {MANAGEMENT_GROUP: ROOT_MANAGEMENT_GROUP, "/subscriptions/sub-2": MANAGEMENT_GROUP},
+        )
+        async_client = FakeAsyncAuthorizationClient(auth_client)
+        auth = _auth_service(auth_client)
+        service = AsyncAuthService(
+            auth,
+            SimpleNamespace(  # type: ignore[arg-type]
+                get_auth_client=lambda _: async_client, get_arm_client=lambda: async_client
+            ),
+            concurrency=4,
+        )
+        subscriptions = [
+            Subscription(id=f"sub-{i}", name=f"Sub {i}", regions={}) for i in range(1, 3)
+        ]
+
+        assigned_roles = asyncio.run(service.get_all_assigned_roles(subscriptions))
+
+        assert {
+            scope: [role.name for role in roles] for scope, roles in assigned_roles.items()
+        } == {
+            ROOT_MANAGEMENT_GROUP: ["Owner"],
+            "sub-1": ["Owner", "Reader", "Contributor"],
+            "sub-2": ["Owner", "Reader", "Reader"],
+        }
+        assert assigned_roles["sub-2"][0] is assigned_roles[ROOT_MANAGEMENT_GROUP][0]
+        assert auth_client.scope_requests == Counter({ROOT_MANAGEMENT_GROUP: 1})
+        assert async_client.role_definition_requests == Counter(
+            {"Reader": 1, "Contributor": 1, "Owner": 1}
+        )
+        # Role definitions fetched on the event loop are served by the blocking service
+        auth.get_all_assigned_roles(subscriptions[:1], include_root_management_group=False)
+        assert auth_client.role_definition_requests == Counter()
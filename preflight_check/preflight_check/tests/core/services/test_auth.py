@@ -0,0 +1,302 @@
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from azure.core.rest import HttpRequest
+from azure.mgmt.authorization.v2022_04_01.models import RoleDefinition
+
+from preflight_check.core.models import Subscription
+from preflight_check.core.services import AuthService, Identity, RoleDefinitionCache
+
+from .test_identity import FakeIdentityResolver
+
+ROOT_MANAGEMENT_GROUP = "/providers/Microsoft.Management/managementGroups/tenant-1"
+MANAGEMENT_GROUP = "/providers/Microsoft.Management/managementGroups/mg-1"
+
+
+def _role_assignment(scope: str, role_definition_id: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"{scope}/providers/Microsoft.Authorization/roleAssignments/{role_definition_id}",
+        role_definition_id=role_definition_id,
+        scope=scope,
+        principal_id="principal-1",
+        principal_type="ServicePrincipal",
+        condition=None,
+    )
+
+
+def _role_definition(role_definition_id: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=role_definition_id,
+        role_name=role_definition_id.title(),
+        role_type="CustomRole",
+        permissions=[
+            SimpleNamespace(
+                actions=[f"Microsoft.{role_definition_id}/*"],
+                not_actions=[],
+                data_actions=[],
+                not_data_actions=[],
+            )
+        ],
+    )
+
+
+class FakeAuthorizationClient:
+    """
+    Serves the role assignments of a tenant, slow role definition lookups and, as the ARM
+    client, the management group hierarchy
+    """
+
+    def __init__(
+        self, assignments: dict[str, list[str]], parents: dict[str, str] | None = None
+    ) -> None:
+        """
+        Args:
+            assignments: Map from scope to the roles assigned at it
+            parents: Map from management group or subscription ID to the ID of its parent
+            management group; scopes without a parent are below the root management group
+        """
+        self.role_definition_requests: Counter[str] = Counter()
+        self.scope_requests: Counter[str] = Counter()
+        self.descendants_requests = 0
+        self.role_assignments = SimpleNamespace(list_for_scope=self._list_for_scope)
+        self.role_definitions = SimpleNamespace(get_by_id=self._get_by_id)
+        self._assignments = assignments
+        self._parents = parents or {}
+        self._lock = threading.Lock()
+
+    def _scopes_above(self, scope: str) -> list[str]:
+        """The scope and the scopes above it, from the root management group down"""
+        if scope == ROOT_MANAGEMENT_GROUP:
+            return [scope]
+        if "/resourceGroups/" in scope:
+            parent = scope.split("/resourceGroups/")[0]
+        else:
+            parent = self._parents.get(scope, ROOT_MANAGEMENT_GROUP)
+        return [*self._scopes_above(parent), scope]
+
+    def _list_for_scope(self, scope: str, filter: str) -> list[SimpleNamespace]:
+        with self._lock:
+            self.scope_requests[scope] += 1
+        if filter == "assignedTo('principal-1')":
+            # Assignments at or above the scope
+            scopes = self._scopes_above(scope)
+        else:
+            # Assignments at, above or below the scope
+            assert filter == "principalId eq 'principal-1'"
+            scopes = [
+                assignment_scope
+                for assignment_scope in self._assignments
+                if scope in self._scopes_above(assignment_scope)
+                or assignment_scope in self._scopes_above(scope)
+            ]
+        return [
+            _role_assignment(assignment_scope, role)
+            for assignment_scope in scopes
+            for role in self._assignments.get(assignment_scope, [])
+        ]
+
+    def _get_by_id(self, role_definition_id: str) -> SimpleNamespace:
+        with self._lock:
+            self.role_definition_requests[role_definition_id] += 1
+        # Give other workers a chance to request the same role definition
+        time.sleep(0.05)
+        return _role_definition(role_definition_id)
+
+    def format_url(self, path: str) -> str:
+        return f"https://management.azure.com{path}"
+
+    def send_request(self, request: HttpRequest) -> SimpleNamespace:
+        """Serve the descendants of the root management group, one per page"""
+        with self._lock:
+            self.descendants_requests += 1
+        page_index = int(parse_qs(urlparse(request.url).query).get("page", ["0"])[0])
+        descendants = [
+            {"id": descendant, "properties": {"parent": {"id": parent}}}
+            for descendant, parent in self._parents.items()
+        ]
+        page: dict[str, Any] = {"value": descendants[page_index : page_index + 1]}
+        if page_index + 1 < len(descendants):
+            page["nextLink"] = self.format_url(f"/descendants?page={page_index + 1}")
+        return SimpleNamespace(status_code=200, json=lambda: page)
+
+
+@pytest.fixture
+def auth_client(monkeypatch: pytest.MonkeyPatch) -> FakeAuthorizationClient:
+    # Start from empty class-level caches
+    monkeypatch.setattr(AuthService, "_role_definitions", {})
+    monkeypatch.setattr(AuthService, "_role_permissions", {})
+    monkeypatch.setattr(AuthService, "_assigned_roles", {})
+    return FakeAuthorizationClient(
+        {
+            ROOT_MANAGEMENT_GROUP: ["Reader"],
+            MANAGEMENT_GROUP: ["Owner"],
+            "/subscriptions/sub-1": ["Reader", "Contributor"],
+            "/subscriptions/sub-2": ["Reader", "Contributor"],
+            "/subscriptions/sub-3/resourceGroups/rg-1": ["Contributor"],
+            "/subscriptions/sub-4": ["Reader"],
+        },
+        {
+            MANAGEMENT_GROUP: ROOT_MANAGEMENT_GROUP,
+            "/subscriptions/sub-4": MANAGEMENT_GROUP,
+            "/subscriptions/sub-5": MANAGEMENT_GROUP,
+        },
+    )
+
+
+def _auth_service(
+    auth_client: FakeAuthorizationClient,
+    role_definition_cache: RoleDefinitionCache | None = None,
+) -> AuthService:
+    return AuthService(
+        SimpleNamespace(  # type: ignore[arg-type]
+            get_auth_client=lambda _: auth_client, get_arm_client=lambda: auth_client
+        ),
+        concurrency=4,
+        role_definition_cache=role_definition_cache,
+        identity_resolver=FakeIdentityResolver(
+            Identity(principal_id="principal-1", tenant_id="tenant-1")
+        ),
+    )
+
+
+class TestGetAllAssignedRoles:
+    """Test concurrent role assignment collection"""
+
+    def test_collects_roles_for_every_subscription(
+        self, auth_client: FakeAuthorizationClient
+    ) -> None:
+        service = _auth_service(auth_client)
+        subscriptions = [
+            Subscription(id=sub_id, name=sub_id, regions={}) for sub_id in ["sub-1", "sub-4"]
+        ]
+
+        assigned_roles = service.get_all_assigned_roles(subscriptions, False)
+
+        assert {
+            scope: [(role.name, role.scope) for role in roles]
+            for scope, roles in assigned_roles.items()
+        } == {
+            "sub-1": [
+                ("Reader", ROOT_MANAGEMENT_GROUP),
+                ("Reader", "/subscriptions/sub-1"),
+                ("Contributor", "/subscriptions/sub-1"),
+            ],
+            "sub-4": [
+                ("Reader", ROOT_MANAGEMENT_GROUP),
+                ("Owner", MANAGEMENT_GROUP),
+                ("Reader", "/subscriptions/sub-4"),
+            ],
+        }
+        assert assigned_roles["sub-1"][2].grants_action("Microsoft.Contributor/things/write")
+        assert auth_client.scope_requests == {"/subscriptions/sub-1": 1, "/subscriptions/sub-4": 1}
+
+    def test_groups_roles_of_the_tenant_by_subscription(
+        self, auth_client: FakeAuthorizationClient
+    ) -> None:
+        service = _auth_service(auth_client)
+        subscriptions = [
+            Subscription(id=sub_id, name=sub_id, regions={})
+            for sub_id in ["sub-1", "sub-3", "sub-4", "sub-5"]
+        ]
+
+        assigned_roles = service.get_all_assigned_roles(subscriptions)
+
+        assert {
+            scope: [(role.name, role.scope) for role in roles]
+            for scope, roles in assigned_roles.items()
+        } == {
+            ROOT_MANAGEMENT_GROUP: [("Reader", ROOT_MANAGEMENT_GROUP)],
+            "sub-1": [
+                ("Reader", ROOT_MANAGEMENT_GROUP),
+                ("Reader", "/subscriptions/sub-1"),
+                ("Contributor", "/subscriptions/sub-1"),
+            ],
+            # Roles assigned on resource groups do not apply to the whole subscription
+            "sub-3": [("Reader", ROOT_MANAGEMENT_GROUP)],
+            "sub-4": [
+                ("Reader", ROOT_MANAGEMENT_GROUP),
+                ("Owner", MANAGEMENT_GROUP),
+                ("Reader", "/subscriptions/sub-4"),
+            ],
+            "sub-5": [("Reader", ROOT_MANAGEMENT_GROUP), ("Owner", MANAGEMENT_GROUP)],
+        }
+        # The whole tenant is listed once, and the hierarchy is read page by page
+        assert auth_client.scope_requests == {ROOT_MANAGEMENT_GROUP: 1}
+        assert auth_client.descendants_requests == 3
+
+    def test_lists_each_scope_once(self, auth_client: FakeAuthorizationClient) -> None:
+        service = _auth_service(auth_client)
+        sub_1, sub_2 = (
+            Subscription(id=sub_id, name=sub_id, regions={}) for sub_id in ["sub-1", "sub-2"]
+        )
+
+        # As when the roles are prefetched during the prompts
+        prefetched = service.get_all_assigned_roles([sub_1], False)
+        assert service.get_all_assigned_roles([sub_1], False) == prefetched
+        prefetched = service.get_all_assigned_roles([sub_1, sub_2])
+        assigned_roles = service.get_all_assigned_roles([sub_1, sub_2])
+
+        assert assigned_roles == prefetched
+        assert auth_client.scope_requests == {"/subscriptions/sub-1": 1, ROOT_MANAGEMENT_GROUP: 1}
+        assert auth_client.descendants_requests == 3
+
+    def test_fetches_each_role_definition_once(self, auth_client: FakeAuthorizationClient) -> None:
+        service = _auth_service(auth_client)
+        subscriptions = [
+            Subscription(id=sub_id, name=sub_id, regions={})
+            for sub_id in ["sub-1", "sub-2", "sub-4"]
+        ]
+
+        service.get_all_assigned_roles(subscriptions, False)
+
+        assert auth_client.role_definition_requests == {"Reader": 1, "Contributor": 1, "Owner": 1}
+
+    def test_shares_roles_of_inherited_assignments(
+        self, auth_client: FakeAuthorizationClient
+    ) -> None:
+        service = _auth_service(auth_client)
+        subscriptions = [
+            Subscription(id=sub_id, name=sub_id, regions={}) for sub_id in ["sub-4", "sub-5"]
+        ]
+
+        # Listed on its own, then as part of the tenant
+        sub_4_roles = service.get_all_assigned_roles(subscriptions[:1], False)["sub-4"]
+        assigned_roles = service.get_all_assigned_roles(subscriptions)
+
+        root_reader = assigned_roles[ROOT_MANAGEMENT_GROUP][0]
+        assert assigned_roles["sub-4"] == sub_4_roles
+        assert all(
+            role is listed_role
+            for role, listed_role in zip(assigned_roles["sub-4"], sub_4_roles, strict=True)
+        )
+        assert assigned_roles["sub-5"][0] is root_reader
+        assert assigned_roles["sub-5"][1] is assigned_roles["sub-4"][1]
+
+    def test_serves_role_definitions_from_disk_cache(
+        self, auth_client: FakeAuthorizationClient, tmp_path: Path
+    ) -> None:
+        owner = RoleDefinition.deserialize(
+            {
+                "id": "Owner",
+                "properties": {
+                    "roleName": "Cached Owner",
+                    "type": "BuiltInRole",
+                    "permissions": [{"actions": ["*"]}],
+                },
+            }
+        )
+        RoleDefinitionCache(tmp_path).put("tenant-1", owner)
+        service = _auth_service(auth_client, RoleDefinitionCache(tmp_path))
+
+        assigned_roles = service.get_all_assigned_roles(
+            [Subscription(id="sub-5", name="sub-5", regions={})]
+        )
+
+        assert [role.name for role in assigned_roles["sub-5"]] == ["Reader", "Cached Owner"]
+        assert auth_client.role_definition_requests == {"Reader": 1, "Contributor": 1}
@@ -0,0 +1,79 @@
+import pytest
+import requests
+
+from preflight_check.core.services import AzureClientFactory
+from preflight_check.core.services.azure import ClientCache
+
+
+class FakeCredential:
+    def get_token(self, *_scopes: str, **_kwargs: object) -> None:
+        raise AssertionError("no requests are sent")
+
+
+@pytest.fixture
+def sessions(monkeypatch: pytest.MonkeyPatch) -> list[requests.Session]:
+    """Every session opened by the factories of a test"""
+    opened: list[requests.Session] = []
+
+    class RecordedSession(requests.Session):
+        def __init__(self) -> None:
+            super().__init__()
+            opened.append(self)
+
+    monkeypatch.setattr(requests, "Session", RecordedSession)
+    return opened
+
+
+class TestAzureClientFactory:
+    """Test client caching and connection sharing"""
+
+    def test_management_clients_share_one_session(self, sessions: list[requests.Session]) -> None:
+        factory = AzureClientFactory(FakeCredential())  # type: ignore[arg-type]
+
+        clients = [
+            factory.get_compute_client("sub-1"),
+            factory.get_compute_client("sub-2"),
+            factory.get_network_client("sub-1"),
+            factory.get_auth_client("sub-1"),
+            factory.get_subscription_client(),
+            factory.get_arm_client(),
+        ]
+
+        assert len(sessions) == 1
+        assert factory.get_compute_client("sub-1") is clients[0]
+        assert factory.get_arm_client() is clients[-1]
+
+    def test_drops_least_recently_used_clients(self, sessions: list[requests.Session]) -> None:
+        factory = AzureClientFactory(FakeCredential(), max_cached_clients=1)  # type: ignore[arg-type]
+
+        first = factory.get_compute_client("sub-1")
+        assert factory.get_compute_client("sub-1") is first
+        factory.get_compute_client("sub-2")
+
+        assert factory.get_compute_client("sub-1") is not first
+        # Clients of each kind are cached apart
+        network_client = factory.get_network_client("sub-1")
+        assert factory.get_network_client("sub-1") is network_client
+        assert len(sessions) == 1
+
+    def test_factories_do_not_share_clients(self, sessions: list[requests.Session]) -> None:
+        first = AzureClientFactory(FakeCredential())  # type: ignore[arg-type]
+        second = AzureClientFactory(FakeCredential())  # type: ignore[arg-type]
+
+        assert first.get_compute_client("sub-1") is not second.get_compute_client("sub-1")
+        assert len(sessions) == 2
+
+
+class TestClientCache:
+    """Test the bounded client cache"""
+
+    def test_drops_least_recently_used_client(self) -> None:
+        cache: ClientCache[object] = ClientCache(max_size=2)
+        clients = {sub_id: cache.get(sub_id, object) for sub_id in ["sub-1", "sub-2"]}
+
+        assert cache.get("sub-1", object) is clients["sub-1"]
+        cache.get("sub-3", object)
+
+        assert len(cache) == 2
+        assert cache.get("sub-1", object) is clients["sub-1"]
+        assert cache.get("sub-2", object) is not clients["sub-2"]
@@ -0,0 +1,80 @@
+from pathlib import Path
+
+from azure.mgmt.authorization.v2022_04_01.models import Permission, RoleDefinition
+
+from preflight_check.core.services import RoleDefinitionCache
+
+READER_ID = (
+    "/subscriptions/sub-1/providers/Microsoft.Authorization/roleDefinitions/"
+    "acdd72a7-3385-48ef-bd42-f606fba81ae7"
+)
+
+
+def _role_definition(role_definition_id: str, role_type: str) -> RoleDefinition:
+    # The ID is read-only and only set by the SDK when deserializing responses
+    return RoleDefinition.deserialize(
+        {
+            "id": role_definition_id,
+            "properties": {
+                "roleName": "Reader",
+                "type": role_type,
+                "permissions": [{"actions": ["*/read"]}],
+            },
+        }
+    )
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestRoleDefinitionCache:
+    """Test the on-disk role definition cache"""
+
+    def test_serves_built_in_roles_across_runs_and_scopes(self, tmp_path: Path) -> None:
+        RoleDefinitionCache(tmp_path).put("tenant-1", _role_definition(READER_ID, "BuiltInRole"))
+
+        cache = RoleDefinitionCache(tmp_path)
+        cached = cache.get("tenant-1", READER_ID.replace("sub-1", "sub-2"))
+
+        assert cached is not None
+        assert cached.id == READER_ID
+        assert cached.role_name == "Reader"
+        assert cached.permissions == [Permission(actions=["*/read"])]
+        assert cache.get("tenant-2", READER_ID) is None
+
+    def test_does_not_cache_custom_roles(self, tmp_path: Path) -> None:
+        cache = RoleDefinitionCache(tmp_path)
+
+        cache.put("tenant-1", _role_definition(READER_ID, "CustomRole"))
+
+        assert cache.get("tenant-1", READER_ID) is None
+        assert not (tmp_path / "role_definitions").exists()
+
+    def test_expires_entries_after_ttl(self, tmp_path: Path) -> None:
+        clock = FakeClock()
+        cache = RoleDefinitionCache(tmp_path, clock=clock)
+        cache.put("tenant-1", _role_definition(READER_ID, "BuiltInRole"))
+
+        clock.now += 6 * 24 * 3600
+        assert cache.get("tenant-1", READER_ID) is not None
+        clock.now += 2 * 24 * 3600
+        assert cache.get("tenant-1", READER_ID) is None
+
+    def test_refresh_ignores_cached_entries(self, tmp_path: Path) -> None:
+        RoleDefinitionCache(tmp_path).put("tenant-1", _role_definition(READER_ID, "BuiltInRole"))
+
+        assert RoleDefinitionCache(tmp_path, refresh=True).get("tenant-1", READER_ID) is None
+
+    def test_ignores_unreadable_cache_file(self, tmp_path: Path) -> None:
+        (tmp_path / "role_definitions").mkdir()
+        (tmp_path / "role_definitions" / "tenant-1.json").write_text("{not json")
+        cache = RoleDefinitionCache(tmp_path)
+
+        assert cache.get("tenant-1", READER_ID) is None
+        cache.put("tenant-1", _role_definition(READER_ID, "BuiltInRole"))
+        assert RoleDefinitionCache(tmp_path).get("tenant-1", READER_ID) is not None
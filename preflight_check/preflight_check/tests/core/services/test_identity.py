@@ -0,0 +1,81 @@
+import base64
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from preflight_check.core.services import (
+    FallbackIdentityResolver,
+    Identity,
+    IdentityResolver,
+    TokenClaimsIdentityResolver,
+)
+
+
+def _access_token(claims: dict[str, str]) -> str:
+    def encode(data: dict[str, str]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    return f"{encode({'alg': 'RS256', 'typ': 'JWT'})}.{encode(claims)}.signature"
+
+
+class FakeCredential:
+    def __init__(self, token: str) -> None:
+        self.scopes: list[str] = []
+        self._token = token
+
+    def get_token(self, scope: str) -> SimpleNamespace:
+        self.scopes.append(scope)
+        return SimpleNamespace(token=self._token, expires_on=0)
+
+
+class FakeIdentityResolver(IdentityResolver):
+    def __init__(self, identity: Identity | None) -> None:
+        self.calls = 0
+        self._identity = identity
+
+    def resolve(self) -> Identity:
+        self.calls += 1
+        if self._identity is None:
+            raise RuntimeError("not signed in")
+        return self._identity
+
+
+class TestTokenClaimsIdentityResolver:
+    """Test resolving the principal from access token claims"""
+
+    def test_reads_object_and_tenant_id_claims(self) -> None:
+        credential = FakeCredential(_access_token({"oid": "principal-1", "tid": "tenant-1"}))
+
+        identity = TokenClaimsIdentityResolver(credential).resolve()  # type: ignore[arg-type]
+
+        assert identity == Identity(principal_id="principal-1", tenant_id="tenant-1")
+        assert credential.scopes == ["https://management.azure.com/.default"]
+
+    @pytest.mark.parametrize("token", [_access_token({"tid": "tenant-1"}), "not-a-jwt"])
+    def test_raises_for_unusable_token(self, token: str) -> None:
+        resolver = TokenClaimsIdentityResolver(FakeCredential(token))  # type: ignore[arg-type]
+
+        with pytest.raises(RuntimeError):
+            resolver.resolve()
+
+
+class TestFallbackIdentityResolver:
+    """Test falling back between identity resolvers"""
+
+    def test_returns_first_resolved_identity(self) -> None:
+        identity = Identity(principal_id="principal-1", tenant_id="tenant-1")
+        failing, resolving, unused = (
+            FakeIdentityResolver(None),
+            FakeIdentityResolver(identity),
+            FakeIdentityResolver(identity),
+        )
+
+        assert FallbackIdentityResolver([failing, resolving, unused]).resolve() == identity
+        assert (failing.calls, resolving.calls, unused.calls) == (1, 1, 0)
+
+    def test_raises_when_every_resolver_fails(self) -> None:
+        resolver = FallbackIdentityResolver([FakeIdentityResolver(None)])
+
+        with pytest.raises(RuntimeError, match="not signed in"):
+            resolver.resolve()
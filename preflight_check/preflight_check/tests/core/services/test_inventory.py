@@ -0,0 +1,190 @@
+from types import SimpleNamespace
+
+from azure.mgmt.resourcegraph.models import QueryRequest
+
+from preflight_check.core.models import Subscription
+from preflight_check.core.services import (
+    InMemoryInventoryBackend,
+    ResourceGraphInventoryBackend,
+    SubscriptionService,
+    VmssCountStrategy,
+)
+
+
+class FakeResourceGraphClient:
+    """
+    Serves VM count rows like the summarized queries of Resource Graph: at most max_rows rows,
+    without a skip token for the rest. Fails batches with broken subscriptions.
+    """
+
+    def __init__(self, rows: list[dict[str, object]], max_rows: int = 1000) -> None:
+        self.requests: list[QueryRequest] = []
+        self._rows = rows
+        self._max_rows = max_rows
+
+    def resources(self, request: QueryRequest) -> SimpleNamespace:
+        self.requests.append(request)
+        assert request.options is not None
+        assert request.options.top == 1000
+        assert request.subscriptions is not None
+        subscription_ids = request.subscriptions
+        if any(sub_id.startswith("broken") for sub_id in subscription_ids):
+            raise RuntimeError("query failed")
+        rows = [row for row in self._rows if row["subscriptionId"] in subscription_ids]
+        return SimpleNamespace(
+            data=rows[: self._max_rows],
+            result_truncated="true" if len(rows) > self._max_rows else "false",
+            skip_token=None,
+        )
+
+
+class FakeAzureClientFactory:
+    def __init__(self, resource_graph_client: FakeResourceGraphClient) -> None:
+        self._resource_graph_client = resource_graph_client
+
+    def get_resource_graph_client(self) -> FakeResourceGraphClient:
+        return self._resource_graph_client
+
+
+class TestResourceGraphInventoryBackend:
+    """Test counting VMs with summarized Resource Graph queries"""
+
+    rows: list[dict[str, object]] = [
+        {"subscriptionId": "sub-1", "location": "eastus", "vmCount": 3},
+        {"subscriptionId": "sub-1", "location": "WestUS", "vmCount": 1},
+        {"subscriptionId": "sub-1", "location": "westus", "vmCount": 2},
+        {"subscriptionId": "sub-3", "location": "northeurope", "vmCount": 7},
+    ]
+
+    def test_batches_subscriptions(self) -> None:
+        client = FakeResourceGraphClient(self.rows)
+        backend = ResourceGraphInventoryBackend(
+            FakeAzureClientFactory(client),  # type: ignore[arg-type]
+            batch_size=2,
+        )
+
+        result = backend.count_vms(["sub-1", "sub-2", "sub-3"])
+
+        assert result.errors == {}
+        assert result.vm_counts == {
+            "sub-1": {"eastus": 3, "westus": 3},
+            "sub-2": {},
+            "sub-3": {"northeurope": 7},
+        }
+        assert [request.subscriptions for request in client.requests] == [
+            ["sub-1", "sub-2"],
+            ["sub-3"],
+        ]
+
+    def test_splits_batches_whose_result_is_truncated(self) -> None:
+        client = FakeResourceGraphClient(self.rows, max_rows=3)
+        backend = ResourceGraphInventoryBackend(
+            FakeAzureClientFactory(client),  # type: ignore[arg-type]
+        )
+
+        result = backend.count_vms(["sub-1", "sub-2", "sub-3"])
+
+        assert result.vm_counts == {
+            "sub-1": {"eastus": 3, "westus": 3},
+            "sub-2": {},
+            "sub-3": {"northeurope": 7},
+        }
+        assert [request.subscriptions for request in client.requests] == [
+            ["sub-1", "sub-2", "sub-3"],
+            ["sub-1"],
+            ["sub-2", "sub-3"],
+        ]
+
+    def test_reports_subscriptions_whose_result_is_truncated(self) -> None:
+        client = FakeResourceGraphClient(self.rows, max_rows=2)
+        backend = ResourceGraphInventoryBackend(
+            FakeAzureClientFactory(client),  # type: ignore[arg-type]
+        )
+
+        result = backend.count_vms(["sub-1", "sub-3"])
+
+        # Rather than counting the rows that were returned
+        assert "exceed 1000 rows" in str(result.errors["sub-1"])
+        assert result.vm_counts == {}
+
+    def test_reports_failed_batches_per_subscription(self) -> None:
+        backend = ResourceGraphInventoryBackend(
+            FakeAzureClientFactory(FakeResourceGraphClient(self.rows)),  # type: ignore[arg-type]
+            batch_size=2,
+        )
+
+        result = backend.count_vms(["sub-1", "broken-1", "sub-3"])
+
+        assert set(result.errors) == {"sub-1", "broken-1"}
+        assert result.vm_counts == {"sub-3": {"northeurope": 7}}
+
+    def test_counts_scale_set_capacity_in_the_vm_query(self) -> None:
+        client = FakeResourceGraphClient([])
+        backend = ResourceGraphInventoryBackend(
+            FakeAzureClientFactory(client),  # type: ignore[arg-type]
+            vmss_count_strategy=VmssCountStrategy.CAPACITY,
+        )
+
+        backend.count_vms(["sub-1"])
+
+        [request] = client.requests
+        assert "sku.capacity" in request.query
+        assert "computeresources" not in request.query
+
+    def test_counts_scale_set_instances_with_a_separate_query(self) -> None:
+        rows: list[dict[str, object]] = [
+            {"subscriptionId": "sub-1", "location": "eastus", "vmCount": 2}
+        ]
+        client = FakeResourceGraphClient(rows)
+        backend = ResourceGraphInventoryBackend(
+            FakeAzureClientFactory(client),  # type: ignore[arg-type]
+            vmss_count_strategy=VmssCountStrategy.EXACT,
+        )
+
+        result = backend.count_vms(["sub-1"])
+
+        vm_query, instance_query = (request.query for request in client.requests)
+        # computeresources can't be in a union with resources
+        assert "computeresources" not in vm_query
+        assert instance_query.strip().startswith("computeresources")
+        # The fake serves the same rows to both queries
+        assert result.vm_counts == {"sub-1": {"eastus": 4}}
+
+    def test_query_filters_on_the_requested_regions(self) -> None:
+        client = FakeResourceGraphClient([])
+        backend = ResourceGraphInventoryBackend(
+            FakeAzureClientFactory(client),  # type: ignore[arg-type]
+        )
+
+        backend.count_vms(["sub-1"])
+        backend.count_vms(["sub-1"], regions=["WestUS", "eastus", "eastus"])
+
+        assert "location in~" not in client.requests[0].query
+        filters = [
+            line.strip() for line in client.requests[1].query.splitlines() if "location in~" in line
+        ]
+        # Both the VMs and the scale set instances are filtered
+        assert filters == ["| where location in~ ('eastus', 'westus')"] * 2
+
+
+class TestInMemoryInventoryBackend:
+    """Test the in-memory backend through SubscriptionService"""
+
+    def test_populates_subscription_regions(self) -> None:
+        backend = InMemoryInventoryBackend({"sub-1": {"eastus": 2}})
+        factory = SimpleNamespace(
+            get_subscription_client=lambda: SimpleNamespace(
+                subscriptions=SimpleNamespace(list=lambda: [])
+            )
+        )
+        service = SubscriptionService(factory, inventory_backend=backend)  # type: ignore[arg-type]
+        subscriptions = [
+            Subscription(id="sub-1", name="sub-1", regions={}),
+            Subscription(id="sub-2", name="sub-2", regions={}),
+        ]
+
+        failures = service.get_subscriptions_vms(subscriptions)
+
+        assert list(failures) == ["sub-2"]
+        assert subscriptions[0].regions["eastus"].vm_count == 2
+        assert subscriptions[1].regions == {}
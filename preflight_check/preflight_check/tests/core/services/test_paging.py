@@ -0,0 +1,102 @@
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import closing
+
+import pytest
+
+from preflight_check.core.services.paging import prefetch_pages
+
+
+class FakePages:
+    """Pages of a FakePager; fetching a page waits for its event, if it has one"""
+
+    def __init__(self, pager: "FakePager") -> None:
+        self.continuation_token: str | None = None
+        self._pager = pager
+        self._next_page = 0
+
+    def __iter__(self) -> "FakePages":
+        return self
+
+    def __next__(self) -> Iterator[int]:
+        if self._next_page == len(self._pager.pages):
+            raise StopIteration
+        page_number = self._next_page
+        self._pager.fetched.append(page_number)
+        if page_number == self._pager.failing_page:
+            raise RuntimeError(f"failed to fetch page {page_number}")
+        self._next_page += 1
+        self.continuation_token = (
+            str(self._next_page) if self._next_page < len(self._pager.pages) else None
+        )
+        return iter(self._pager.pages[page_number])
+
+
+class FakePager:
+    """Stands in for the ItemPaged of an Azure SDK list operation"""
+
+    def __init__(self, pages: list[list[int]], failing_page: int | None = None) -> None:
+        self.pages = pages
+        self.failing_page = failing_page
+        self.fetched: list[int] = []
+
+    def __iter__(self) -> Iterator[int]:
+        return (item for page in self.by_page() for item in page)
+
+    def by_page(self) -> FakePages:
+        return FakePages(self)
+
+
+class TestPrefetchPages:
+    """Test fetching the next pages of a listing while the current one is processed"""
+
+    def test_fetches_the_next_pages_while_the_first_is_processed(self) -> None:
+        pager = FakePager([[1, 2], [3], [4, 5]])
+        items = []
+        fetched_during_first_page: list[int] = []
+
+        for item in prefetch_pages(pager):
+            if item == 1:
+                deadline = time.monotonic() + 5
+                while len(pager.fetched) < 3 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                fetched_during_first_page = list(pager.fetched)
+            items.append(item)
+
+        assert items == [1, 2, 3, 4, 5]
+        # The remaining pages were fetched before the first one was processed
+        assert fetched_during_first_page == [0, 1, 2]
+
+    def test_reads_at_most_the_given_number_of_pages_ahead(self) -> None:
+        pager = FakePager([[page] for page in range(10)])
+
+        with closing(prefetch_pages(pager, read_ahead=2)) as items:
+            assert next(items) == 0
+            time.sleep(0.2)
+            # The first page, two waiting pages, and the page waiting for room
+            assert pager.fetched == [0, 1, 2, 3]
+        time.sleep(0.3)
+        # Abandoning the listing stops the fetching
+        assert len(pager.fetched) == 4
+
+    def test_single_page_listings_are_fetched_by_the_caller(self) -> None:
+        pager = FakePager([[1, 2, 3]])
+        threads = threading.active_count()
+
+        items = prefetch_pages(pager)
+
+        assert next(items) == 1
+        assert threading.active_count() == threads
+        assert list(items) == [2, 3]
+
+    def test_raises_the_error_of_a_page_after_the_pages_before_it(self) -> None:
+        pager = FakePager([[1], [2], [3]], failing_page=2)
+        items = prefetch_pages(pager)
+
+        assert [next(items), next(items)] == [1, 2]
+        with pytest.raises(RuntimeError, match="failed to fetch page 2"):
+            next(items)
+
+    def test_iterates_over_plain_iterables(self) -> None:
+        assert list(prefetch_pages([1, 2, 3])) == [1, 2, 3]
@@ -0,0 +1,40 @@
+import threading
+
+from preflight_check.core.services import Prefetcher
+
+
+class TestPrefetcher:
+    """Test running speculative work in the background"""
+
+    def test_submit_returns_before_the_prefetch_finishes(self) -> None:
+        release = threading.Event()
+        fetched: list[str] = []
+
+        def fetch() -> None:
+            release.wait()
+            fetched.append("quotas")
+
+        prefetcher = Prefetcher()
+        prefetcher.submit("quotas", fetch)
+
+        assert fetched == []
+        release.set()
+        prefetcher.wait()
+        assert fetched == ["quotas"]
+        prefetcher.shutdown()
+
+    def test_failed_prefetches_are_not_raised(self) -> None:
+        fetched: list[str] = []
+
+        def fail() -> None:
+            raise RuntimeError("access denied")
+
+        prefetcher = Prefetcher(max_workers=1)
+        prefetcher.submit("permissions", fail)
+        prefetcher.submit("quotas", lambda: fetched.append("quotas"))
+        prefetcher.wait()
+
+        assert fetched == ["quotas"]
+        # Nothing is left to wait for
+        prefetcher.wait()
+        prefetcher.shutdown()
@@ -0,0 +1,87 @@
+import threading
+from collections.abc import Callable
+from types import SimpleNamespace
+
+import pytest
+
+from preflight_check.core.services import QuotaService
+
+
+def _usage(name: str, limit: int, current_value: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        name=SimpleNamespace(value=name, localized_value=name.title()),
+        limit=limit,
+        current_value=current_value,
+    )
+
+
+class FakeAzureClientFactory:
+    """Serves compute and network usages per region and records every request"""
+
+    def __init__(self) -> None:
+        self.requests: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def get_compute_client(self, _subscription_id: str) -> SimpleNamespace:
+        return SimpleNamespace(usage=SimpleNamespace(list=self._usages("compute")))
+
+    def get_network_client(self, _subscription_id: str) -> SimpleNamespace:
+        return SimpleNamespace(usages=SimpleNamespace(list=self._usages("network")))
+
+    def _usages(self, provider: str) -> Callable[[str], list[SimpleNamespace]]:
+        def list_usages(region: str) -> list[SimpleNamespace]:
+            with self._lock:
+                self.requests.append((region, provider))
+            if region == "brokenregion":
+                raise RuntimeError("quota API unavailable")
+            if provider == "compute":
+                return [_usage("cores", 100, 10)]
+            return [_usage("PublicIPAddresses", 20, len(region))]
+
+        return list_usages
+
+
+class TestGetQuotaLimitsForRegions:
+    """Test concurrent quota collection across regions and providers"""
+
+    def test_fetches_each_region_and_provider_and_caches_results(self) -> None:
+        factory = FakeAzureClientFactory()
+        service = QuotaService(factory, concurrency=4)  # type: ignore[arg-type]
+
+        quotas = service.get_quota_limits_for_regions("quota-sub-1", ["eastus", "westus2"])
+
+        assert sorted(factory.requests) == [
+            ("eastus", "compute"),
+            ("eastus", "network"),
+            ("westus2", "compute"),
+            ("westus2", "network"),
+        ]
+        assert set(quotas) == {"eastus", "westus2"}
+        assert set(quotas["eastus"]) == {"cores", "PublicIPAddresses"}
+        assert quotas["westus2"]["PublicIPAddresses"].usage == len("westus2")
+
+        # Cached regions are served without further requests
+        factory.requests.clear()
+        assert service.get_quota_limits("quota-sub-1", "eastus") == quotas["eastus"]
+        service.get_quota_limits_for_regions("quota-sub-1", ["eastus", "northeurope"])
+        assert sorted(factory.requests) == [("northeurope", "compute"), ("northeurope", "network")]
+
+    def test_raises_for_failed_region(self) -> None:
+        service = QuotaService(FakeAzureClientFactory(), concurrency=4)  # type: ignore[arg-type]
+
+        with pytest.raises(RuntimeError, match="in region brokenregion"):
+            service.get_quota_limits_for_regions("quota-sub-2", ["eastus", "brokenregion"])
+
+    def test_keeps_the_regions_listed_before_a_failure(self) -> None:
+        factory = FakeAzureClientFactory()
+        service = QuotaService(factory, concurrency=4)  # type: ignore[arg-type]
+
+        with pytest.raises(RuntimeError, match="in region brokenregion"):
+            service.get_quota_limits_for_regions("quota-sub-3", ["eastus", "brokenregion"])
+        factory.requests.clear()
+
+        assert set(service.get_quota_limits("quota-sub-3", "eastus")) == {
+            "cores",
+            "PublicIPAddresses",
+        }
+        assert factory.requests == []
@@ -0,0 +1,206 @@
+import asyncio
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from preflight_check.core.models import Subscription, UsageQuotaLimit
+from preflight_check.core.services import (
+    InMemoryInventoryBackend,
+    InventoryResult,
+    InventoryStore,
+    QuotaService,
+    SubscriptionService,
+)
+from preflight_check.core.services.aio import AsyncQuotaService
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingInventoryBackend(InMemoryInventoryBackend):
+    """Records the subscriptions that VMs are counted in"""
+
+    def __init__(self, vm_counts: dict[str, dict[str, int]]) -> None:
+        super().__init__(vm_counts)
+        self.counted: list[str] = []
+
+    def count_vms(
+        self, subscription_ids: list[str], regions: list[str] | None = None
+    ) -> InventoryResult:
+        self.counted.extend(subscription_ids)
+        return super().count_vms(subscription_ids, regions)
+
+
+def _subscription_service(
+    store: InventoryStore, backend: RecordingInventoryBackend
+) -> SubscriptionService:
+    factory = SimpleNamespace(
+        get_subscription_client=lambda: SimpleNamespace(
+            subscriptions=SimpleNamespace(
+                list=lambda: [SimpleNamespace(subscription_id="sub-1", display_name="Sub 1")]
+            )
+        )
+    )
+    return SubscriptionService(
+        factory,  # type: ignore[arg-type]
+        inventory_backend=backend,
+        inventory_store=store,
+        principal_id="principal-1",
+    )
+
+
+class TestInventoryStore:
+    """Test the SQLite inventory store"""
+
+    def test_serves_entries_until_max_age(self, tmp_path: Path) -> None:
+        clock = FakeClock()
+        path = tmp_path / "inventory.sqlite3"
+        InventoryStore(path, timedelta(0), clock).put_vm_counts({"sub-1": {"eastus": 2}})
+        store = InventoryStore(path, timedelta(minutes=30), clock)
+
+        assert store.get_vm_counts(["sub-1", "sub-2"]) == {"sub-1": {"eastus": 2}}
+        clock.now += 31 * 60
+        assert store.get_vm_counts(["sub-1", "sub-2"]) == {}
+
+    def test_round_trips_subscriptions_per_principal_and_quotas(self, tmp_path: Path) -> None:
+        store = InventoryStore(tmp_path / "inventory.sqlite3", timedelta(hours=1))
+        quota = UsageQuotaLimit(name="cores", display_name="Cores", limit=100, usage=10)
+
+        store.put_subscriptions("principal-1", [Subscription(id="sub-1", name="Sub 1", regions={})])
+        store.put_quotas("sub-1", "eastus", {"cores": quota})
+
+        assert store.get_subscriptions("principal-1") == [
+            Subscription(id="sub-1", name="Sub 1", regions={})
+        ]
+        assert store.get_subscriptions("principal-2") is None
+        assert store.get_quotas("sub-1", "eastus") == {"cores": quota}
+        assert store.get_quotas("sub-1", "westus") is None
+
+    def test_serves_vm_counts_counted_the_same_way(self, tmp_path: Path) -> None:
+        path = tmp_path / "inventory.sqlite3"
+        InventoryStore(path, count_method="compute/capacity").put_vm_counts(
+            {"sub-1": {"eastus": 2}}
+        )
+
+        exact = InventoryStore(path, timedelta(hours=1), count_method="compute/exact")
+        capacity = InventoryStore(path, timedelta(hours=1), count_method="compute/capacity")
+
+        assert exact.get_vm_counts(["sub-1"]) == {}
+        assert capacity.get_vm_counts(["sub-1"]) == {"sub-1": {"eastus": 2}}
+
+    def test_recreates_databases_with_another_schema(self, tmp_path: Path) -> None:
+        path = tmp_path / "inventory.sqlite3"
+        with closing(sqlite3.connect(path)) as connection:
+            connection.execute("CREATE TABLE vm_counts (subscription_id TEXT PRIMARY KEY)")
+        store = InventoryStore(path, timedelta(hours=1))
+
+        store.put_vm_counts({"sub-1": {"eastus": 2}})
+
+        assert store.get_vm_counts(["sub-1"]) == {"sub-1": {"eastus": 2}}
+
+    def test_zero_max_age_never_serves_entries(self, tmp_path: Path) -> None:
+        store = InventoryStore(tmp_path / "inventory.sqlite3")
+
+        store.put_vm_counts({"sub-1": {"eastus": 2}})
+
+        assert store.get_vm_counts(["sub-1"]) == {}
+
+
+class TestStoredInventory:
+    """Test that services serve fresh stored data and only fetch what is stale"""
+
+    def test_subscription_service_counts_only_stale_subscriptions(self, tmp_path: Path) -> None:
+        clock = FakeClock()
+        path = tmp_path / "inventory.sqlite3"
+        InventoryStore(path, clock=clock).put_vm_counts({"sub-1": {"eastus": 2}})
+        clock.now += 3600
+        InventoryStore(path, clock=clock).put_vm_counts({"sub-2": {"westus": 3}})
+        backend = RecordingInventoryBackend({"sub-1": {"eastus": 5}})
+        service = _subscription_service(InventoryStore(path, timedelta(minutes=30), clock), backend)
+        subscriptions = [
+            Subscription(id=sub_id, name=sub_id, regions={}) for sub_id in ["sub-1", "sub-2"]
+        ]
+
+        failures = service.get_subscriptions_vms(subscriptions)
+
+        assert failures == {}
+        assert backend.counted == ["sub-1"]
+        assert subscriptions[0].regions["eastus"].vm_count == 5
+        assert subscriptions[1].regions["westus"].vm_count == 3
+        # Freshly counted subscriptions are written back
+        assert InventoryStore(path, timedelta(minutes=30), clock).get_vm_counts(["sub-1"]) == {
+            "sub-1": {"eastus": 5}
+        }
+
+    def test_region_filtered_counts_are_served_from_but_not_written_to_the_store(
+        self, tmp_path: Path
+    ) -> None:
+        path = tmp_path / "inventory.sqlite3"
+        store = InventoryStore(path, timedelta(minutes=30))
+        store.put_vm_counts({"sub-1": {"eastus": 2, "westus": 4}})
+        backend = RecordingInventoryBackend({"sub-2": {"eastus": 1, "westus": 3}})
+        service = _subscription_service(store, backend)
+        subscriptions = [
+            Subscription(id=sub_id, name=sub_id, regions={}) for sub_id in ["sub-1", "sub-2"]
+        ]
+
+        failures = service.get_subscriptions_vms(subscriptions, regions=["westus"])
+
+        assert failures == {}
+        assert backend.counted == ["sub-2"]
+        assert subscriptions[0].regions["westus"].vm_count == 4
+        assert list(subscriptions[0].regions) == ["westus"]
+        assert list(subscriptions[1].regions) == ["westus"]
+        # Counts of some regions only would hide the others from later runs
+        assert store.get_vm_counts(["sub-2"]) == {}
+
+    def test_subscription_service_serves_stored_subscriptions(self, tmp_path: Path) -> None:
+        store = InventoryStore(tmp_path / "inventory.sqlite3", timedelta(minutes=30))
+        store.put_subscriptions("principal-1", [Subscription(id="sub-9", name="Sub 9", regions={})])
+
+        service = _subscription_service(store, RecordingInventoryBackend({}))
+
+        assert [sub.id for sub in service.get_subscriptions()] == ["sub-9"]
+
+    def test_quota_service_serves_stored_regions(self, tmp_path: Path) -> None:
+        store = InventoryStore(tmp_path / "inventory.sqlite3", timedelta(minutes=30))
+        quota = UsageQuotaLimit(name="cores", display_name="Cores", limit=100, usage=10)
+        store.put_quotas("stored-sub", "eastus", {"cores": quota})
+
+        def fail(_subscription_id: str) -> None:
+            raise AssertionError("quotas should be served from the store")
+
+        factory = SimpleNamespace(get_compute_client=fail, get_network_client=fail)
+        service = QuotaService(factory, inventory_store=store)  # type: ignore[arg-type]
+
+        assert service.get_quota_limits("stored-sub", "eastus") == {"cores": quota}
+
+    def test_async_quota_service_reads_the_store_off_the_event_loop(self, tmp_path: Path) -> None:
+        store = InventoryStore(tmp_path / "inventory.sqlite3", timedelta(minutes=30))
+        quota = UsageQuotaLimit(name="cores", display_name="Cores", limit=100, usage=10)
+        store.put_quotas("stored-sub", "eastus", {"cores": quota})
+        reading_threads: list[int] = []
+        get_quotas = store.get_quotas
+
+        def record_get_quotas(
+            subscription_id: str, region: str
+        ) -> dict[str, UsageQuotaLimit] | None:
+            reading_threads.append(threading.get_ident())
+            return get_quotas(subscription_id, region)
+
+        store.get_quotas = record_get_quotas  # type: ignore[method-assign]
+        service = AsyncQuotaService(SimpleNamespace(), inventory_store=store)  # type: ignore[arg-type]
+
+        assert asyncio.run(service.get_quota_limits_for_regions("stored-sub", ["eastus"])) == {
+            "eastus": {"cores": quota}
+        }
+        assert reading_threads
+        assert threading.get_ident() not in reading_threads
@@ -0,0 +1,401 @@
+import threading
+import time
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from azure.core.exceptions import HttpResponseError
+from azure.core.rest import HttpRequest
+from azure.mgmt.subscription.models import Location
+
+from preflight_check.core.models import Subscription
+from preflight_check.core.services import (
+    ComputeInventoryBackend,
+    SubscriptionService,
+    VmssCountStrategy,
+)
+
+
+def _scale_set(
+    name: str, location: str, capacity: int, instances: int, orchestration_mode: str = "Uniform"
+) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"/subscriptions/sub/resourceGroups/rg/providers/Microsoft.Compute/virtualMachineScaleSets/{name}",
+        name=name,
+        location=location,
+        sku=SimpleNamespace(capacity=capacity),
+        orchestration_mode=orchestration_mode,
+        instances=instances,
+    )
+
+
+class FakeComputeClient:
+    """Serves a fixed set of VMs and scale sets, and fails for subscriptions marked as broken"""
+
+    def __init__(
+        self, subscription_id: str, vm_locations: list[str], scale_sets: list[SimpleNamespace]
+    ) -> None:
+        self.virtual_machine_scale_sets = SimpleNamespace(
+            list_all=lambda: scale_sets,
+            list_by_location=lambda location: [
+                vmss for vmss in scale_sets if vmss.location.lower() == location
+            ],
+        )
+        self.virtual_machine_scale_set_vms = SimpleNamespace(list=self._list_scale_set_vms)
+        self.listed_scale_sets: list[str] = []
+        self.listed_vm_locations: list[str] = []
+        self.whole_vm_listings = 0
+        self._subscription_id = subscription_id
+        self._vm_locations = vm_locations
+        self._scale_sets = {vmss.name: vmss for vmss in scale_sets}
+
+    def list_vms(self) -> list[dict[str, str]]:
+        if self._subscription_id.startswith("broken"):
+            raise RuntimeError("access denied")
+        return [
+            {"id": f"{self._subscription_id}-vm-{index}", "location": location}
+            for index, location in enumerate(self._vm_locations)
+        ]
+
+    def list_vms_by_location(self, location: str) -> list[dict[str, str]]:
+        self.listed_vm_locations.append(location)
+        return [vm for vm in self.list_vms() if vm["location"].lower() == location]
+
+    def _list_scale_set_vms(self, resource_group_name: str, name: str) -> list[SimpleNamespace]:
+        assert resource_group_name == "rg"
+        self.listed_scale_sets.append(name)
+        return [SimpleNamespace() for _ in range(self._scale_sets[name].instances)]
+
+
+# Locations of every subscription, with their region type
+LOCATIONS = [
+    ("eastus", "Physical"),
+    ("westus", "Physical"),
+    ("centralus", "Physical"),
+    ("global", "Logical"),
+]
+
+
+class RequestsInFlight:
+    """Tracks the largest number of requests sent at once"""
+
+    def __init__(self) -> None:
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> None:
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        # Leaves the other workers time to send their requests
+        time.sleep(0.001)
+
+    def __exit__(self, *args: object) -> None:
+        with self._lock:
+            self.current -= 1
+
+
+class FakeArmClient:
+    """
+    Serves the raw VM listings of fake compute clients, two VMs per page, and the raw location
+    listings of subscriptions
+    """
+
+    page_size = 2
+
+    def __init__(
+        self,
+        compute_clients: dict[str, FakeComputeClient],
+        location_requests: list[str],
+        in_flight: RequestsInFlight,
+    ) -> None:
+        self._compute_clients = compute_clients
+        self._location_requests = location_requests
+        self._in_flight = in_flight
+
+    def format_url(self, path: str) -> str:
+        return f"https://management.azure.com{path}"
+
+    def send_request(self, request: HttpRequest) -> SimpleNamespace:
+        with self._in_flight:
+            return self._serve(request)
+
+    def _serve(self, request: HttpRequest) -> SimpleNamespace:
+        url = urlparse(request.url)
+        query = parse_qs(url.query)
+        parts = url.path.split("/")
+        if parts[3] == "locations":
+            # The API version of the subscription client has no region types
+            assert query["api-version"] == ["2022-12-01"]
+            self._location_requests.append(parts[2])
+            locations = {
+                "value": [
+                    {"name": name, "metadata": {"regionType": region_type}}
+                    for name, region_type in LOCATIONS
+                ]
+            }
+            return SimpleNamespace(status_code=200, json=lambda: locations)
+        assert query["api-version"] == ["2024-07-01"]
+        # /subscriptions/{id}/providers/Microsoft.Compute[/locations/{location}]/virtualMachines
+        compute_client = self._compute_clients[parts[2]]
+        vms = (
+            compute_client.list_vms_by_location(parts[6])
+            if parts[5] == "locations"
+            else compute_client.list_vms()
+        )
+        start = int(query.get("$skipToken", ["0"])[0])
+        if parts[5] != "locations" and start == 0:
+            compute_client.whole_vm_listings += 1
+        end = start + self.page_size
+        page = {
+            # Full VM models hold many more properties, which are not read
+            "value": [{**vm, "properties": {"hardwareProfile": {}}} for vm in vms[start:end]],
+            "nextLink": f"{url._replace(query='')}?api-version=2024-07-01&$skipToken={end}"
+            if end < len(vms)
+            else None,
+        }
+        return SimpleNamespace(status_code=200, json=lambda: page)
+
+
+class FakeAzureClientFactory:
+    def __init__(
+        self,
+        vm_locations: dict[str, list[str]],
+        scale_sets: dict[str, list[SimpleNamespace]] | None = None,
+    ) -> None:
+        self._compute_clients = {
+            sub_id: FakeComputeClient(sub_id, locations, (scale_sets or {}).get(sub_id, []))
+            for sub_id, locations in vm_locations.items()
+        }
+        self.subscription_requests: list[str] = []
+        self.location_requests: list[str] = []
+        self.in_flight = RequestsInFlight()
+        # Locations of the subscriptions that don't have every location
+        self.subscription_locations: dict[str, list[str]] = {}
+
+    def get_subscription_client(self) -> SimpleNamespace:
+        subscriptions = [
+            SimpleNamespace(subscription_id=sub_id, display_name=sub_id)
+            for sub_id in self._compute_clients
+        ]
+
+        def list_subscriptions() -> list[SimpleNamespace]:
+            self.subscription_requests.append("list")
+            return subscriptions
+
+        def get_subscription(subscription_id: str) -> SimpleNamespace:
+            self.subscription_requests.append(f"get {subscription_id}")
+            if subscription_id not in self._compute_clients:
+                error = HttpResponseError(message=f"Subscription {subscription_id} not found")
+                error.status_code = 404
+                raise error
+            return SimpleNamespace(subscription_id=subscription_id, display_name=subscription_id)
+
+        def list_locations(subscription_id: str) -> list[Location]:
+            self.subscription_requests.append(f"list_locations {subscription_id}")
+            # Deserialized like the SDK does, which has no region types
+            return [
+                Location.deserialize({"name": name, "metadata": {"regionType": region_type}})
+                for name, region_type in LOCATIONS
+                if name in self.subscription_locations.get(subscription_id, [name])
+            ]
+
+        return SimpleNamespace(
+            subscriptions=SimpleNamespace(
+                list=list_subscriptions, get=get_subscription, list_locations=list_locations
+            )
+        )
+
+    def get_compute_client(self, subscription_id: str) -> FakeComputeClient:
+        return self._compute_clients[subscription_id]
+
+    def get_arm_client(self) -> FakeArmClient:
+        return FakeArmClient(self._compute_clients, self.location_requests, self.in_flight)
+
+
+def _vm_counts(subscription: Subscription) -> dict[str, int]:
+    return {name: region.vm_count for name, region in subscription.regions.items()}
+
+
+class TestGetSubscriptions:
+    """Test listing every subscription and fetching named ones"""
+
+    vm_locations: dict[str, list[str]] = {"sub-1": [], "sub-2": [], "sub-3": []}
+
+    def test_fetches_named_subscriptions_without_listing_the_tenant(self) -> None:
+        factory = FakeAzureClientFactory(self.vm_locations)
+        service = SubscriptionService(factory, concurrency=4)  # type: ignore[arg-type]
+
+        subscriptions = service.get_subscriptions_by_id(["sub-1", "sub-3", "sub-1", "missing"])
+
+        assert list(subscriptions) == ["sub-1", "sub-3"]
+        assert service.get_subscription("sub-3") is subscriptions["sub-3"]
+        with pytest.raises(ValueError, match="missing not found"):
+            service.get_subscription("missing")
+        # Known and missing subscriptions are not fetched again
+        assert sorted(factory.subscription_requests) == ["get missing", "get sub-1", "get sub-3"]
+
+    def test_listing_keeps_fetched_subscriptions(self) -> None:
+        factory = FakeAzureClientFactory(self.vm_locations)
+        service = SubscriptionService(factory)  # type: ignore[arg-type]
+        fetched = service.get_subscription("sub-2")
+
+        listed = service.get_subscriptions()
+        service.get_subscription("sub-1")
+
+        assert [sub.id for sub in listed] == ["sub-1", "sub-2", "sub-3"]
+        assert listed[1] is fetched
+        assert factory.subscription_requests == ["get sub-2", "list"]
+
+    def test_gets_the_location_names_of_a_subscription(self) -> None:
+        service = SubscriptionService(FakeAzureClientFactory(self.vm_locations))  # type: ignore[arg-type]
+
+        assert service.get_location_names("sub-1") == {"eastus", "westus", "centralus", "global"}
+
+    def test_keeps_the_regions_available_to_each_subscription(self) -> None:
+        factory = FakeAzureClientFactory(self.vm_locations)
+        factory.subscription_locations = {"sub-2": ["westus"], "sub-3": []}
+        service = SubscriptionService(factory, concurrency=4)  # type: ignore[arg-type]
+
+        regions = service.get_available_regions(["sub-1", "sub-2", "sub-3"], ["westus", "eastus"])
+
+        assert regions == {"sub-1": ["westus", "eastus"], "sub-2": ["westus"], "sub-3": []}
+
+
+class TestGetSubscriptionsVms:
+    """Test parallel VM enumeration across subscriptions"""
+
+    vm_locations = {
+        "sub-1": ["eastus", "EastUS", "westus"],
+        "sub-2": ["westus"],
+        "broken-1": ["eastus"],
+        "broken-2": ["eastus"],
+    }
+
+    def test_counts_each_subscription_and_reports_failures_separately(self) -> None:
+        service = SubscriptionService(
+            FakeAzureClientFactory(self.vm_locations),  # type: ignore[arg-type]
+            concurrency=4,
+        )
+        subscriptions = [
+            Subscription(id=sub_id, name=sub_id, regions={}) for sub_id in self.vm_locations
+        ]
+
+        failures = service.get_subscriptions_vms(subscriptions)
+
+        assert set(failures) == {"broken-1", "broken-2"}
+        assert all("access denied" in str(error) for error in failures.values())
+        counts = {sub.id: _vm_counts(sub) for sub in subscriptions}
+        assert counts["sub-1"] == {"eastus": 2, "westus": 1}
+        assert counts["sub-2"] == {"westus": 1}
+        assert counts["broken-1"] == {}
+
+    def test_lists_large_subscriptions_one_location_at_a_time(self) -> None:
+        factory = FakeAzureClientFactory(
+            {"sub-1": ["eastus", "EastUS", "westus", "westus"], "sub-2": ["westus"]},
+            {"sub-1": [_scale_set("aks-pool", "westus", capacity=3, instances=3)]},
+        )
+        backend = ComputeInventoryBackend(
+            factory,  # type: ignore[arg-type]
+            concurrency=4,
+            shard_threshold=3,
+        )
+
+        result = backend.count_vms(["sub-1", "sub-2"])
+
+        assert result.errors == {}
+        # The VMs listed before the threshold was reached are counted once
+        assert result.vm_counts == {"sub-1": {"eastus": 2, "westus": 5}, "sub-2": {"westus": 1}}
+        # Only sub-1 has enough VMs to be sharded, and only its VMs; logical locations hold no
+        # resources and are skipped
+        assert factory.location_requests == ["sub-1"]
+        listed = factory.get_compute_client("sub-1").listed_vm_locations
+        assert sorted(listed) == ["centralus", "eastus", "westus"]
+        assert factory.get_compute_client("sub-2").listed_vm_locations == []
+
+    def test_lists_subscriptions_sharded_before_one_location_at_a_time_only(self) -> None:
+        factory = FakeAzureClientFactory({"sub-1": ["eastus", "EastUS", "westus", "westus"]})
+        backend = ComputeInventoryBackend(factory, shard_threshold=3)  # type: ignore[arg-type]
+
+        first = backend.count_vms(["sub-1"])
+        second = backend.count_vms(["sub-1"])
+
+        assert first.vm_counts == second.vm_counts == {"sub-1": {"eastus": 2, "westus": 2}}
+        # The whole subscription is only listed until it is found to reach the threshold
+        assert factory.get_compute_client("sub-1").whole_vm_listings == 1
+        assert factory.location_requests == ["sub-1", "sub-1"]
+
+    def test_never_lists_more_than_the_concurrency_at_once(self) -> None:
+        vm_locations = {f"sub-{index}": ["eastus", "westus", "centralus"] for index in range(6)}
+        factory = FakeAzureClientFactory(vm_locations)
+        backend = ComputeInventoryBackend(
+            factory,  # type: ignore[arg-type]
+            concurrency=3,
+            # Reached on the last page, which leaves no page being fetched ahead
+            shard_threshold=3,
+        )
+
+        result = backend.count_vms(list(vm_locations))
+
+        assert result.errors == {}
+        assert all(
+            counts == {"eastus": 1, "westus": 1, "centralus": 1}
+            for counts in result.vm_counts.values()
+        )
+        # Every subscription is sharded, and its locations listed in the same pool of workers
+        assert sorted(factory.location_requests) == sorted(vm_locations)
+        assert factory.in_flight.peak <= 3
+
+
+class TestVmssCountStrategy:
+    """Test counting scale set instances by capacity and by listing each instance"""
+
+    scale_sets = [
+        _scale_set("aks-pool-1", "eastus", capacity=3, instances=2),
+        _scale_set("aks-pool-2", "WestUS", capacity=5, instances=5),
+        # Flexible scale set VMs are listed as regular VMs
+        _scale_set("flex", "eastus", capacity=4, instances=4, orchestration_mode="Flexible"),
+    ]
+
+    @pytest.mark.parametrize(
+        ("strategy", "expected_counts", "expected_listed"),
+        [
+            (VmssCountStrategy.CAPACITY, {"eastus": 4, "westus": 5}, []),
+            (VmssCountStrategy.EXACT, {"eastus": 3, "westus": 5}, ["aks-pool-1", "aks-pool-2"]),
+        ],
+    )
+    def test_count_scale_set_instances(
+        self,
+        strategy: VmssCountStrategy,
+        expected_counts: dict[str, int],
+        expected_listed: list[str],
+    ) -> None:
+        factory = FakeAzureClientFactory({"sub-1": ["eastus"]}, {"sub-1": self.scale_sets})
+        service = SubscriptionService(
+            factory,  # type: ignore[arg-type]
+            vmss_count_strategy=strategy,
+        )
+        subscription = Subscription(id="sub-1", name="sub-1", regions={})
+
+        service.get_subscription_vms(subscription)
+
+        assert _vm_counts(subscription) == expected_counts
+        listed = factory.get_compute_client("sub-1").listed_scale_sets
+        assert sorted(listed) == expected_listed
+
+    def test_only_lists_scale_sets_in_the_requested_regions(self) -> None:
+        factory = FakeAzureClientFactory(
+            {"sub-1": ["eastus", "westus", "northeurope"]}, {"sub-1": self.scale_sets}
+        )
+        service = SubscriptionService(
+            factory,  # type: ignore[arg-type]
+            vmss_count_strategy=VmssCountStrategy.EXACT,
+        )
+        subscription = Subscription(id="sub-1", name="sub-1", regions={})
+
+        failures = service.get_subscriptions_vms([subscription], regions=["EastUS "])
+
+        assert failures == {}
+        assert _vm_counts(subscription) == {"eastus": 3}
+        assert factory.get_compute_client("sub-1").listed_scale_sets == ["aks-pool-1"]
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+from azure.core.pipeline import Pipeline
+from azure.core.pipeline.policies import RetryPolicy
+from azure.core.pipeline.transport import HttpRequest, RequestsTransport
+
+from preflight_check.core.services import InstrumentedCredential, Telemetry, ThrottlingScheduler
+from preflight_check.core.services.policies import TelemetryPolicy, ThrottlingPolicy
+from preflight_check.core.services.telemetry import GET_TOKEN_OPERATION, NO_PHASE, get_operation
+
+from .conftest import FakeArmServer, FakeClock
+
+
+@pytest.mark.parametrize(
+    ("method", "url", "operation", "is_collection"),
+    [
+        (
+            "GET",
+            "https://management.azure.com/subscriptions/sub-1/providers/Microsoft.Compute/virtualMachines?api-version=2024-07-01",
+            "GET Microsoft.Compute/virtualMachines",
+            True,
+        ),
+        (
+            "GET",
+            "https://management.azure.com/subscriptions/sub-1/resourceGroups/rg-1/providers/Microsoft.Compute/virtualMachineScaleSets/vmss-1/virtualMachines",
+            "GET Microsoft.Compute/virtualMachineScaleSets/virtualMachines",
+            True,
+        ),
+        (
+            "GET",
+            "https://management.azure.com/subscriptions/sub-1/providers/Microsoft.Authorization/roleDefinitions/role-1",
+            "GET Microsoft.Authorization/roleDefinitions",
+            False,
+        ),
+        (
+            "GET",
+            "https://management.azure.com/providers/Microsoft.Management/managementGroups/tenant-1/providers/Microsoft.Authorization/roleAssignments",
+            "GET Microsoft.Authorization/roleAssignments",
+            True,
+        ),
+        ("GET", "https://management.azure.com/subscriptions", "GET subscriptions", True),
+    ],
+)
+def test_names_operations_after_resource_types(
+    method: str, url: str, operation: str, is_collection: bool
+) -> None:
+    assert get_operation(method, url) == (operation, is_collection)
+
+
+class TestTelemetry:
+    """Test phase timing and call recording"""
+
+    def test_attributes_calls_to_the_innermost_running_phase(self) -> None:
+        clock = FakeClock()
+        telemetry = Telemetry(clock=clock)
+
+        telemetry.record_call("GET subscriptions", 0.01, page=True, size=100)
+        with telemetry.phase("outer"):
+            clock.now += 1
+            with telemetry.phase("inner"):
+                telemetry.record_call("GET things", 0.2, size=10)
+                telemetry.record_call("GET things", 3.0, error=True)
+                clock.now += 2
+            telemetry.record_call("GET things", 0.04)
+
+        summary = telemetry.summary()
+
+        assert list(summary) == [NO_PHASE, "outer", "inner"]
+        assert summary["outer"]["duration_ms"] == 3000.0
+        assert summary["inner"]["duration_ms"] == 2000.0
+        assert summary["inner"]["operations"]["GET things"] == {
+            "calls": 2,
+            "errors": 1,
+            "pages": 0,
+            "bytes": 10,
+            "total_ms": 3200.0,
+            "mean_ms": 1600.0,
+            "max_ms": 3000.0,
+            "latency_histogram_ms": {"<=250": 1, "<=5000": 1},
+        }
+        assert summary["outer"]["operations"]["GET things"]["calls"] == 1
+        assert summary[NO_PHASE]["operations"]["GET subscriptions"]["pages"] == 1
+
+    def test_records_every_attempt_sent_through_the_pipeline(
+        self, arm_server: FakeArmServer
+    ) -> None:
+        telemetry = Telemetry()
+        pipeline = Pipeline(
+            RequestsTransport(),
+            [
+                RetryPolicy(retry_backoff_factor=0),
+                ThrottlingPolicy(ThrottlingScheduler()),
+                TelemetryPolicy(telemetry),
+            ],
+        )
+
+        with telemetry.phase("vm_enumeration"), pipeline:
+            pipeline.run(
+                HttpRequest(
+                    "GET",
+                    f"{arm_server.url}/subscriptions/sub-1/providers/Microsoft.Compute/virtualMachines",
+                )
+            )
+
+        operation = telemetry.summary()["vm_enumeration"]["operations"][
+            "GET Microsoft.Compute/virtualMachines"
+        ]
+        assert (operation["calls"], operation["errors"], operation["pages"]) == (3, 2, 1)
+        assert operation["bytes"] == 6
+
+    def test_records_access_token_requests(self) -> None:
+        telemetry = Telemetry()
+        credential = InstrumentedCredential(
+            SimpleNamespace(  # type: ignore[arg-type]
+                get_token=lambda *_scopes, **_kwargs: SimpleNamespace(token="token", expires_on=0)
+            ),
+            telemetry,
+        )
+
+        with telemetry.phase("identity"):
+            credential.get_token("https://management.azure.com/.default")
+            token_info = credential.get_token_info("https://management.azure.com/.default")
+
+        assert token_info.token == "token"
+        operations = telemetry.summary()["identity"]["operations"]
+        assert operations[GET_TOKEN_OPERATION]["calls"] == 2
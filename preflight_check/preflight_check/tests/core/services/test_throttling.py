@@ -0,0 +1,185 @@
+import asyncio
+import random
+
+import pytest
+from azure.core.pipeline import AsyncPipeline, Pipeline
+from azure.core.pipeline.policies import AsyncRetryPolicy, RetryPolicy
+from azure.core.pipeline.transport import AioHttpTransport, HttpRequest, RequestsTransport
+
+from preflight_check.core.services import (
+    AzureClientFactory,
+    Identity,
+    ReplayCredential,
+    ThrottlingScheduler,
+    TrafficReplay,
+)
+from preflight_check.core.services.policies import AsyncThrottlingPolicy, ThrottlingPolicy
+from preflight_check.core.services.throttling import TENANT_KEY
+from preflight_check.core.services.traffic import Exchange
+
+from .conftest import FakeArmServer, FakeClock
+
+
+class TestThrottlingPolicy:
+    """Test throttled requests against a fake Azure Resource Manager"""
+
+    def test_retries_throttled_requests_and_halves_the_subscription_limit(
+        self, arm_server: FakeArmServer
+    ) -> None:
+        scheduler = ThrottlingScheduler(subscription_concurrency=16)
+        pipeline = Pipeline(
+            RequestsTransport(),
+            [RetryPolicy(retry_backoff_factor=0), ThrottlingPolicy(scheduler)],
+        )
+
+        with pipeline:
+            response = pipeline.run(
+                HttpRequest("GET", f"{arm_server.url}/subscriptions/SUB-1/providers")
+            )
+
+        assert response.http_response.status_code == 200
+        assert arm_server.requests == {"/subscriptions/SUB-1/providers": 3}
+        stats = scheduler.stats
+        assert (stats.requests, stats.throttles, stats.retries) == (3, 2, 2)
+        # Halved twice; the low remaining budget keeps it from growing again
+        assert scheduler.limit("sub-1") == 4
+        assert scheduler.limit(TENANT_KEY) == 64
+
+    def test_async_policy_shares_the_scheduler(self, arm_server: FakeArmServer) -> None:
+        scheduler = ThrottlingScheduler(subscription_concurrency=16)
+
+        async def run() -> int:
+            pipeline = AsyncPipeline(
+                AioHttpTransport(),
+                [AsyncRetryPolicy(retry_backoff_factor=0), AsyncThrottlingPolicy(scheduler)],
+            )
+            async with pipeline:
+                responses = await asyncio.gather(
+                    *(
+                        pipeline.run(
+                            HttpRequest("GET", f"{arm_server.url}/subscriptions/sub-1/{name}")
+                        )
+                        for name in ["vms", "disks"]
+                    )
+                )
+            return sum(response.http_response.status_code == 200 for response in responses)
+
+        assert asyncio.run(run()) == 2
+        assert scheduler.stats.throttles == 4
+        assert scheduler.stats.retries == 4
+        assert scheduler.limit("sub-1") == 1
+
+
+class TestThrottlingScheduler:
+    """Test the adaptive concurrency limits"""
+
+    def test_limits_requests_in_flight_per_subscription_and_tenant(self) -> None:
+        scheduler = ThrottlingScheduler(subscription_concurrency=2, tenant_concurrency=3)
+
+        assert scheduler.try_acquire([TENANT_KEY, "sub-1"]) is None
+        assert scheduler.try_acquire([TENANT_KEY, "sub-1"]) is None
+        assert scheduler.try_acquire([TENANT_KEY, "sub-1"]) == 0.0
+        assert scheduler.try_acquire([TENANT_KEY, "sub-2"]) is None
+        assert scheduler.try_acquire([TENANT_KEY, "sub-2"]) == 0.0
+
+        scheduler.release([TENANT_KEY, "sub-1"], 200, {})
+
+        assert scheduler.try_acquire([TENANT_KEY, "sub-2"]) is None
+
+    def test_pauses_throttled_subscriptions_for_the_jittered_retry_after(self) -> None:
+        clock = FakeClock()
+        scheduler = ThrottlingScheduler(clock=clock, rng=random.Random(1))
+        keys = scheduler.keys_for_url("https://management.azure.com/subscriptions/sub-1/x")
+
+        scheduler.acquire(keys)
+        scheduler.release(keys, 429, {"retry-after": "10"})
+
+        delay = scheduler.try_acquire(keys)
+        assert delay is not None
+        assert 10 <= delay <= 12
+        # Other subscriptions are not paused
+        assert scheduler.try_acquire([TENANT_KEY, "sub-2"]) is None
+        clock.now += delay
+        assert scheduler.try_acquire(keys, retry=True) is None
+        assert scheduler.stats.retries == 1
+        assert scheduler.stats.backoff_seconds == pytest.approx(delay)
+
+    def test_backs_off_exponentially_without_retry_after(self) -> None:
+        clock = FakeClock()
+        scheduler = ThrottlingScheduler(clock=clock, rng=random.Random(1))
+        keys = [TENANT_KEY]
+
+        for attempt in range(1, 4):
+            clock.now += 100
+            scheduler.acquire(keys)
+            scheduler.release(keys, 429, {})
+            delay = scheduler.try_acquire(keys)
+            assert delay is not None
+            assert 0 < delay <= 2**attempt
+
+    def test_grows_limits_while_budget_remains(self) -> None:
+        scheduler = ThrottlingScheduler(subscription_concurrency=4, low_watermark=50)
+        keys = [TENANT_KEY, "sub-1"]
+        scheduler.acquire(keys)
+        scheduler.release(keys, 429, {"retry-after": "0"})
+        assert scheduler.limit("sub-1") == 2
+
+        for _ in range(2):
+            scheduler.acquire(keys)
+            scheduler.release(
+                keys,
+                200,
+                {"x-ms-ratelimit-remaining-resource": "Microsoft.Compute/GetVM3Min;30"},
+            )
+        assert scheduler.limit("sub-1") == 2
+
+        for _ in range(3):
+            scheduler.acquire(keys)
+            scheduler.release(keys, 200, {"x-ms-ratelimit-remaining-subscription-reads": "900"})
+        assert scheduler.limit("sub-1") == 3
+
+
+class ThrottledTraffic(TrafficReplay):
+    """Throttles the first attempt of every request, and answers the others with empty lists"""
+
+    def __init__(self) -> None:
+        self.latency = 0
+        self.requests: list[str] = []
+
+    def respond(self, method: str, url: str, body: str) -> Exchange:
+        self.requests.append(url)
+        throttled = self.requests.count(url) == 1
+        return Exchange(
+            method=method,
+            url=url,
+            body=body,
+            status_code=429 if throttled else 200,
+            headers={
+                "Retry-After": "0",
+                "x-ms-ratelimit-remaining-subscription-reads": "0" if throttled else "10",
+            },
+            content='{"value": []}',
+            seconds=0,
+        )
+
+
+class TestAzureClientFactoryThrottling:
+    """Test that management clients go through the factory's scheduler"""
+
+    def test_schedules_every_attempt_of_the_management_clients(self) -> None:
+        scheduler = ThrottlingScheduler(subscription_concurrency=16)
+        traffic = ThrottledTraffic()
+        factory = AzureClientFactory(
+            ReplayCredential(Identity(principal_id="principal-1", tenant_id="tenant-1")),  # type: ignore[arg-type]
+            throttling=scheduler,
+            traffic=traffic,
+        )
+
+        scale_sets = factory.get_compute_client("sub-1").virtual_machine_scale_sets.list_all()
+
+        assert list(scale_sets) == []
+        assert len(traffic.requests) == 2
+        # The scheduler comes after the retry policy, so the retry goes through it too
+        stats = scheduler.stats
+        assert (stats.requests, stats.throttles, stats.retries) == (2, 1, 1)
+        assert scheduler.limit("sub-1") == 8
@@ -0,0 +1,87 @@
+import base64
+import json
+from pathlib import Path
+
+import pytest
+import requests
+from azure.core.pipeline import Pipeline
+from azure.core.pipeline.policies import RetryPolicy
+from azure.core.pipeline.transport import HttpRequest, RequestsTransport
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from preflight_check.core.services import (
+    Identity,
+    ReplayCredential,
+    TokenClaimsIdentityResolver,
+    TrafficRecorder,
+    TrafficReplay,
+)
+
+from .conftest import FakeArmServer
+
+IDENTITY = Identity(principal_id="principal-1", tenant_id="tenant-1")
+
+
+def _access_token(identity: Identity) -> str:
+    claims = {"oid": identity.principal_id, "tid": identity.tenant_id}
+    return f"header.{base64.urlsafe_b64encode(json.dumps(claims).encode()).decode()}.signature"
+
+
+def _send(adapter: BaseAdapter, url: str) -> tuple[int, str, str | None]:
+    """Send a GET request through the adapter with the Azure SDK retry policy"""
+    session = requests.Session()
+    session.mount("http://", adapter)
+    pipeline = Pipeline(
+        RequestsTransport(session=session, session_owner=False),
+        [RetryPolicy(retry_backoff_factor=0)],
+    )
+    request = HttpRequest(
+        "GET", url, headers={"Authorization": f"Bearer {_access_token(IDENTITY)}"}
+    )
+    with pipeline:
+        response = pipeline.run(request).http_response
+    return (
+        response.status_code,
+        response.text(),
+        response.headers.get("x-ms-ratelimit-remaining-subscription-reads"),
+    )
+
+
+class TestTraffic:
+    """Test recording Azure traffic and replaying it offline"""
+
+    def test_replays_recorded_responses_without_sending_requests(
+        self, arm_server: FakeArmServer, tmp_path: Path
+    ) -> None:
+        url = f"{arm_server.url}/subscriptions/sub-1/providers/Microsoft.Compute/virtualMachines"
+        recorder = TrafficRecorder(tmp_path)
+        recorded = _send(recorder.wrap_adapter(HTTPAdapter()), url)
+        recorder.close()
+
+        replay = TrafficReplay(tmp_path, latency=0)
+        replayed = _send(replay.wrap_adapter(HTTPAdapter()), url)
+
+        assert recorded == replayed == (200, "{}", "10")
+        # Both throttled attempts and the successful one were sent once, while recording
+        assert arm_server.requests == {
+            "/subscriptions/sub-1/providers/Microsoft.Compute/virtualMachines": 3
+        }
+        assert replay.identity == IDENTITY
+        # Access tokens are not recorded
+        assert "signature" not in (tmp_path / "traffic.jsonl").read_text()
+
+    def test_rejects_requests_that_were_not_recorded(
+        self, arm_server: FakeArmServer, tmp_path: Path
+    ) -> None:
+        recorder = TrafficRecorder(tmp_path)
+        _send(recorder.wrap_adapter(HTTPAdapter()), f"{arm_server.url}/subscriptions")
+        recorder.close()
+
+        replay = TrafficReplay(tmp_path, latency=0)
+        with pytest.raises(RuntimeError, match="No response was recorded for GET"):
+            _send(replay.wrap_adapter(HTTPAdapter()), f"{arm_server.url}/tenants")
+
+    def test_replay_credential_authenticates_as_the_recorded_identity(self) -> None:
+        resolver = TokenClaimsIdentityResolver(ReplayCredential(IDENTITY))  # type: ignore[arg-type]
+
+        assert resolver.resolve() == IDENTITY
@@ -1,6 +1,15 @@
+from dataclasses import replace
+
 import pytest
 
-from preflight_check.core.auth_check import RequiredPermissionCheck
+from preflight_check.core.auth_check import (
+    MonitoredSubscriptionAuthCheck,
+    PermissionMatrix,
+    RequiredPermissionCheck,
+    RoleAssignmentKey,
+    ScanningSubscriptionAuthCheck,
+)
+from preflight_check.core.models import Subscription
 from preflight_check.core.models.auth import AssignedRole, Principal, RolePermissions
 
 
@@ -88,3 +97,72 @@ class TestRequiredPermissionCheck:
                 assert check.satisfying_role.id == satisfying_role_id
         else:
             assert check.satisfying_role is None
+
+
+class TestPermissionMatrix:
+    """Test batch evaluation of required permissions"""
+
+    roles = TestRequiredPermissionCheck.assigned_roles
+
+    def test_matches_individual_checks(self) -> None:
+        subscription = Subscription(id="sub-1", name="sub-1", regions={})
+        auth_check = ScanningSubscriptionAuthCheck(subscription, self.roles)
+
+        assert len(auth_check.checked_permissions) == len(auth_check.required_permissions)
+        for check in auth_check.checked_permissions:
+            expected = RequiredPermissionCheck(check.required_permission, self.roles)
+            assert check.satisfying_role is expected.satisfying_role
+            assert check.is_granted == expected.is_granted
+        assert "Microsoft.Storage/storageAccounts/listkeys/action" in [
+            check.required_permission for check in auth_check.missing_permissions
+        ]
+
+    def test_prefers_earlier_roles(self) -> None:
+        matrix = PermissionMatrix(
+            [
+                "Microsoft.Storage/storageAccounts/read",
+                "Microsoft.Storage/storageAccounts/read",
+                "Microsoft.Compute/virtualMachines/read",
+            ],
+            self.roles,
+        )
+
+        assert matrix.satisfying_role("Microsoft.Storage/storageAccounts/read") is self.roles[1]
+        assert matrix.satisfying_role("Microsoft.Compute/virtualMachines/read") is self.roles[2]
+
+    def test_shares_matrix_between_subscriptions_with_same_assignments(self) -> None:
+        permission_matrices: dict[tuple[RoleAssignmentKey, ...], PermissionMatrix] = {}
+        checks = [
+            MonitoredSubscriptionAuthCheck(
+                Subscription(id=sub_id, name=sub_id, regions={}), roles, permission_matrices
+            )
+            for sub_id, roles in [
+                ("sub-1", self.roles),
+                ("sub-2", list(self.roles)),
+                ("sub-3", self.roles[:1]),
+            ]
+        ]
+
+        assert len(permission_matrices) == 2
+        assert [check.success for check in checks] == [False, False, False]
+        assert checks[1].checked_permissions[-1].satisfying_role is self.roles[2]
+        assert checks[2].checked_permissions[-1].satisfying_role is None
+
+    def test_shares_inherited_matrix_between_subscriptions_with_own_assignments(self) -> None:
+        permission_matrices: dict[tuple[RoleAssignmentKey, ...], PermissionMatrix] = {}
+        checks = [
+            MonitoredSubscriptionAuthCheck(
+                Subscription(id=sub_id, name=sub_id, regions={}),
+                [*self.roles[:2], replace(self.roles[2], scope=f"/subscriptions/{sub_id}")],
+                permission_matrices,
+            )
+            for sub_id in ["sub-1", "sub-2"]
+        ]
+
+        assert list(permission_matrices) == [
+            tuple((role.id, "*", role.principal.id, None) for role in self.roles[:2])
+        ]
+        for check, sub_id in zip(checks, ["sub-1", "sub-2"], strict=True):
+            satisfying_role = check.checked_permissions[-1].satisfying_role
+            assert satisfying_role is not None
+            assert satisfying_role.scope == f"/subscriptions/{sub_id}"
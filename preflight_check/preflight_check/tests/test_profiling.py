@@ -0,0 +1,51 @@
+import pstats
+import threading
+import time
+from pathlib import Path
+
+from preflight_check.profiling import SamplingProfiler, profile
+
+
+def _wait_in_worker(stopped: threading.Event) -> None:
+    stopped.wait()
+
+
+def _busy_loop(seconds: float) -> int:
+    deadline = time.perf_counter() + seconds
+    iterations = 0
+    while time.perf_counter() < deadline:
+        iterations += 1
+    return iterations
+
+
+class TestProfiling:
+    """Test the profiles written by --profile"""
+
+    def test_samples_every_thread(self) -> None:
+        stopped = threading.Event()
+        worker = threading.Thread(target=_wait_in_worker, args=(stopped,), name="worker_1")
+        worker.start()
+        sampler = SamplingProfiler()
+        try:
+            sampler.sample()
+        finally:
+            stopped.set()
+            worker.join()
+
+        stacks = list(sampler.samples)
+        worker_stacks = [stack for stack in stacks if stack.startswith("worker;")]
+        assert len(worker_stacks) == 1
+        assert "test_profiling:_wait_in_worker;threading:Event.wait" in worker_stacks[0]
+        # The thread taking the sample is the profiler's own, and is left out
+        assert not any(stack.startswith("MainThread;") for stack in stacks)
+
+    def test_writes_cprofile_and_collapsed_stacks(self, tmp_path: Path) -> None:
+        with profile(tmp_path / "profile", interval=0.001):
+            _busy_loop(0.05)
+
+        profiled = pstats.Stats(str(tmp_path / "profile.prof")).get_stats_profile()
+        assert "_busy_loop" in profiled.func_profiles
+        lines = (tmp_path / "profile.collapsed").read_text().splitlines()
+        assert lines
+        assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+        assert any("test_profiling:_busy_loop" in line for line in lines)
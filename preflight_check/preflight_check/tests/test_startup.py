@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Time that --help or a rejected argument may take, including interpreter startup; importing the
+# Azure SDK and msgraph alone takes several times this
+STARTUP_BUDGET_SECONDS = 2.0
+# Packages that must only be imported once Azure is called
+HEAVY_PACKAGES = ("azure.identity", "azure.mgmt", "msgraph")
+
+# Runs the CLI with the given arguments, then reports which heavy packages were imported
+_RUN_CLI = f"""
+import json, sys
+import typer
+from preflight_check.app import main
+try:
+    typer.run(main)
+finally:
+    loaded = sorted(m for m in sys.modules if m.startswith({HEAVY_PACKAGES!r}))
+    sys.stderr.write("\\nLOADED=" + json.dumps(loaded))
+"""
+
+
+def _run_cli(*args: str) -> tuple[subprocess.CompletedProcess[str], float]:
+    project_root = Path(__file__).parents[2]
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", _RUN_CLI, *args],
+        capture_output=True,
+        text=True,
+        cwd=project_root,
+        env={**os.environ, "PYTHONPATH": str(project_root)},
+        check=False,
+    )
+    return result, time.perf_counter() - start
+
+
+class TestStartup:
+    """Test that commands that don't call Azure start without loading the Azure SDK"""
+
+    @pytest.mark.parametrize(
+        ("args", "expected_exit_code"),
+        [(["--help"], 0), (["--concurrency", "0"], 2)],
+    )
+    def test_does_not_load_azure_sdk(self, args: list[str], expected_exit_code: int) -> None:
+        result, elapsed = _run_cli(*args)
+
+        assert result.returncode == expected_exit_code, result.stderr
+        loaded = json.loads(result.stderr.rsplit("LOADED=", 1)[1])
+        assert loaded == []
+        assert elapsed < STARTUP_BUDGET_SECONDS